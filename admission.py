@@ -0,0 +1,142 @@
+# Admission control for the MCP server: at most MCP_MAX_CONCURRENCY turns run at once, the rest wait in a
+# bounded queue that is served round-robin across sessions, and requests that can't be served in time are
+# shed with 503 + Retry-After instead of piling up (each worker process has its own limiter)
+import asyncio
+# Per-session FIFO queues in round-robin order
+from collections import OrderedDict, deque
+# Type hints for better readability
+from typing import Any, Deque, Dict
+# Configuration from the environment, Retry-After rounding
+import math
+import os
+
+# Turns running at once (0 disables admission control)
+MAX_CONCURRENCY = int(os.getenv("MCP_MAX_CONCURRENCY", "32"))
+# Requests allowed to wait for a slot, over all sessions
+ADMISSION_QUEUE = int(os.getenv("MCP_ADMISSION_QUEUE", "128"))
+# Longest time a request may wait for a slot (seconds) before it is shed
+ADMISSION_TIMEOUT = float(os.getenv("MCP_ADMISSION_TIMEOUT", "2.0"))
+# Requests one session may have running or waiting at once
+ADMISSION_PER_SESSION = int(os.getenv("MCP_ADMISSION_PER_SESSION", "8"))
+
+# Raised when a request is shed; reason is "queue_full", "session_limit" or "timeout"
+class Overloaded(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Server overloaded ({reason}), retry in {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int = MAX_CONCURRENCY, max_queue: int = ADMISSION_QUEUE,
+                 queue_timeout: float = ADMISSION_TIMEOUT, per_session: int = ADMISSION_PER_SESSION):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.per_session = per_session
+        self.in_flight = 0
+        self.queued = 0
+        # session_id → waiters (futures resolved when a slot is handed over); sessions take turns in dict order
+        self._waiting: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        # session_id → requests running or waiting
+        self._sessions: Dict[str, int] = {}
+        self.admitted = 0
+        self.shed = {"queue_full": 0, "session_limit": 0, "timeout": 0}
+        # Moving average of how long an admitted turn holds its slot (for Retry-After)
+        self._service_time = 0.1
+
+    # Wait for a turn slot (raises Overloaded if the request is shed); pair with release()
+    async def acquire(self, session_id: str) -> None:
+        if self.max_concurrent <= 0:
+            self._sessions[session_id] = self._sessions.get(session_id, 0) + 1
+            return
+        if self._sessions.get(session_id, 0) >= self.per_session:
+            self._shed("session_limit")
+        # Free slot and nobody waiting: run now
+        if self.in_flight < self.max_concurrent and not self.queued:
+            self.in_flight += 1
+            self.admitted += 1
+            self._sessions[session_id] = self._sessions.get(session_id, 0) + 1
+            return
+        if self.queued >= self.max_queue:
+            self._shed("queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(session_id, deque()).append(waiter)
+        self.queued += 1
+        self._sessions[session_id] = self._sessions.get(session_id, 0) + 1
+        try:
+            # shield: a timeout must not cancel a slot that was handed over at the same moment
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                if isinstance(e, asyncio.TimeoutError):
+                    return  # Granted just in time
+                # Client went away after being granted a slot: pass it on
+                self.release(session_id, 0.0)
+                raise
+            waiter.cancel()
+            self._forget(session_id, waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self._shed("timeout")
+
+    # Give the slot back; service_time is how long it was held
+    def release(self, session_id: str, service_time: float) -> None:
+        self._decrement(session_id)
+        if self.max_concurrent <= 0:
+            return
+        self.in_flight -= 1
+        self._service_time = 0.9 * self._service_time + 0.1 * service_time
+        self._dispatch()
+
+    # Hand free slots to waiters, one session at a time in round-robin order
+    def _dispatch(self) -> None:
+        while self.in_flight < self.max_concurrent and self._waiting:
+            session_id, waiters = next(iter(self._waiting.items()))
+            waiter = waiters.popleft()
+            if waiters:
+                self._waiting.move_to_end(session_id)
+            else:
+                del self._waiting[session_id]
+            self.queued -= 1
+            self.in_flight += 1
+            self.admitted += 1
+            waiter.set_result(True)
+
+    # Helper: drop a waiter that gave up (timeout or disconnect)
+    def _forget(self, session_id: str, waiter: asyncio.Future) -> None:
+        waiters = self._waiting.get(session_id)
+        if waiters is not None and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del self._waiting[session_id]
+            self.queued -= 1
+        self._decrement(session_id)
+
+    def _decrement(self, session_id: str) -> None:
+        count = self._sessions.get(session_id, 0) - 1
+        if count > 0:
+            self._sessions[session_id] = count
+        else:
+            self._sessions.pop(session_id, None)
+
+    def _shed(self, reason: str) -> None:
+        self.shed[reason] += 1
+        raise Overloaded(reason, self.retry_after())
+
+    # Seconds until a retry is likely to be admitted: the current backlog drained at the observed service rate
+    def retry_after(self) -> int:
+        backlog = (self.queued + 1) * self._service_time / max(1, self.max_concurrent)
+        return max(1, math.ceil(backlog))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "waiting_sessions": len(self._waiting),
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "shed": dict(self.shed),
+            "avg_service_ms": round(self._service_time * 1000, 2),
+        }
@@ -0,0 +1,148 @@
+# LangChain docstore interface, so the FAISS wrapper can read chunks straight from SQLite
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+# Type hints for better readability
+from collections.abc import MutableMapping
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+# Chunk storage, a lock around the shared connection and JSON-encoded metadata (no pickle anywhere)
+import json
+import sqlite3
+import threading
+
+# File holding chunk texts, metadata and the position → id map inside an index version directory
+CHUNKS_FILE = "chunks.db"
+
+# Write every chunk of a vectorstore into a fresh chunks.db (positions follow the FAISS index)
+def write_chunks(path: str, index_to_docstore_id, docstore) -> None:
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")  # The file is only published (via CURRENT) once complete
+        conn.execute(
+            "CREATE TABLE chunk (position INTEGER PRIMARY KEY, doc_id TEXT NOT NULL UNIQUE,"
+            " content TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        rows = []
+        for position, doc_id in index_to_docstore_id.items():
+            doc = docstore.search(doc_id)
+            rows.append((int(position), doc_id, doc.page_content, json.dumps(doc.metadata, default=str)))
+            if len(rows) >= 10000:
+                conn.executemany("INSERT INTO chunk VALUES (?, ?, ?, ?)", rows)
+                rows = []
+        conn.executemany("INSERT INTO chunk VALUES (?, ?, ?, ?)", rows)
+        conn.commit()
+    finally:
+        conn.close()
+
+# Read-only access to a chunks.db. Nothing is loaded up front: texts, metadata and ids are read by key
+# on demand (SQLite pages come from the OS page cache, shared by every worker process).
+# The connection is opened immediately and kept, so the file stays readable even after a newer
+# index version is published and this one is pruned from disk
+class ChunkFile:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self._size = self._conn.execute("SELECT COUNT(*) FROM chunk").fetchone()[0]
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _fetchone(self, sql: str, params: tuple):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()
+
+    def _fetchall(self, sql: str) -> list:
+        with self._lock:
+            return self._conn.execute(sql).fetchall()
+
+    def document(self, doc_id: str) -> Optional[Document]:
+        row = self._fetchone("SELECT content, metadata FROM chunk WHERE doc_id = ?", (doc_id,))
+        return Document(page_content=row[0], metadata=json.loads(row[1])) if row else None
+
+    def doc_id(self, position: int) -> Optional[str]:
+        row = self._fetchone("SELECT doc_id FROM chunk WHERE position = ?", (int(position),))
+        return row[0] if row else None
+
+    def ids(self) -> List[Tuple[int, str]]:
+        return self._fetchall("SELECT position, doc_id FROM chunk ORDER BY position")
+
+    # (position, metadata) for every chunk in one sequential scan (used to build the metadata index)
+    def metadata_rows(self) -> Iterator[Tuple[int, dict]]:
+        for position, metadata in self._fetchall("SELECT position, metadata FROM chunk ORDER BY position"):
+            yield position, json.loads(metadata)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+# Docstore backed by a ChunkFile. Documents added or deleted after loading (incremental ingestion)
+# live in an in-memory overlay until the next save writes a new chunks.db
+class SQLiteDocstore(Docstore, AddableMixin):
+    def __init__(self, chunks: ChunkFile):
+        self.chunks = chunks
+        self._added: Dict[str, Document] = {}
+        self._deleted = set()
+
+    def search(self, search: str) -> Union[str, Document]:
+        if search in self._added:
+            return self._added[search]
+        doc = None if search in self._deleted else self.chunks.document(search)
+        return doc if doc is not None else f"ID {search} not found."
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        self._added.update(texts)
+        self._deleted.difference_update(texts)
+
+    def delete(self, ids: List) -> None:
+        for doc_id in ids:
+            self._added.pop(doc_id, None)
+            self._deleted.add(doc_id)
+
+    # True while the docstore still matches chunks.db exactly
+    @property
+    def pristine(self) -> bool:
+        return not self._added and not self._deleted
+
+# FAISS position → docstore id, read lazily from chunks.db instead of materializing a dict of every id.
+# Writes (from add_embeddings) go to an overlay; LangChain's delete() replaces the whole map with a plain dict
+class LazyIdMap(MutableMapping):
+    def __init__(self, chunks: ChunkFile):
+        self.chunks = chunks
+        self._size = len(chunks)
+        self._overlay: Dict[int, str] = {}
+
+    def __getitem__(self, position: int) -> str:
+        position = int(position)
+        if position in self._overlay:
+            return self._overlay[position]
+        doc_id = self.chunks.doc_id(position) if 0 <= position < self._size else None
+        if doc_id is None:
+            raise KeyError(position)
+        return doc_id
+
+    def __setitem__(self, position: int, doc_id: str) -> None:
+        self._overlay[int(position)] = doc_id
+
+    def __delitem__(self, position: int) -> None:
+        raise TypeError("Positions can't be removed from a memory-mapped index; rebuild it instead")
+
+    def __len__(self) -> int:
+        return max(self._size, max(self._overlay, default=-1) + 1)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(len(self)))
+
+    # Sequential scan instead of one query per position
+    def items(self) -> Iterable[Tuple[int, str]]:
+        for position, doc_id in self.chunks.ids():
+            yield position, self._overlay.get(position, doc_id)
+        for position in sorted(p for p in self._overlay if p >= self._size):
+            yield position, self._overlay[position]
+
+    def values(self) -> Iterable[str]:
+        return [doc_id for _, doc_id in self.items()]
+
+    @property
+    def pristine(self) -> bool:
+        return not self._overlay
@@ -0,0 +1,189 @@
+# Process pool for CPU-bound encoding (spawn context: torch is not fork-safe once initialised)
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+# Compact float32 storage of cached vectors without pulling numpy into this module
+from array import array
+# Type hints for better readability
+from typing import Dict, List, Optional, Sequence
+# Content hashing, SQLite cache, timing and configuration
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# Chunks per encode call (per worker task when a pool is used)
+EMBED_BATCH_SIZE = int(os.getenv("MCP_EMBED_BATCH_SIZE", "64"))
+# Worker processes used for encoding (1 = encode in-process with the caller's model)
+EMBED_WORKERS = int(os.getenv("MCP_EMBED_WORKERS", "1"))
+# Persistent chunk-embedding cache (set MCP_EMBED_CACHE="" to disable)
+EMBED_CACHE_PATH = os.getenv("MCP_EMBED_CACHE", "embedding_cache.db")
+
+_WHITESPACE = re.compile(r"\s+")
+
+# Helper: cache key of one chunk (whitespace-normalized so re-extraction noise still hits the cache)
+def text_key(text: str) -> str:
+    return hashlib.sha256(_WHITESPACE.sub(" ", text).strip().encode("utf-8")).hexdigest()
+
+# On-disk cache of chunk vectors keyed by (model name, normalized text hash).
+# Changing chunk_size/chunk_overlap only re-encodes the chunks whose text actually changed
+class EmbeddingCache:
+    def __init__(self, path: str = EMBED_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunk_embedding ("
+            " model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL,"
+            " PRIMARY KEY (model, text_hash)) WITHOUT ROWID"
+        )
+        self._conn.commit()
+
+    # Return {text_hash: vector} for the hashes that are cached
+    def get_many(self, model: str, hashes: Sequence[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        hashes = list(hashes)
+        with self._lock:
+            # SQLite limits bound parameters per statement, so look up in slices
+            for start in range(0, len(hashes), 500):
+                part = hashes[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM chunk_embedding WHERE model = ? AND text_hash IN ({','.join('?' * len(part))})",
+                    [model, *part],
+                )
+                for text_hash, blob in rows:
+                    found[text_hash] = array("f", blob).tolist()
+        return found
+
+    # Store freshly encoded vectors (one transaction per call)
+    def put_many(self, model: str, vectors: Dict[str, Sequence[float]]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunk_embedding (model, text_hash, vector) VALUES (?, ?, ?)",
+                [(model, text_hash, array("f", vector).tobytes()) for text_hash, vector in vectors.items()],
+            )
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunk_embedding").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+# Per-worker model, loaded once by the pool initializer instead of once per batch
+_worker_embeddings = None
+
+def _init_worker(model_name: str, model_kwargs: dict, encode_kwargs: dict) -> None:
+    global _worker_embeddings
+    from langchain_huggingface import HuggingFaceEmbeddings
+    _worker_embeddings = HuggingFaceEmbeddings(
+        model_name=model_name, model_kwargs=model_kwargs, encode_kwargs=encode_kwargs
+    )
+
+def _encode_batch(texts: List[str]) -> List[List[float]]:
+    return _worker_embeddings.embed_documents(texts)
+
+# Batched embedding of document chunks with a persistent cache and an optional process pool.
+# `embeddings` is the caller's HuggingFaceEmbeddings; workers load their own copy of the same model
+class EmbeddingPipeline:
+    def __init__(self, embeddings, batch_size: int = EMBED_BATCH_SIZE, workers: int = EMBED_WORKERS,
+                 cache: Optional[EmbeddingCache] = None):
+        self.embeddings = embeddings
+        self.model_name = getattr(embeddings, "model_name", type(embeddings).__name__)
+        self.batch_size = max(1, batch_size)
+        self.workers = max(1, workers)
+        if cache is None and EMBED_CACHE_PATH:
+            cache = EmbeddingCache(EMBED_CACHE_PATH)
+        self.cache = cache
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # Cumulative counters reported by stats()
+        self.chunks = 0
+        self.hits = 0
+        self.encoded = 0
+        self.seconds = 0.0
+        # Counters of the most recent embed() call
+        self.last_run: Dict[str, float] = {}
+
+    # Started on first use so a fully cached run never pays for spawning workers
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(
+                    self.model_name,
+                    getattr(self.embeddings, "model_kwargs", {}),
+                    getattr(self.embeddings, "encode_kwargs", {}),
+                ),
+            )
+        return self._pool
+
+    # Encode texts that were not cached, in batches (in-process or across the pool)
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if self.workers == 1 or len(batches) == 1:
+            vectors: List[List[float]] = []
+            for batch in batches:
+                vectors.extend(self.embeddings.embed_documents(batch))
+            return vectors
+        vectors = []
+        for batch_vectors in self._get_pool().map(_encode_batch, batches):
+            vectors.extend(batch_vectors)
+        return vectors
+
+    # Vectors for every text, in order. Duplicate texts are encoded once
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        start = time.perf_counter()
+        keys = [text_key(text) for text in texts]
+        known = self.cache.get_many(self.model_name, set(keys)) if self.cache is not None else {}
+        hits = sum(1 for key in keys if key in known)
+
+        # First occurrence of every missing key
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in known and key not in missing:
+                missing[key] = text
+        if missing:
+            fresh = dict(zip(missing.keys(), self._encode(list(missing.values()))))
+            if self.cache is not None:
+                self.cache.put_many(self.model_name, fresh)
+            known.update(fresh)
+
+        elapsed = time.perf_counter() - start
+        self.chunks += len(texts)
+        self.hits += hits
+        self.encoded += len(missing)
+        self.seconds += elapsed
+        self.last_run = {
+            "chunks": len(texts),
+            "cache_hits": hits,
+            "encoded": len(missing),
+            "seconds": elapsed,
+            "chunks_per_sec": len(texts) / elapsed if elapsed else 0.0,
+            "hit_rate": hits / len(texts) if texts else 0.0,
+        }
+        return [known[key] for key in keys]
+
+    # Cumulative throughput and cache effectiveness
+    def stats(self) -> Dict[str, float]:
+        return {
+            "chunks": self.chunks,
+            "cache_hits": self.hits,
+            "encoded": self.encoded,
+            "seconds": self.seconds,
+            "chunks_per_sec": self.chunks / self.seconds if self.seconds else 0.0,
+            "hit_rate": self.hits / self.chunks if self.chunks else 0.0,
+            "workers": self.workers,
+            "batch_size": self.batch_size,
+        }
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
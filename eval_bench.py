@@ -0,0 +1,290 @@
+# Offline evaluation + benchmark: runs the evaluators of mcp_eval.py and rag_eval.py locally (no LangSmith
+# client, no network) against the in-process graph and RAGManager, spreads the cases over a worker pool,
+# reports accuracy next to latency percentiles and throughput, and stores every run for regression checks
+#   python eval_bench.py                                   # built-in test cases
+#   python eval_bench.py --cases cases.jsonl --workers 8 --repeat 5
+#   python eval_bench.py --compare latest                  # exit 1 on a regression vs. the last stored run
+import argparse
+import json
+# Query-cache switches for --cold and the results directory
+import os
+# Commit id stored with each run
+import subprocess
+import sys
+# High resolution timer for latency measurements
+import time
+# Cases run concurrently on a thread pool (the graph and RAGManager.query are synchronous)
+from concurrent.futures import ThreadPoolExecutor
+# The evaluators read run.outputs / example.outputs, like LangSmith's Run and Example objects
+from types import SimpleNamespace
+# Type hints for better readability
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+# Same nearest-rank percentile as the other benchmarks
+from mcp_bench import percentile
+# The evaluators and built-in cases (these modules only import LangSmith when their own evaluation runs)
+from mcp_eval import MCP_TEST_CASES, medical_accuracy, response_relevance
+from rag_eval import RAG_TEST_CASES, relevance_scoring, retrieval_accuracy
+
+# Each suite: the case field holding its input, and the evaluators that score its output
+SUITES = {
+    "mcp": {"input": "message", "evaluators": [medical_accuracy, response_relevance]},
+    "rag": {"input": "question", "evaluators": [retrieval_accuracy, relevance_scoring]},
+}
+
+# p95 growth below this many ms is never a regression (sub-millisecond timings are mostly noise)
+SLOWDOWN_FLOOR_MS = 1.0
+
+# Helper: the suite a case belongs to ("suite" field, else whichever input field it has)
+def _suite_of(case: Dict[str, Any]) -> Optional[str]:
+    if case.get("suite") in SUITES:
+        return case["suite"]
+    return next((name for name, suite in SUITES.items() if suite["input"] in case), None)
+
+# Load test cases from JSON Lines files (one case per line) or JSON files holding a list of cases.
+# A case is a dict like the ones in MCP_TEST_CASES / RAG_TEST_CASES, optionally with a "suite" field
+def load_cases(paths: Sequence[str]) -> List[Dict[str, Any]]:
+    cases = []
+    for path in paths:
+        with open(path) as f:
+            if path.endswith(".jsonl"):
+                entries = [(n, json.loads(line)) for n, line in enumerate(f, 1) if line.strip()]
+            else:
+                entries = list(enumerate(json.load(f), 1))
+        for n, case in entries:
+            suite = _suite_of(case)
+            if suite is None:
+                raise ValueError(f"{path}:{n}: case has neither a 'message' (mcp) nor a 'question' (rag)")
+            cases.append({**case, "suite": suite})
+    return cases
+
+# Helper: an evaluator result as a 0..1 accuracy (None if it can't be scored, e.g. no keywords)
+def _normalize(result: Dict[str, Any]) -> Optional[float]:
+    if "passed" in result:
+        return float(result["passed"])
+    if "max_score" in result:
+        return min(result["score"] / result["max_score"], 1.0) if result["max_score"] else None
+    return float(result["score"])
+
+# Helper: the targets of the selected suites, loaded once and shared by all workers. The embedding model and
+# index are only loaded when something uses them: the rag suite, or the mcp graph with its retrieval node
+def load_targets(index_path: str, cold: bool, suites: Sequence[str] = tuple(SUITES),
+                 retrieval: bool = True) -> Dict[str, Callable[[str], Dict[str, Any]]]:
+    # Query caches off: every repeat measures a full search instead of a cache hit
+    if cold:
+        os.environ["MCP_QUERY_VECTOR_CACHE_SIZE"] = "0"
+        os.environ["MCP_QUERY_RESULT_CACHE_SIZE"] = "0"
+    from langchain_core.messages import HumanMessage
+    from multi_agent_graph import Retriever, build_graph
+
+    # One RAGManager serves the rag suite and the graph's retrieval node
+    rag = None
+    if "rag" in suites or ("mcp" in suites and retrieval):
+        from rag_manager import RAGManager
+        rag = RAGManager(index_path)
+        rag.load_vectorstore(index_path)
+    graph = build_graph(retriever=Retriever(rag=rag, index_path=index_path) if retrieval else False)
+
+    # Same outputs the LangSmith chains produced: {"response": ...} and {"docs": ...}
+    def run_graph(message: str) -> Dict[str, Any]:
+        result = graph.invoke({"messages": [HumanMessage(content=message)], "memory": None, "response": ""})
+        return {"response": result["response"]}
+
+    def run_rag(question: str) -> Dict[str, Any]:
+        return {"docs": rag.query(question)}
+
+    # Load the model weights and fault in the index before anything is timed
+    targets = {}
+    if rag is not None:
+        rag.query("eval warmup")
+    if "mcp" in suites:
+        run_graph("hello")
+        targets["mcp"] = run_graph
+    if "rag" in suites:
+        targets["rag"] = run_rag
+    return targets
+
+# Helper: run one case once and score it
+def _run_case(target: Callable[[str], Dict[str, Any]], case: Dict[str, Any]) -> Dict[str, Any]:
+    suite = SUITES[case["suite"]]
+    start = time.perf_counter()
+    try:
+        outputs = target(case[suite["input"]])
+    except Exception as e:
+        return {"ms": (time.perf_counter() - start) * 1000, "error": f"{type(e).__name__}: {e}"}
+    ms = (time.perf_counter() - start) * 1000
+    run, example = SimpleNamespace(outputs=outputs), SimpleNamespace(outputs=case)
+    return {"ms": ms, "scores": {evaluator.__name__: _normalize(evaluator(run, example))
+                                 for evaluator in suite["evaluators"]}}
+
+# Helper: p50/p95/p99/mean of latency samples in ms
+def _latency(samples: List[float]) -> Dict[str, float]:
+    return {
+        "p50": round(percentile(samples, 50), 2),
+        "p95": round(percentile(samples, 95), 2),
+        "p99": round(percentile(samples, 99), 2),
+        "mean": round(sum(samples) / len(samples), 2) if samples else 0.0,
+    }
+
+def run_suite(name: str, target: Callable[[str], Dict[str, Any]], cases: List[Dict[str, Any]],
+              workers: int, repeat: int) -> Dict[str, Any]:
+    """
+    Runs every case of one suite `repeat` times on a pool of `workers` threads. Returns accuracy per
+    evaluator (failed runs score 0), latency percentiles over all runs, throughput and per-case details.
+    """
+    jobs = [case for case in cases for _ in range(repeat)]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"eval-{name}") as pool:
+        start = time.perf_counter()
+        results = list(pool.map(lambda case: _run_case(target, case), jobs))
+        elapsed = time.perf_counter() - start
+
+    evaluators = [evaluator.__name__ for evaluator in SUITES[name]["evaluators"]]
+    accuracy = {}
+    for evaluator in evaluators:
+        scores = [0.0 if "error" in r else r["scores"][evaluator] for r in results]
+        scores = [score for score in scores if score is not None]
+        accuracy[evaluator] = round(sum(scores) / len(scores), 4) if scores else None
+
+    # Per case: mean score per evaluator, latencies and any errors
+    details = []
+    for i, case in enumerate(cases):
+        runs = results[i * repeat:(i + 1) * repeat]
+        scored = [r["scores"] for r in runs if "error" not in r]
+        details.append({
+            "input": case[SUITES[name]["input"]],
+            "expected": case.get("expected"),
+            "scores": {e: (round(sum(s[e] or 0.0 for s in scored) / len(scored), 4) if scored else 0.0) for e in evaluators},
+            "ms": [round(r["ms"], 2) for r in runs],
+            "errors": sorted({r["error"] for r in runs if "error" in r}),
+        })
+
+    return {
+        "cases": len(cases),
+        "runs": len(jobs),
+        "errors": sum(1 for r in results if "error" in r),
+        "accuracy": accuracy,
+        "latency_ms": _latency([r["ms"] for r in results]),
+        "throughput_per_s": round(len(jobs) / elapsed, 2) if elapsed else 0.0,
+        "details": details,
+    }
+
+# Helper: short commit id of the working tree (None outside a git checkout)
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Helper: stored runs in results_dir, oldest first
+def stored_runs(results_dir: str) -> List[str]:
+    if not os.path.isdir(results_dir):
+        return []
+    return sorted(os.path.join(results_dir, name) for name in os.listdir(results_dir) if name.endswith(".json"))
+
+def compare_runs(baseline: Dict[str, Any], current: Dict[str, Any], max_slowdown: float,
+                 accuracy_tolerance: float) -> List[str]:
+    """
+    Prints accuracy and latency of `current` next to `baseline` and returns the regressions: an evaluator
+    whose accuracy dropped by more than accuracy_tolerance, or a suite whose p95 grew past max_slowdown ×
+    (and by more than SLOWDOWN_FLOOR_MS).
+    """
+    regressions = []
+    print(f"\ncompared with {baseline['run']} (commit {baseline.get('commit') or '?'})")
+    print(f"{'suite':>6} {'metric':>22} {'baseline':>10} {'current':>10} {'change':>9}")
+    for name, suite in current["suites"].items():
+        before = baseline["suites"].get(name)
+        if before is None:
+            continue
+        for evaluator, score in suite["accuracy"].items():
+            old = before["accuracy"].get(evaluator)
+            if old is None or score is None:
+                continue
+            flag = " !" if old - score > accuracy_tolerance else ""
+            print(f"{name:>6} {evaluator:>22} {old:>10.3f} {score:>10.3f} {score - old:>+9.3f}{flag}")
+            if flag:
+                regressions.append(f"{name}/{evaluator}: accuracy {old:.3f} → {score:.3f}")
+        for key in ("p50", "p95", "p99"):
+            old, new = before["latency_ms"][key], suite["latency_ms"][key]
+            ratio = new / old if old else 1.0
+            flag = " !" if key == "p95" and ratio > max_slowdown and new - old > SLOWDOWN_FLOOR_MS else ""
+            print(f"{name:>6} {key + ' ms':>22} {old:>10.2f} {new:>10.2f} {ratio:>8.2f}x{flag}")
+            if flag:
+                regressions.append(f"{name}/p95: {old:.2f} ms → {new:.2f} ms ({ratio:.2f}x)")
+        old, new = before["throughput_per_s"], suite["throughput_per_s"]
+        print(f"{name:>6} {'runs/s':>22} {old:>10.1f} {new:>10.1f} {new / old if old else 1.0:>8.2f}x")
+    return regressions
+
+def run_evaluation(cases: List[Dict[str, Any]], workers: int, repeat: int, index_path: str, cold: bool,
+                   label: Optional[str] = None, retrieval: bool = True) -> Dict[str, Any]:
+    """
+    Loads the targets once, then runs each suite that has cases and prints a summary table.
+    """
+    targets = load_targets(index_path, cold, {case["suite"] for case in cases}, retrieval)
+    report = {
+        "run": time.strftime("%Y%m%d-%H%M%S") + (f"-{label}" if label else ""),
+        "commit": _commit(),
+        "config": {"workers": workers, "repeat": repeat, "index": index_path, "cold": cold, "retrieval": retrieval},
+        "suites": {},
+    }
+    print(f"{'suite':>6} {'runs':>6} {'errors':>7} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'runs/s':>10}  accuracy")
+    for name in SUITES:
+        suite_cases = [case for case in cases if case["suite"] == name]
+        if not suite_cases:
+            continue
+        result = run_suite(name, targets[name], suite_cases, workers, repeat)
+        report["suites"][name] = result
+        latency = result["latency_ms"]
+        accuracy = "  ".join(f"{e}={'n/a' if s is None else f'{s:.3f}'}" for e, s in result["accuracy"].items())
+        print(f"{name:>6} {result['runs']:>6} {result['errors']:>7} {latency['p50']:>10.2f} {latency['p95']:>10.2f} "
+              f"{latency['p99']:>10.2f} {result['throughput_per_s']:>10.1f}  {accuracy}")
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline evaluation and latency benchmark (no LangSmith needed)")
+    parser.add_argument("--cases", nargs="+", help="JSON Lines / JSON case files (default: the built-in cases)")
+    parser.add_argument("--suites", nargs="+", choices=sorted(SUITES), default=sorted(SUITES))
+    parser.add_argument("--workers", type=int, default=4, help="Cases evaluated concurrently")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case (more runs → steadier percentiles)")
+    parser.add_argument("--index", default=os.getenv("MCP_RAG_INDEX", "faiss_index"), help="Index directory")
+    parser.add_argument("--cold", action="store_true", help="Disable the query caches so repeats aren't cache hits")
+    parser.add_argument("--no-retrieval", action="store_true",
+                        help="Evaluate the mcp graph without its retrieval node (no model or index for mcp-only runs)")
+    parser.add_argument("--results-dir", default="eval_results", help="Where runs are stored")
+    parser.add_argument("--label", help="Suffix for the stored run's name")
+    parser.add_argument("--no-save", action="store_true", help="Don't store this run")
+    parser.add_argument("--compare", help="Stored run to compare with (a path, or 'latest')")
+    parser.add_argument("--max-slowdown", type=float, default=1.25, help="Allowed p95 growth factor")
+    parser.add_argument("--accuracy-tolerance", type=float, default=0.0, help="Allowed accuracy drop")
+    args = parser.parse_args()
+
+    selected = [case for case in (load_cases(args.cases) if args.cases else
+                                  [{**c, "suite": "mcp"} for c in MCP_TEST_CASES] +
+                                  [{**c, "suite": "rag"} for c in RAG_TEST_CASES])
+                if case["suite"] in args.suites]
+    if not selected:
+        parser.error("no test cases for the selected suites")
+
+    # Resolve the baseline before this run is stored (so 'latest' means the previous run)
+    baseline_path = args.compare
+    if baseline_path == "latest":
+        previous = stored_runs(args.results_dir)
+        if not previous:
+            parser.error(f"no stored runs in {args.results_dir}")
+        baseline_path = previous[-1]
+
+    report = run_evaluation(selected, args.workers, args.repeat, args.index, args.cold, args.label,
+                            retrieval=not args.no_retrieval)
+    if not args.no_save:
+        os.makedirs(args.results_dir, exist_ok=True)
+        path = os.path.join(args.results_dir, f"{report['run']}.json")
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nstored {path}")
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            regressions = compare_runs(json.load(f), report, args.max_slowdown, args.accuracy_tolerance)
+        if regressions:
+            print("\nregressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
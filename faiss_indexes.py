@@ -0,0 +1,179 @@
+# Raw FAISS (the LangChain wrapper only ever builds exact flat indexes)
+import faiss
+import numpy as np
+# Type hints for better readability
+from typing import Dict, Optional
+# Configuration from the environment + a warning when a corpus is too small for the chosen index
+import logging
+import math
+import os
+
+logger = logging.getLogger(__name__)
+
+# Index built for new vectorstores: flat | ivf_flat | hnsw | ivf_pq | ivf_sq8
+FAISS_INDEX_TYPE = os.getenv("MCP_FAISS_INDEX", "flat")
+# IVF: number of inverted lists (0 = about 4·sqrt(n)) and lists visited per query
+FAISS_NLIST = int(os.getenv("MCP_FAISS_NLIST", "0"))
+FAISS_NPROBE = int(os.getenv("MCP_FAISS_NPROBE", "16"))
+# HNSW: neighbours per node, and candidate list size during construction / search
+FAISS_HNSW_M = int(os.getenv("MCP_FAISS_HNSW_M", "32"))
+FAISS_EF_CONSTRUCTION = int(os.getenv("MCP_FAISS_EF_CONSTRUCTION", "80"))
+FAISS_EF_SEARCH = int(os.getenv("MCP_FAISS_EF_SEARCH", "64"))
+# PQ: sub-quantizers (must divide the dimension; 384 / 48 = 8 dims per 1-byte code)
+FAISS_PQ_M = int(os.getenv("MCP_FAISS_PQ_M", "48"))
+# Upper bound on vectors used for k-means / quantizer training
+FAISS_TRAIN_SAMPLE = int(os.getenv("MCP_FAISS_TRAIN_SAMPLE", "100000"))
+# Filters selecting at most this many vectors are searched exactly over the selected vectors only
+FAISS_EXACT_SUBSET = int(os.getenv("MCP_FAISS_EXACT_SUBSET", "1024"))
+
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq", "ivf_sq8")
+
+# FAISS wants ~39 training points per centroid (PQ always has 256 centroids per sub-quantizer)
+_POINTS_PER_CENTROID = 39
+
+# Helper: default number of IVF lists for n vectors (about 4·sqrt(n), but never more than n can train)
+def default_nlist(n: int) -> int:
+    return max(1, min(65536, int(4 * math.sqrt(n)), n // _POINTS_PER_CENTROID))
+
+# Helper: FAISS index_factory description for an index type
+def factory_string(kind: str, nlist: int, hnsw_m: int = FAISS_HNSW_M, pq_m: int = FAISS_PQ_M) -> str:
+    return {
+        "flat": "Flat",
+        "ivf_flat": f"IVF{nlist},Flat",
+        "hnsw": f"HNSW{hnsw_m}",
+        "ivf_pq": f"IVF{nlist},PQ{pq_m}",
+        "ivf_sq8": f"IVF{nlist},SQ8",
+    }[kind]
+
+# Helper: how many training vectors an index type needs to train properly
+def _training_points(kind: str, nlist: int) -> int:
+    if kind == "ivf_pq":
+        return _POINTS_PER_CENTROID * max(nlist, 256)
+    if kind in ("ivf_flat", "ivf_sq8"):
+        return _POINTS_PER_CENTROID * nlist
+    return 0
+
+# Create an empty, trained index for `vectors` (L2 metric, same as the LangChain default).
+# Training uses a random sample of at most FAISS_TRAIN_SAMPLE vectors; corpora too small to train
+# the requested type fall back to an exact flat index
+def build_index(vectors: np.ndarray, kind: str = FAISS_INDEX_TYPE, nlist: int = FAISS_NLIST,
+                seed: int = 1234) -> faiss.Index:
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS index type {kind!r} (expected one of {', '.join(INDEX_TYPES)})")
+    n, dim = vectors.shape
+    nlist = nlist or default_nlist(n)
+
+    if n < _training_points(kind, nlist):
+        logger.warning("%d vectors are too few to train a %s index with %d lists, using flat", n, kind, nlist)
+        kind = "flat"
+    if kind == "ivf_pq" and dim % FAISS_PQ_M:
+        raise ValueError(f"MCP_FAISS_PQ_M={FAISS_PQ_M} must divide the embedding dimension {dim}")
+
+    index = faiss.index_factory(dim, factory_string(kind, nlist), faiss.METRIC_L2)
+    if kind == "hnsw":
+        faiss.downcast_index(index).hnsw.efConstruction = FAISS_EF_CONSTRUCTION
+
+    if not index.is_trained:
+        sample = vectors
+        if n > FAISS_TRAIN_SAMPLE:
+            rows = np.random.default_rng(seed).choice(n, FAISS_TRAIN_SAMPLE, replace=False)
+            sample = vectors[rows]
+        index.train(np.ascontiguousarray(sample, dtype="float32"))
+
+    set_search_params(index)
+    enable_reconstruct(index)
+    return index
+
+# IVF indexes can only reconstruct vectors by position with a direct map (8 bytes per vector);
+# search_subset() relies on it for exact scoring of small filtered selections
+def enable_reconstruct(index: faiss.Index) -> None:
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return  # Flat and HNSW storage reconstruct natively
+    if ivf.direct_map.type == faiss.DirectMap.NoMap:
+        ivf.make_direct_map()
+
+# Open a saved index as a read-only memory map, so every process serving it shares the page cache instead
+# of holding a private copy. IO_FLAG_MMAP only maps inverted lists (IVF); flat-code storage (flat, HNSW's
+# vectors, PQ) is only mapped with IO_FLAG_MMAP_IFC, and combining the two fails on IVF files, so the flag
+# is picked from the file's four-byte type tag (IVF tags start with "Iw"/"Iv")
+def read_index_mmap(path: str) -> faiss.Index:
+    with open(path, "rb") as f:
+        ivf = f.read(4)[:2] in (b"Iw", b"Iv")
+    mmap_flag = faiss.IO_FLAG_MMAP if ivf else getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+    return faiss.read_index(path, mmap_flag | faiss.IO_FLAG_READ_ONLY)
+
+# Query-time accuracy/speed knobs (no-ops for index types they don't apply to)
+def set_search_params(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> None:
+    try:
+        faiss.extract_index_ivf(index).nprobe = nprobe or FAISS_NPROBE
+    except RuntimeError:
+        pass  # Not an IVF index
+    real = faiss.downcast_index(index)
+    if hasattr(real, "hnsw"):
+        real.hnsw.efSearch = ef_search or FAISS_EF_SEARCH
+
+# Helper: search parameters restricting a search to `ids`, keeping the index's nprobe/efSearch
+def _selector_params(index: faiss.Index, selector):
+    real = faiss.downcast_index(index)
+    if isinstance(real, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=real.nprobe)
+    if isinstance(real, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=real.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+# Top-k positions among `ids` only (pre-filtering: non-selected vectors are never scored).
+# Small selections are scored exactly from reconstructed vectors (cost ∝ selection, full recall even on IVF/HNSW);
+# larger ones go through the index with an ID selector
+def search_subset(index: faiss.Index, vector: np.ndarray, k: int, ids: np.ndarray):
+    if not len(ids):
+        return np.empty(0, dtype="float32"), np.empty(0, dtype="int64")
+    query = np.ascontiguousarray(vector, dtype="float32").reshape(1, -1)
+    if len(ids) <= FAISS_EXACT_SUBSET:
+        try:
+            candidates = index.reconstruct_batch(ids)
+        except RuntimeError:
+            candidates = None  # Index without reconstruction support (e.g. IVF without a direct map)
+        if candidates is not None:
+            distances = ((candidates - query) ** 2).sum(axis=1)
+            top = np.argsort(distances)[:k]
+            return distances[top], ids[top]
+    selector = faiss.IDSelectorBatch(ids)
+    distances, positions = index.search(query, k, params=_selector_params(index, selector))
+    keep = positions[0] != -1
+    return distances[0][keep], positions[0][keep]
+
+# Short name of a built index ("flat", "hnsw", …)
+def index_type(index: faiss.Index) -> str:
+    real = faiss.downcast_index(index)
+    if isinstance(real, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(real, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(real, faiss.IndexIVFScalarQuantizer):
+        return "ivf_sq8"
+    if isinstance(real, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+# True if remove_ids() keeps positions contiguous, which the LangChain wrapper's delete() relies on
+def supports_positional_delete(index: faiss.Index) -> bool:
+    return index_type(index) == "flat"
+
+# Serialized size of the index (vectors/codes + graph/quantizer) in bytes
+def index_memory_bytes(index: faiss.Index) -> int:
+    return int(faiss.serialize_index(index).nbytes)
+
+# Summary for stats endpoints and benchmarks
+def describe(index: faiss.Index) -> Dict[str, object]:
+    info: Dict[str, object] = {"type": index_type(index), "vectors": index.ntotal, "dim": index.d}
+    try:
+        ivf = faiss.extract_index_ivf(index)
+        info.update(nlist=ivf.nlist, nprobe=ivf.nprobe)
+    except RuntimeError:
+        pass
+    real = faiss.downcast_index(index)
+    if hasattr(real, "hnsw"):
+        info.update(ef_search=real.hnsw.efSearch)
+    return info
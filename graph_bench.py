@@ -0,0 +1,72 @@
+# Import argparse to pick sizes from the command line
+import argparse
+# Long sessions go through the graph without being folded into a summary
+import sys
+# High resolution timer for latency measurements
+import time
+# Peak memory allocated while a turn runs
+import tracemalloc
+
+# Messages the synthetic sessions are built from (same cases as mcp_eval.py)
+BENCH_MESSAGES = [
+    "I have fever and headache",
+    "Can I take ibuprofen?",
+    "What about paracetamol?",
+]
+
+# Helper: a session of `size` alternating user/agent messages
+def session_history(size):
+    from langchain_core.messages import AIMessage, HumanMessage
+
+    return [HumanMessage(content=BENCH_MESSAGES[i // 2 % len(BENCH_MESSAGES)]) if i % 2 == 0
+            else AIMessage(content=f"Answer {i // 2}: Paracetamol: 500mg every 6 hours (max 4000mg/day)")
+            for i in range(size)]
+
+# Helper: run `turns` turns on top of `history` and return (µs per turn, peak KB allocated per turn)
+def _measure(graph, history, turns):
+    from langchain_core.messages import HumanMessage
+
+    def turn(i):
+        graph.invoke({"messages": history + [HumanMessage(content=BENCH_MESSAGES[i % len(BENCH_MESSAGES)])],
+                      "memory": None, "response": ""})
+
+    # Warm up once, then time
+    turn(0)
+    start = time.perf_counter()
+    for i in range(turns):
+        turn(i)
+    elapsed = (time.perf_counter() - start) / turns
+
+    # Allocation pass (tracemalloc slows everything down, so it is kept out of the timing)
+    peaks = []
+    tracemalloc.start()
+    for i in range(min(turns, 20)):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        turn(i)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    return elapsed * 1e6, sorted(peaks)[len(peaks) // 2] / 1024
+
+def run_graph_benchmark(sizes, turns):
+    """
+    Cost of one turn through the graph (retrieval off) for sessions of each size, passing the history as a
+    new list every turn like the server does with the window it loads from the database. The server's
+    windows stay at HISTORY_WINDOW messages, so the sizes past it show what an unbounded history would cost.
+    """
+    from multi_agent_graph import build_graph
+
+    # Sessions this long would normally be summarized; keep the whole history flowing through the graph
+    graph = build_graph(retriever=False, summary_threshold=sys.maxsize)
+
+    print(f"{'messages':>9} {'us/turn':>10} {'peak KB/turn':>13}")
+    for size in sizes:
+        us, kb = _measure(graph, session_history(size), turns)
+        print(f"{size:>9} {us:>10.1f} {kb:>13.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-turn graph cost as the session grows")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 24, 1000, 10000], help="Messages per session")
+    parser.add_argument("--turns", type=int, default=200, help="Timed turns per size")
+    args = parser.parse_args()
+    run_graph_benchmark(args.sizes, args.turns)
@@ -0,0 +1,295 @@
+# Chat-history maintenance: keeps every history database bounded as traffic accumulates.
+#   python history_maintenance.py chat_history.db --retention-days 90 --max-messages 200 --vacuum-full
+#
+# One pass over a database:
+#   1. schema   - session/age indexes exist (HistoryStore creates them on open), unknown write times backfilled
+#   2. retention - sessions idle for longer than MCP_HISTORY_RETENTION_DAYS are deleted
+#   3. compaction - sessions over MCP_HISTORY_MAX_MESSAGES rows keep their live window; older turns are
+#                   folded into one SummaryAgent-style summary row that becomes the session's checkpoint
+#   4. vacuum   - freed pages are handed back in small incremental steps, the WAL is truncated
+# Retention and compaction delete stored conversations, so both are off unless configured. Incremental
+# vacuum needs a database in incremental auto-vacuum mode: files created before that was the default
+# must be rebuilt once with --vacuum-full (until then freed pages are reused, but the file never shrinks)
+# The server runs passes in a background thread; a lease row in each database makes sure only one
+# process per interval does the work, however many workers share the file
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+# Type hints for better readability
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain_core.messages import AIMessage, message_to_dict, messages_from_dict
+from sqlalchemy import text
+
+import history_store
+from history_store import HISTORY_WINDOW, SUMMARY_MESSAGES, summarize_messages
+
+logger = logging.getLogger(__name__)
+
+# Sessions idle for longer than this are deleted (default 0: sessions are kept forever)
+RETENTION_DAYS = float(os.getenv("MCP_HISTORY_RETENTION_DAYS", "0"))
+# Rows one session may hold before its old turns are compacted into a summary (default 0: no compaction)
+MAX_MESSAGES = int(os.getenv("MCP_HISTORY_MAX_MESSAGES", "0"))
+# Seconds between maintenance passes in the server (0 disables the background thread)
+MAINTENANCE_INTERVAL = float(os.getenv("MCP_HISTORY_MAINTENANCE_INTERVAL", "3600"))
+# Pages freed per incremental-vacuum step (each step is a short write transaction)
+VACUUM_PAGES = int(os.getenv("MCP_HISTORY_VACUUM_PAGES", "512"))
+
+# Sessions deleted per transaction (keeps write locks short while requests are being served)
+DELETE_BATCH = 200
+
+# One row per database: when the last pass started (the lease that serializes passes across processes)
+CREATE_LEASE_SQL = """
+CREATE TABLE IF NOT EXISTS history_maintenance (
+    id INTEGER NOT NULL CHECK (id = 1),
+    last_run REAL NOT NULL,
+    PRIMARY KEY (id)
+)
+"""
+
+# Helper: file size of a SQLite database including its WAL (0 for non-file URLs)
+def database_size(engine) -> int:
+    path = engine.url.database
+    if not path or path == ":memory:":
+        return 0
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+
+# Claim the next pass: True for exactly one caller per `interval` seconds (a single conditional UPDATE,
+# so concurrent workers can't both win)
+def claim(engine, interval: float, now: Optional[float] = None) -> bool:
+    now = time.time() if now is None else now
+    with engine.begin() as conn:
+        conn.execute(text(CREATE_LEASE_SQL))
+        conn.execute(text("INSERT OR IGNORE INTO history_maintenance (id, last_run) VALUES (1, 0)"))
+        claimed = conn.execute(
+            text("UPDATE history_maintenance SET last_run = :now WHERE id = 1 AND last_run <= :due"),
+            {"now": now, "due": now - interval}
+        ).rowcount
+    return claimed == 1
+
+# Rows without a write time (written by tools that don't set created_at) count as written now
+def backfill_created_at(engine, now: float) -> int:
+    with engine.begin() as conn:
+        return conn.execute(text("UPDATE message_store SET created_at = :now WHERE created_at IS NULL"),
+                            {"now": now}).rowcount
+
+# Delete sessions whose newest message is older than the cutoff. Only sessions that have old rows are
+# looked at (a range scan on the created_at index), and each check is one indexed lookup
+def expire_sessions(engine, cutoff: float, cache=None) -> Dict[str, int]:
+    with engine.connect() as conn:
+        candidates = [row[0] for row in conn.execute(
+            text("SELECT DISTINCT session_id FROM message_store WHERE created_at < :cutoff"), {"cutoff": cutoff})]
+
+    sessions = rows = 0
+    for offset in range(0, len(candidates), DELETE_BATCH):
+        with engine.begin() as conn:
+            for session_id in candidates[offset:offset + DELETE_BATCH]:
+                newest = conn.execute(
+                    text("SELECT created_at FROM message_store WHERE session_id = :sid ORDER BY id DESC LIMIT 1"),
+                    {"sid": session_id}
+                ).scalar()
+                if newest is None or newest >= cutoff:
+                    continue
+                rows += conn.execute(text("DELETE FROM message_store WHERE session_id = :sid"),
+                                     {"sid": session_id}).rowcount
+                conn.execute(text("DELETE FROM session_summary WHERE session_id = :sid"), {"sid": session_id})
+                sessions += 1
+                if cache:
+                    cache.invalidate((engine.url, session_id))
+    return {"expired_sessions": sessions, "expired_rows": rows}
+
+# Fold one session down to its live context (one transaction). The context the server loads is the latest
+# summary checkpoint plus the newest `window` rows after it, so:
+#   - if more than `window` rows follow the checkpoint, everything older than the window is folded into a
+#     summary of its last turns, written over the newest folded row (it keeps its place in the id order)
+#     and recorded as the new checkpoint
+#   - otherwise everything before the checkpoint is already covered by it and is dropped
+# Returns the number of rows removed
+def compact_session(conn, session_id: str, window: int) -> int:
+    params = {"sid": session_id}
+    checkpoint = conn.execute(history_store.LATEST_SUMMARY_SQL, params).fetchone()
+    after = checkpoint[0] if checkpoint else 0
+    live = conn.execute(history_store.WINDOW_SQL, {**params, "after": after, "limit": window + 1}).fetchall()
+
+    if len(live) <= window:
+        if not checkpoint:
+            return 0
+        conn.execute(text("DELETE FROM session_summary WHERE session_id = :sid AND message_id < :after"),
+                     {**params, "after": after})
+        return conn.execute(text("DELETE FROM message_store WHERE session_id = :sid AND id < :after"),
+                            {**params, "after": after}).rowcount
+
+    # The oldest row of the live window, and the turns just before it
+    first_kept = conn.execute(
+        text("SELECT id FROM message_store WHERE session_id = :sid AND id > :after ORDER BY id DESC LIMIT 1 OFFSET :skip"),
+        {**params, "after": after, "skip": window - 1}
+    ).scalar()
+    folded = conn.execute(
+        text("SELECT id, message FROM message_store WHERE session_id = :sid AND id < :first ORDER BY id DESC LIMIT :n"),
+        {**params, "first": first_kept, "n": SUMMARY_MESSAGES}
+    ).fetchall()
+    boundary = folded[0][0]
+    summary = summarize_messages(messages_from_dict([json.loads(row[1]) for row in reversed(folded)]))
+
+    conn.execute(text("UPDATE message_store SET message = :message WHERE id = :id"),
+                 {"message": json.dumps(message_to_dict(AIMessage(content=summary))), "id": boundary})
+    removed = conn.execute(text("DELETE FROM message_store WHERE session_id = :sid AND id < :boundary"),
+                           {**params, "boundary": boundary}).rowcount
+    conn.execute(text("DELETE FROM session_summary WHERE session_id = :sid"), params)
+    conn.execute(history_store.INSERT_SUMMARY_SQL, {**params, "message_id": boundary, "summary": summary})
+    return removed
+
+# Compact every session holding more than max_messages rows (one short transaction per session)
+def compact_sessions(engine, max_messages: int, window: int = HISTORY_WINDOW, cache=None) -> Dict[str, int]:
+    # A limit below the live window would fold messages the next request still loads
+    max_messages = max(max_messages, window + 1)
+    with engine.connect() as conn:
+        oversized = [row[0] for row in conn.execute(
+            text("SELECT session_id FROM message_store GROUP BY session_id HAVING COUNT(*) > :max"),
+            {"max": max_messages})]
+
+    rows = 0
+    for session_id in oversized:
+        with engine.begin() as conn:
+            rows += compact_session(conn, session_id, window)
+        if cache:
+            cache.invalidate((engine.url, session_id))
+    return {"compacted_sessions": len(oversized), "compacted_rows": rows}
+
+# True if the database can hand freed pages back without a full rebuild
+def incremental_mode(engine) -> bool:
+    with engine.connect() as conn:
+        return conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 2
+
+# Hand free pages back to the file system in steps of `pages` (databases in incremental auto-vacuum
+# mode only; elsewhere freed pages are reused by new rows, so the file stops growing but doesn't shrink)
+def incremental_vacuum(engine, pages: int = VACUUM_PAGES) -> int:
+    freed = 0
+    with engine.connect() as conn:
+        if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 2:
+            while True:
+                free = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+                if not free:
+                    break
+                # The pragma frees one page per VM step and sqlite3's execute() stops after the first;
+                # executescript() runs it to completion (and commits, so each step is its own transaction)
+                conn.connection.driver_connection.executescript(f"PRAGMA incremental_vacuum({min(free, pages)})")
+                step = free - conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+                if step <= 0:
+                    break
+                freed += step
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+        conn.exec_driver_sql("PRAGMA optimize")
+        conn.commit()
+    return freed
+
+# Rebuild the file once in incremental auto-vacuum mode (databases created before it was the default).
+# Blocks writers for the duration, so it is only run from the command line
+def vacuum_full(engine) -> None:
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.exec_driver_sql("VACUUM")
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+
+# One full maintenance pass over a database. Returns what was done and the file size before/after
+def maintain(database: str, retention_days: float = RETENTION_DAYS, max_messages: int = MAX_MESSAGES,
+             window: int = HISTORY_WINDOW, full_vacuum: bool = False, now: Optional[float] = None,
+             store: history_store.HistoryStore = None) -> Dict[str, Any]:
+    store = store or history_store.store
+    now = time.time() if now is None else now
+    started = time.perf_counter()
+    # Opening the engine creates any missing table, column and index
+    engine = store.engine(database)
+    # Rows still queued in write-behind mode must land before they are counted or folded
+    store.flush()
+    stats: Dict[str, Any] = {"database": database, "size_before": database_size(engine)}
+
+    stats["backfilled_rows"] = backfill_created_at(engine, now)
+    if retention_days > 0:
+        stats.update(expire_sessions(engine, now - retention_days * 86400, store.cache))
+    if max_messages > 0:
+        stats.update(compact_sessions(engine, max_messages, window, store.cache))
+    if full_vacuum:
+        vacuum_full(engine)
+    stats["incremental_vacuum"] = incremental_mode(engine)
+    stats["pages_freed"] = incremental_vacuum(engine)
+
+    stats["size_after"] = database_size(engine)
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    return stats
+
+# Background maintenance for the server: every interval (with jitter, so workers don't wake together)
+# try to claim the lease of each database and run a pass on the ones claimed
+class MaintenanceWorker:
+    def __init__(self, databases: Sequence[str], interval: float = MAINTENANCE_INTERVAL):
+        self.databases = list(databases)
+        self.interval = interval
+        self.last_stats: List[Dict[str, Any]] = []
+        self._warned = set()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self.interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="mcp-history-maintenance", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _run(self) -> None:
+        # First attempt shortly after startup (the lease stops restarts from running extra passes)
+        delay = min(60.0, self.interval) * random.uniform(0.5, 1.0)
+        while not self._stop.wait(delay):
+            self.run_once()
+            delay = self.interval * random.uniform(0.9, 1.1)
+
+    # One attempt over every database; failures are logged and retried next interval
+    def run_once(self) -> List[Dict[str, Any]]:
+        results = []
+        for database in self.databases:
+            try:
+                if claim(history_store.store.engine(database), self.interval):
+                    stats = maintain(database)
+                    logger.info("History maintenance: %s", stats)
+                    if not stats["incremental_vacuum"] and database not in self._warned:
+                        self._warned.add(database)
+                        logger.warning("%s can't shrink until it is rebuilt once: "
+                                       "python history_maintenance.py %s --vacuum-full", database, database)
+                    results.append(stats)
+            except Exception:
+                logger.exception("History maintenance failed for %s", database)
+        if results:
+            self.last_stats = results
+        return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Retention, compaction and vacuum for chat-history databases",
+        epilog="Retention and compaction delete stored conversations and are off unless set (here or through "
+               "MCP_HISTORY_RETENTION_DAYS / MCP_HISTORY_MAX_MESSAGES). Databases created before incremental "
+               "auto-vacuum was the default never shrink until they are rebuilt once with --vacuum-full "
+               "(\"incremental_vacuum\": false in the output); the rebuild blocks writers while it runs.")
+    parser.add_argument("databases", nargs="+", help="SQLite files or SQLAlchemy URLs")
+    parser.add_argument("--retention-days", type=float, default=RETENTION_DAYS, help="Delete sessions idle this long (0 = keep)")
+    parser.add_argument("--max-messages", type=int, default=MAX_MESSAGES, help="Compact sessions over this many rows (0 = off)")
+    parser.add_argument("--vacuum-full", action="store_true",
+                        help="Rebuild the file in incremental auto-vacuum mode (needed once for older databases)")
+    args = parser.parse_args()
+
+    for db in args.databases:
+        stats = maintain(db, args.retention_days, args.max_messages, full_vacuum=args.vacuum_full)
+        print(json.dumps(stats))
+        if not stats["incremental_vacuum"]:
+            print(f"{db}: freed pages are only reused; run once with --vacuum-full to let maintenance shrink it",
+                  file=sys.stderr)
+    history_store.store.dispose()
@@ -0,0 +1,539 @@
+# SQLAlchemy engine + connection pool shared by every chat-history handle
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+# Base class so our handles can be used anywhere a LangChain chat history is expected
+from langchain_core.chat_history import BaseChatMessageHistory
+# Helpers to (de)serialize messages in the same JSON format SQLChatMessageHistory uses
+from langchain_core.messages import AIMessage, BaseMessage, message_to_dict, messages_from_dict
+# In-process LRU/TTL cache of recent session windows (write-through to SQLite)
+from session_cache import SessionCache
+# SQLite timing histogram (sampled, see metrics.SAMPLE_RATE)
+from metrics import IO_LATENCY
+# Type hints for better readability
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+# json encodes message rows, threading guards the engine registry and runs the background writer
+import json
+import threading
+# Queue between request threads and the write-behind thread
+import queue
+# Flush pending writes at interpreter exit, read settings from the environment, log failed batches
+import atexit
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# "sync": every add_message commits before returning. "batched": writes are queued and flushed in
+# batched transactions by a background thread (see WriteBehindWriter)
+DURABILITY = os.getenv("MCP_HISTORY_DURABILITY", "sync")
+BATCH_SIZE = int(os.getenv("MCP_HISTORY_BATCH_SIZE", "256"))
+FLUSH_INTERVAL = float(os.getenv("MCP_HISTORY_FLUSH_INTERVAL", "0.05"))  # Seconds
+
+# How many stored messages (after the latest summary) are loaded back into the graph per request.
+# 24 keeps summary + window + new turn just above the graph's 25-message summarization threshold,
+# so long sessions are folded into a new checkpoint instead of growing the window
+HISTORY_WINDOW = int(os.getenv("MCP_HISTORY_WINDOW", "24"))
+
+# Set MCP_SESSION_CACHE=0 to read every session window straight from SQLite
+SESSION_CACHE_ENABLED = os.getenv("MCP_SESSION_CACHE", "1") != "0"
+
+# Same table layout SQLChatMessageHistory creates, so existing .db files keep working
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS message_store (
+    id INTEGER NOT NULL,
+    session_id TEXT,
+    message TEXT,
+    PRIMARY KEY (id)
+)
+"""
+
+# Pragmas applied to every pooled SQLite connection
+SQLITE_PRAGMAS = (
+    "PRAGMA auto_vacuum=INCREMENTAL",  # New databases can hand freed pages back (see history_maintenance)
+    "PRAGMA journal_mode=WAL",       # Readers don't block the writer (and vice versa)
+    "PRAGMA synchronous=NORMAL",     # Safe with WAL, avoids an fsync on every commit
+    "PRAGMA busy_timeout=5000",      # Wait up to 5s for a lock instead of failing immediately
+    "PRAGMA cache_size=-16000",      # ~16MB page cache per connection
+    "PRAGMA temp_store=MEMORY",      # Keep temp tables/indices in RAM
+)
+
+# Helper: accept either a bare file name ("chat_history.db") or a full SQLAlchemy URL
+def _to_url(database: str) -> str:
+    return database if "://" in database else f"sqlite:///{database}"
+
+# Rolling summaries written by SummaryAgent are checkpointed here: message_id is the summary's row in
+# message_store, so a session's context is "latest summary + messages stored after it"
+CREATE_SUMMARY_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS session_summary (
+    id INTEGER NOT NULL,
+    session_id TEXT NOT NULL,
+    message_id INTEGER NOT NULL,
+    summary TEXT NOT NULL,
+    PRIMARY KEY (id)
+)
+"""
+
+# Write time of each row (seconds since the epoch), added to existing databases on first open.
+# Rows written by other tools (e.g. SQLChatMessageHistory) get NULL; history_maintenance backfills them
+ADD_CREATED_AT_SQL = "ALTER TABLE message_store ADD COLUMN created_at REAL"
+
+# Indexes behind the per-session window queries (newest-first scans by session) and age-based retention
+CREATE_INDEX_SQL = (
+    "CREATE INDEX IF NOT EXISTS ix_message_store_session_id ON message_store (session_id, id)",
+    "CREATE INDEX IF NOT EXISTS ix_session_summary_session_id ON session_summary (session_id, id)",
+    "CREATE INDEX IF NOT EXISTS ix_message_store_created_at ON message_store (created_at)",
+)
+
+# Statements shared by the synchronous path and the batched writer
+INSERT_SQL = text(
+    "INSERT INTO message_store (session_id, message, created_at) "
+    "VALUES (:sid, :message, (julianday('now') - 2440587.5) * 86400.0)"
+)
+INSERT_SUMMARY_SQL = text(
+    "INSERT INTO session_summary (session_id, message_id, summary) VALUES (:sid, :message_id, :summary)"
+)
+LATEST_SUMMARY_SQL = text(
+    "SELECT message_id, summary FROM session_summary WHERE session_id = :sid ORDER BY id DESC LIMIT 1"
+)
+WINDOW_SQL = text(
+    "SELECT message FROM message_store WHERE session_id = :sid AND id > :after ORDER BY id DESC LIMIT :limit"
+)
+
+# Rolling summaries keep the last few messages before the point where the conversation was folded
+SUMMARY_MESSAGES = 5
+
+# Text of a rolling summary over `messages` (written by SummaryAgent and by history compaction)
+def summarize_messages(messages: Sequence[BaseMessage]) -> str:
+    recent = messages[-SUMMARY_MESSAGES:]
+    return "Conversation summary:\n" + "\n".join(f"{msg.type}: {msg.content[:50]}..." for msg in recent)
+
+# Markers passed through the writer queue
+_FLUSH = object()
+_STOP = object()
+
+# Helper: write queued rows in order; summary rows also record their checkpoint
+def _insert_rows(conn, rows: List[dict]) -> None:
+    plain = []
+    for row in rows:
+        if "summary" not in row:
+            plain.append(row)
+            continue
+        if plain:
+            conn.execute(INSERT_SQL, plain)
+            plain = []
+        message_id = conn.execute(INSERT_SQL, {"sid": row["sid"], "message": row["message"]}).lastrowid
+        conn.execute(INSERT_SUMMARY_SQL, {"sid": row["sid"], "message_id": message_id, "summary": row["summary"]})
+    if plain:
+        conn.execute(INSERT_SQL, plain)
+
+# Helper: serialize a message the same way SQLChatMessageHistory does
+def _to_row(session_id: str, message: BaseMessage) -> dict:
+    return {"sid": session_id, "message": json.dumps(message_to_dict(message))}
+
+# Background writer: buffers rows in memory and commits them in batched transactions.
+# on_drop(engine, rows) is called for rows given up on after max_retries failed attempts
+class WriteBehindWriter:
+    def __init__(self, batch_size: int = BATCH_SIZE, flush_interval: float = FLUSH_INTERVAL, max_retries: int = 3,
+                 on_drop: Optional[Callable[[object, List[dict]], None]] = None):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.on_drop = on_drop
+        self._queue: "queue.Queue" = queue.Queue()
+        # enqueued/written/dropped counters let flush() wait for "everything queued so far"
+        self._enqueued = 0
+        self._written = 0
+        self.dropped = 0  # Rows lost for good (never committed)
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="mcp-history-writer", daemon=True)
+        self._thread.start()
+
+    # Number of rows accepted but not yet committed (or dropped)
+    @property
+    def pending(self) -> int:
+        with self._cond:
+            return self._enqueued - self._written - self.dropped
+
+    # Queue rows for a given engine; returns immediately
+    def enqueue(self, engine, rows: List[dict]) -> None:
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("History writer is closed.")
+            self._enqueued += len(rows)
+            for row in rows:
+                self._queue.put((engine, row))
+
+    # Block until every row queued before this call has been handled. False if the wait timed out or
+    # rows were dropped while waiting (the loss is logged, counted in `dropped` and evicted from the cache)
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        with self._cond:
+            target = self._enqueued
+            dropped = self.dropped
+            if self._written + self.dropped < target:
+                # Tell the writer to commit what it has now instead of waiting out the interval
+                self._queue.put(_FLUSH)
+            done = self._cond.wait_for(lambda: self._written + self.dropped >= target, timeout=timeout)
+            return done and self.dropped == dropped
+
+    # Drain the queue and stop the thread (called on shutdown)
+    def close(self) -> None:
+        with self._cond:
+            if self._stopped:
+                return
+            self._stopped = True
+        self._queue.put(_STOP)  # Wake the writer so it drains and exits
+        self._thread.join()
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            # Wait for the first item, then keep collecting until the batch is full, the interval
+            # expires or someone asks for a flush
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    stopping = True
+                    break
+                if item is _FLUSH:
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            # On shutdown also pick up anything still queued behind the stop marker
+            if stopping:
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not _STOP and item is not _FLUSH:
+                        batch.append(item)
+            if batch:
+                self._write(batch)
+
+    # Commit a batch: one transaction per database
+    def _write(self, batch) -> None:
+        by_engine: Dict[object, List[dict]] = {}
+        for engine, row in batch:
+            by_engine.setdefault(engine, []).append(row)
+
+        lost: List[Tuple[object, List[dict]]] = []
+        for engine, rows in by_engine.items():
+            for attempt in range(1, self.max_retries + 1):
+                try:
+                    with IO_LATENCY.time("sqlite_batch_write"), engine.begin() as conn:
+                        _insert_rows(conn, rows)
+                    break
+                except Exception:
+                    if attempt == self.max_retries:
+                        logger.exception("Dropping %d chat-history rows after %d failed attempts", len(rows), attempt)
+                        lost.append((engine, rows))
+                    else:
+                        time.sleep(0.05 * attempt)
+
+        # Cached windows still hold the lost rows: let the owner evict them before flush() returns
+        for engine, rows in lost:
+            if self.on_drop:
+                try:
+                    self.on_drop(engine, rows)
+                except Exception:
+                    logger.exception("Handling dropped chat-history rows failed")
+
+        dropped = sum(len(rows) for _, rows in lost)
+        with self._cond:
+            self._written += len(batch) - dropped
+            self.dropped += dropped
+            self._cond.notify_all()
+
+# Lightweight per-session handle: holds only the session id and a reference to a pooled engine
+class SessionHistory(BaseChatMessageHistory):
+    def __init__(self, engine, session_id: str, writer: Optional[WriteBehindWriter] = None,
+                 cache: Optional[SessionCache] = None):
+        self.engine = engine
+        self.session_id = session_id
+        self.writer = writer  # Set when the store runs in "batched" durability mode
+        self.cache = cache    # Shared session cache (None when disabled)
+        self._key = (engine.url, session_id)
+
+    # True when add_message only queues the write (safe to call directly from the event loop)
+    @property
+    def buffered(self) -> bool:
+        return self.writer is not None
+
+    # Read every stored message of this session in insertion order
+    @property
+    def messages(self) -> List[BaseMessage]:
+        # Read-your-writes: make sure queued messages are committed first
+        if self.writer:
+            self.writer.flush()
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                text("SELECT message FROM message_store WHERE session_id = :sid ORDER BY id"),
+                {"sid": self.session_id}
+            ).fetchall()
+        return messages_from_dict([json.loads(row[0]) for row in rows])
+
+    # Bounded context for the graph: the latest summary checkpoint plus at most `window` messages
+    # stored after it. Two indexed lookups, so the cost doesn't grow with the session's length
+    def load_context(self, window: int, check_cache: bool = True) -> Tuple[Optional[BaseMessage], List[BaseMessage]]:
+        cached = self.cached_context(window) if check_cache else None
+        if cached is not None:
+            return cached
+
+        if self.cache:
+            self.cache.begin_load(self._key)
+        if self.writer:
+            self.writer.flush()
+        with IO_LATENCY.time("sqlite_read"), self.engine.connect() as conn:
+            checkpoint = conn.execute(LATEST_SUMMARY_SQL, {"sid": self.session_id}).fetchone()
+            after = checkpoint[0] if checkpoint else 0
+            rows = conn.execute(WINDOW_SQL, {"sid": self.session_id, "after": after, "limit": window}).fetchall()
+        summary = AIMessage(content=checkpoint[1]) if checkpoint else None
+        messages = messages_from_dict([json.loads(row[0]) for row in reversed(rows)])
+        if self.cache:
+            self.cache.put(self._key, summary, messages)
+        return summary, messages
+
+    # Same as load_context but only from the in-memory cache (None on a miss, never touches SQLite)
+    def cached_context(self, window: int) -> Optional[Tuple[Optional[BaseMessage], List[BaseMessage]]]:
+        return self.cache.get(self._key, window) if self.cache else None
+
+    # Persist a single message
+    def add_message(self, message: BaseMessage) -> None:
+        self.add_messages([message])
+
+    # Persist several messages in one transaction
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        self._write(self._rows("messages", messages))
+        self._update_cache("messages", messages)
+
+    # Persist a rolling summary and record it as the session's newest checkpoint
+    def add_summary(self, message: BaseMessage) -> None:
+        self._write(self._rows("summary", message))
+        self._update_cache("summary", message)
+
+    # Rows for one write operation: ("messages", [messages]) or ("summary", message)
+    def _rows(self, kind: str, payload) -> List[dict]:
+        if kind == "summary":
+            row = _to_row(self.session_id, payload)
+            row["summary"] = payload.content
+            return [row]
+        return [_to_row(self.session_id, m) for m in payload]
+
+    # Write-through to the session cache for one write operation
+    def _update_cache(self, kind: str, payload) -> None:
+        if not self.cache:
+            return
+        if kind == "summary":
+            self.cache.checkpoint(self._key, AIMessage(content=payload.content))
+        else:
+            self.cache.append(self._key, list(payload))
+
+    def _write(self, rows: List[dict]) -> None:
+        if not rows:
+            return
+        if self.writer:
+            # Write-behind: the background writer commits it with other queued rows
+            self.writer.enqueue(self.engine, rows)
+            return
+        with IO_LATENCY.time("sqlite_write"), self.engine.begin() as conn:
+            _insert_rows(conn, rows)
+
+    # Delete the whole session
+    def clear(self) -> None:
+        if self.cache:
+            self.cache.invalidate(self._key)
+        if self.writer:
+            self.writer.flush()
+        with self.engine.begin() as conn:
+            conn.execute(text("DELETE FROM message_store WHERE session_id = :sid"), {"sid": self.session_id})
+            conn.execute(text("DELETE FROM session_summary WHERE session_id = :sid"), {"sid": self.session_id})
+
+# Collects one session's writes in memory; HistoryStore.commit() persists many of them in one
+# transaction per database (used by batch and streaming requests)
+class BufferedHistory(BaseChatMessageHistory):
+    def __init__(self, history: SessionHistory):
+        self.history = history
+        self.session_id = history.session_id
+        self.ops: List[Tuple[str, object]] = []
+
+    # Writes only touch memory, so callers may add messages directly from the event loop
+    @property
+    def buffered(self) -> bool:
+        return True
+
+    # Stored messages followed by the ones still waiting for commit()
+    @property
+    def messages(self) -> List[BaseMessage]:
+        pending = [m for kind, payload in self.ops for m in ([payload] if kind == "summary" else payload)]
+        return self.history.messages + pending
+
+    # Context reads go to the underlying session (pending writes are tracked by the caller)
+    def load_context(self, window: int, check_cache: bool = True):
+        return self.history.load_context(window, check_cache)
+
+    def cached_context(self, window: int):
+        return self.history.cached_context(window)
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        self.ops.append(("messages", list(messages)))
+
+    def add_summary(self, message: BaseMessage) -> None:
+        self.ops.append(("summary", message))
+
+    def clear(self) -> None:
+        self.ops.clear()
+        self.history.clear()
+
+# Process-wide registry: one pooled engine per database, created on first use
+class HistoryStore:
+    def __init__(self, pool_size: int = 5, max_overflow: int = 10, durability: str = DURABILITY,
+                 cache: Optional[SessionCache] = None):
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.cache = cache
+        self._engines: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        self.writer: Optional[WriteBehindWriter] = None
+        self.set_durability(durability)
+
+    # Switch between "sync" commits and the "batched" write-behind writer
+    def set_durability(self, durability: str) -> None:
+        if durability not in ("sync", "batched"):
+            raise ValueError(f"Unknown durability mode: {durability!r} (expected 'sync' or 'batched')")
+        self.durability = durability
+        if durability == "batched" and self.writer is None:
+            self.writer = WriteBehindWriter(on_drop=self._evict_dropped)
+        elif durability == "sync" and self.writer is not None:
+            # Drain outstanding writes before going back to synchronous commits
+            writer, self.writer = self.writer, None
+            writer.close()
+
+    # Wait until every queued message is handled (no-op in "sync" mode); False on timeout or lost rows
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        return self.writer.flush(timeout) if self.writer else True
+
+    # Write-behind rows that never made it to the database: forget the cached windows that include them,
+    # so the sessions are read back from what is actually stored
+    def _evict_dropped(self, engine, rows: List[dict]) -> None:
+        if self.cache:
+            for session_id in {row["sid"] for row in rows}:
+                self.cache.invalidate((engine.url, session_id))
+
+    # Return the shared engine for a database, creating (and preparing) it only once
+    def engine(self, database: str):
+        url = _to_url(database)
+        engine = self._engines.get(url)
+        if engine is not None:
+            return engine
+
+        with self._lock:
+            # Another thread may have created it while we waited for the lock
+            if url not in self._engines:
+                self._engines[url] = self._create_engine(url)
+            return self._engines[url]
+
+    def _create_engine(self, url: str):
+        engine = create_engine(
+            url,
+            pool_size=self.pool_size,                 # Connections kept open and reused
+            max_overflow=self.max_overflow,           # Extra connections allowed under bursts
+            pool_pre_ping=False,                      # Local file, no stale-connection risk
+            connect_args={"check_same_thread": False, "timeout": 30}  # Pool hands connections across threads
+        )
+
+        # Apply the tuned pragmas each time the pool opens a new raw connection
+        @event.listens_for(engine, "connect")
+        def _set_pragmas(dbapi_conn, _record):
+            cursor = dbapi_conn.cursor()
+            for pragma in SQLITE_PRAGMAS:
+                cursor.execute(pragma)
+            cursor.close()
+
+        # Table/index checks happen once per engine instead of once per request
+        with engine.begin() as conn:
+            conn.execute(text(CREATE_TABLE_SQL))
+            conn.execute(text(CREATE_SUMMARY_TABLE_SQL))
+            columns = {row[1] for row in conn.execute(text("PRAGMA table_info(message_store)"))}
+        # Databases created before retention existed have no created_at column yet
+        if "created_at" not in columns:
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text(ADD_CREATED_AT_SQL))
+            except OperationalError:
+                # Another process added it first
+                pass
+        with engine.begin() as conn:
+            for statement in CREATE_INDEX_SQL:
+                conn.execute(text(statement))
+        return engine
+
+    # Hand out a cheap handle bound to the shared engine
+    def get_history(self, session_id: str, database: str = "chat_history.db") -> SessionHistory:
+        return SessionHistory(self.engine(database), session_id, self.writer, self.cache)
+
+    # Persist the writes collected by several BufferedHistory objects: one transaction per database
+    # (or one hand-off to the write-behind writer), then update the session cache
+    def commit(self, buffers: Sequence[BufferedHistory]) -> None:
+        by_engine: Dict[object, List[dict]] = {}
+        for buffer in buffers:
+            history = buffer.history
+            rows = by_engine.setdefault(history.engine, [])
+            for kind, payload in buffer.ops:
+                rows.extend(history._rows(kind, payload))
+
+        for engine, rows in by_engine.items():
+            if not rows:
+                continue
+            if self.writer:
+                self.writer.enqueue(engine, rows)
+            else:
+                with IO_LATENCY.time("sqlite_write"), engine.begin() as conn:
+                    _insert_rows(conn, rows)
+
+        for buffer in buffers:
+            for kind, payload in buffer.ops:
+                buffer.history._update_cache(kind, payload)
+            buffer.ops.clear()
+
+    # Reset in a freshly forked worker: the writer thread didn't survive the fork and pooled connections
+    # must not be shared with the parent (they are dropped without closing the parent's)
+    def after_fork(self) -> None:
+        self._lock = threading.Lock()
+        for engine in self._engines.values():
+            engine.dispose(close=False)
+        self._engines.clear()
+        if self.writer is not None:
+            self.writer = WriteBehindWriter(on_drop=self._evict_dropped)
+
+    # Flush queued writes, then close every pooled connection (used on shutdown)
+    def dispose(self) -> None:
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+        with self._lock:
+            for engine in self._engines.values():
+                engine.dispose()
+            self._engines.clear()
+
+# Module-level store shared by the server, the graph helpers and the eval scripts
+store = HistoryStore(cache=SessionCache(HISTORY_WINDOW) if SESSION_CACHE_ENABLED else None)
+
+# Never lose queued messages when the process exits without a clean server shutdown
+atexit.register(store.dispose)
+
+# Convenience wrapper around the shared store
+def get_history(session_id: str, database: str = "chat_history.db") -> SessionHistory:
+    return store.get_history(session_id, database)
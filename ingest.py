@@ -0,0 +1,217 @@
+# Streaming bulk ingestion of PDFs into the RAG index:
+#   python ingest.py docs/ "references/**/*.pdf" --workers 4 --prune
+#
+# extract + split (worker processes, page by page) → [bounded queue] → embed (thread) → [bounded queue] → index
+#
+# Every queue is bounded, so a stage that falls behind blocks the stages before it and memory stays flat
+# no matter how large a single PDF is. Progress is checkpointed as regular index versions: files that were
+# still in flight are recorded with the chunks indexed so far, and the next run resumes them from there
+import argparse
+import multiprocessing
+import queue
+import threading
+# Input expansion, checkpoint timing and peak memory reporting
+import glob
+import json
+import os
+import resource
+import sys
+import time
+# Type hints for better readability
+from typing import Dict, List, Sequence
+
+# Embedding batch size doubles as the number of chunks per message between stages
+from embedding_pipeline import EMBED_BATCH_SIZE
+from faiss_indexes import index_type
+from rag_manager import RAGManager, iter_pdf_chunks, tag_chunk
+
+# Extraction worker processes (pdfminer is pure Python, so threads wouldn't run in parallel)
+INGEST_WORKERS = int(os.getenv("MCP_INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Messages (of up to EMBED_BATCH_SIZE chunks) buffered between two stages
+INGEST_QUEUE_SIZE = int(os.getenv("MCP_INGEST_QUEUE", "16"))
+# Publish a checkpoint version at most this often (seconds); a final version is always published
+INGEST_CHECKPOINT_SECONDS = float(os.getenv("MCP_INGEST_CHECKPOINT_SECONDS", "60"))
+
+# Helper: PDF files named directly, found under directories (recursively) or matched by glob patterns
+def expand_inputs(inputs: Sequence[str]) -> List[str]:
+    found = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            matches = [os.path.join(root, name) for root, _, names in os.walk(item) for name in names]
+        else:
+            matches = glob.glob(item, recursive=True)
+        found.update(os.path.abspath(m) for m in matches if os.path.isfile(m) and m.lower().endswith(".pdf"))
+    return sorted(found)
+
+# Helper: peak resident memory of this process in MB (VmHWM is reset by exec, unlike ru_maxrss)
+def _peak_rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            return next(int(line.split()[1]) for line in f if line.startswith("VmHWM")) / 1024
+    except (OSError, StopIteration):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+# Extraction stage (runs in a worker process): stream each task's chunks page by page.
+# The first `skip` chunks of a file were indexed by an interrupted run and are not sent again
+def _extract_worker(tasks, out, text_splitter):
+    for path, skip in iter(tasks.get, None):
+        try:
+            batch, count = [], 0
+            for doc in iter_pdf_chunks(path, text_splitter):
+                count += 1
+                if count <= skip:
+                    continue
+                batch.append(doc)
+                if len(batch) >= EMBED_BATCH_SIZE:
+                    out.put(("chunks", path, batch))
+                    batch = []
+            if batch:
+                out.put(("chunks", path, batch))
+            out.put(("done", path, count))
+        except Exception as e:
+            out.put(("failed", path, f"{type(e).__name__}: {e}"))
+    out.put(("exit", None, _peak_rss_mb()))
+
+# Embedding stage (thread): embed each batch through the cached pipeline and pass it on in order.
+# Ends with None once every worker has exited (or died); worker peak memory is collected into `peaks`
+def _embed_stage(rag, inbox, outbox, workers, peaks, errors):
+    try:
+        exited = 0
+        while exited < len(workers):
+            try:
+                kind, path, payload = inbox.get(timeout=1)
+            except queue.Empty:
+                if not any(worker.is_alive() for worker in workers):
+                    break
+                continue
+            if kind == "exit":
+                exited += 1
+                peaks.append(payload)
+            elif kind == "chunks":
+                vectors = rag.pipeline.embed([doc.page_content for doc in payload])
+                outbox.put(("chunks", path, (payload, vectors)))
+            else:
+                outbox.put((kind, path, payload))
+    except Exception as e:
+        errors.append(e)
+    finally:
+        outbox.put(None)
+
+# Stream `paths` into the index at index_path. Returns the same stats as RAGManager.ingest plus
+# resumed/failed file counts, wall time and peak memory of the indexing process and of the extraction workers
+def stream_ingest(paths: Sequence[str], index_path: str = "faiss_index", workers: int = INGEST_WORKERS,
+                  prune: bool = False, rag: RAGManager = None) -> Dict[str, object]:
+    started = time.perf_counter()
+    rag = rag or RAGManager(index_path)
+    if rag._current_version(index_path):
+        rag.load_vectorstore(index_path, writable=True)
+    existed = rag.vectorstore is not None
+
+    sources = rag.manifest["sources"]
+    stats = {"unchanged": 0, "added": 0, "updated": 0, "resumed": 0, "removed": 0, "failed": 0,
+             "chunks_added": 0, "chunks_removed": 0}
+    stale_ids: List[str] = []
+    tasks = []
+
+    # Plan: skip unchanged files, resume interrupted ones, tombstone the old chunks of changed ones
+    for path in paths:
+        key, entry = rag._check_source(path)
+        if entry is None:
+            stats["unchanged"] += 1
+            continue
+        previous = sources.get(key)
+        if previous and not previous.get("complete", True) and previous["hash"] == entry["hash"]:
+            tasks.append((key, len(previous["ids"])))
+            stats["resumed"] += 1
+            continue
+        if previous:
+            stale_ids.extend(previous["ids"])
+            stats["updated"] += 1
+        else:
+            stats["added"] += 1
+        sources[key] = {**entry, "complete": False}
+        tasks.append((key, 0))
+    if prune:
+        requested = {os.path.abspath(path) for path in paths}
+        for key in [k for k in sources if k not in requested]:
+            stale_ids.extend(sources.pop(key)["ids"])
+            rag.manifest["tombstones"][key] = time.time()
+            stats["removed"] += 1
+    if stale_ids and rag.vectorstore is not None:
+        rag._drop_chunks(stale_ids)
+        stats["chunks_removed"] = len(stale_ids)
+
+    if tasks:
+        # Spawn context, like the embedding pool (torch is not fork-safe once initialised)
+        context = multiprocessing.get_context("spawn")
+        task_queue, extracted = context.Queue(), context.Queue(maxsize=INGEST_QUEUE_SIZE)
+        for task in tasks:
+            task_queue.put(task)
+        processes = [context.Process(target=_extract_worker, args=(task_queue, extracted, rag.text_splitter), daemon=True)
+                     for _ in range(max(1, min(workers, len(tasks))))]
+        for process in processes:
+            task_queue.put(None)
+            process.start()
+        embedded, peaks, errors = queue.Queue(maxsize=INGEST_QUEUE_SIZE), [], []
+        embedder = threading.Thread(target=_embed_stage, args=(rag, extracted, embedded, processes, peaks, errors),
+                                    daemon=True)
+        embedder.start()
+
+        # Index stage (this thread): the only writer of the vectorstore and the manifest
+        last_checkpoint, finished = time.monotonic(), 0
+        for kind, key, payload in iter(embedded.get, None):
+            entry = sources[key]
+            if kind == "chunks":
+                docs, vectors = payload
+                ids = [tag_chunk(doc, key, entry["hash"], len(entry["ids"]) + i) for i, doc in enumerate(docs)]
+                rag._add_chunks(list(zip((doc.page_content for doc in docs), vectors)), [doc.metadata for doc in docs], ids)
+                entry["ids"].extend(ids)
+                stats["chunks_added"] += len(ids)
+            else:
+                finished += 1
+                if kind == "done":
+                    entry.pop("complete", None)
+                else:
+                    stats["failed"] += 1
+                print(f"[{finished}/{len(tasks)}] {key}: {'failed, ' + payload if kind == 'failed' else len(entry['ids'])}",
+                      file=sys.stderr, flush=True)
+            if time.monotonic() - last_checkpoint >= INGEST_CHECKPOINT_SECONDS and rag.vectorstore is not None:
+                rag.index_version += 1
+                rag.save_vectorstore()
+                last_checkpoint = time.monotonic()
+
+        embedder.join()
+        for process in processes:
+            process.join()
+        if errors:
+            raise errors[0]
+        # Files a crashed worker never reported on stay incomplete (the next run resumes them)
+        stats["failed"] += len(tasks) - finished
+        stats["worker_peak_rss_mb"] = round(max(peaks, default=0), 1)
+
+    if stale_ids or tasks:
+        # A new approximate index can't be trained on the first batch alone: retrain on the full corpus
+        if not existed and rag.vectorstore is not None and index_type(rag.vectorstore.index) != rag.index_type:
+            rag._rebuild_without([], [], [])
+        if rag.vectorstore is not None:
+            rag.index_version += 1
+            rag.save_vectorstore()
+
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    stats["peak_rss_mb"] = round(_peak_rss_mb(), 1)
+    return stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream PDFs into the RAG index (incremental and resumable)")
+    parser.add_argument("inputs", nargs="+", help="PDF files, directories (searched recursively) or glob patterns")
+    parser.add_argument("--index", default="faiss_index", help="Index directory")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="Extraction worker processes")
+    parser.add_argument("--prune", action="store_true", help="Remove indexed sources that are not among the inputs")
+    args = parser.parse_args()
+
+    pdfs = expand_inputs(args.inputs)
+    if not pdfs:
+        parser.error("no PDF files found")
+    result = stream_ingest(pdfs, args.index, workers=args.workers, prune=args.prune)
+    print(json.dumps(result))
+    sys.exit(1 if result["failed"] else 0)
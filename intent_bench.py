@@ -0,0 +1,58 @@
+# Import argparse to configure vocabulary sizes from the command line
+import argparse
+# Deterministic synthetic vocabulary
+import random
+import string
+# Accurate micro-timings
+import timeit
+
+from intent_matcher import INTENT_TERMS, KeywordMatcher
+
+SHORT_MESSAGE = "Can I take ibuprofen together with paracetamol for my fever?"
+# A long patient narrative (~20k characters) built from a realistic sentence
+LONG_MESSAGE = ("I have had a headache and some pain in my back since Monday, the fever comes and goes. " * 230)
+
+# Helper: knowledge table padded with synthetic drug and symptom names up to `size` terms
+def synthetic_table(size):
+    rng = random.Random(42)
+    table = {category: list(terms) for category, terms in INTENT_TERMS.items()}
+    while sum(len(terms) for terms in table.values()) < size:
+        word = "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(6, 12)))
+        table["medication" if rng.random() < 0.6 else "symptom"].append(word)
+    return table
+
+# Baseline: what the nodes used to do (lowercase + one `in` scan per term, per category)
+def naive_match(table, message):
+    msg = message.lower()
+    return {category: [t for t in terms if t in msg] for category, terms in table.items()}
+
+# Helper: average microseconds per call
+def per_call_us(func, number):
+    return min(timeit.repeat(func, number=number, repeat=3)) / number * 1e6
+
+def run_benchmark(sizes):
+    """
+    Per-message matching cost for KeywordMatcher in both of its modes (term-by-term scan and
+    Aho-Corasick automaton) vs. the naive per-category scans, on a short question and a ~20k character
+    message, as the vocabulary grows. The "picked" column is the mode KeywordMatcher chooses for that size.
+    """
+    print(f"{'terms':>7} {'message':>8} {'naive us':>12} {'scan us':>12} {'automaton us':>13} {'picked':>10}")
+    for size in sizes:
+        table = synthetic_table(size)
+        matcher = KeywordMatcher(table)
+        # Same table forced into each mode
+        modes = {mode: KeywordMatcher(table, mode=mode) for mode in ("scan", "automaton")}
+        for label, message, number in (("short", SHORT_MESSAGE, 2000), ("long", LONG_MESSAGE, 5)):
+            # Sanity check: every approach must find the same terms
+            expected = {c: t for c, t in naive_match(table, message).items() if t}
+            assert all(m.match(message).categories == expected for m in modes.values())
+            naive = per_call_us(lambda: naive_match(table, message), number)
+            scan = per_call_us(lambda: modes["scan"].match(message), number)
+            automaton = per_call_us(lambda: modes["automaton"].match(message), number)
+            print(f"{len(matcher):>7} {label:>8} {naive:>12.1f} {scan:>12.1f} {automaton:>13.1f} {matcher.mode:>10}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Intent matcher microbenchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    args = parser.parse_args()
+    run_benchmark(args.sizes)
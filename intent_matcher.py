@@ -0,0 +1,155 @@
+# deque drives the breadth-first construction of the Aho-Corasick failure links
+from collections import deque
+# Type hints for better readability
+from typing import Dict, List, Optional, Sequence, Tuple
+# Stable table fingerprint (hash() of strings changes with every process)
+import hashlib
+import json
+
+# Keyword knowledge table: category → terms. Edit this (not the agents) to teach the graph new words
+INTENT_TERMS: Dict[str, List[str]] = {
+    "medication": ["take", "dose", "mg", "ibuprofen", "paracetamol"],
+    "symptom": ["fever", "headache", "pain", "hurt"],
+    "modifier": ["together"],  # Changes how ToolAgent phrases a medication answer
+}
+
+# Routing rules in priority order: (category, intent, metadata key listing the matched terms)
+INTENT_RULES: List[Tuple[str, str, str]] = [
+    ("medication", "medication_inquiry", "detected_terms"),
+    ("symptom", "symptom_report", "detected_symptoms"),
+]
+
+# Result of one scan: every matched term (in knowledge-table order) grouped by category
+class MatchResult:
+    __slots__ = ("terms", "categories")
+
+    def __init__(self, terms: List[str], categories: Dict[str, List[str]]):
+        self.terms = terms            # All matched terms
+        self.categories = categories  # category → matched terms of that category
+
+    # True if any term of the category was found
+    def has(self, category: str) -> bool:
+        return category in self.categories
+
+    # Matched terms of one category (empty list if none)
+    def category_terms(self, category: str) -> List[str]:
+        return self.categories.get(category, [])
+
+    # True if the given term was found
+    def __contains__(self, term: str) -> bool:
+        return term in self.terms
+
+    # Stable, hashable summary of the match (e.g. for cache keys)
+    def signature(self) -> Tuple[str, ...]:
+        return tuple(self.terms)
+
+# Multi-keyword matcher compiled from the knowledge table. Matches the same substrings as `term in message`
+# for every term. Small tables (like the built-in one) are scanned term by term with `in`, which runs in C
+# and beats any Python-level automaton; past SCAN_MAX_TERMS terms an Aho-Corasick automaton scans the
+# message once, so the cost stops growing with the table (crossover measured with intent_bench.py)
+class KeywordMatcher:
+    SCAN_MAX_TERMS = 200
+
+    # mode: "scan" or "automaton" to force one (default: picked from the table size)
+    def __init__(self, table: Dict[str, Sequence[str]] = INTENT_TERMS, mode: Optional[str] = None):
+        self.table = {category: list(terms) for category, terms in table.items()}
+
+        # Term ids follow the table order so results come back in a stable, predictable order
+        self._terms: List[Tuple[str, str]] = []  # id → (term, category)
+        seen = set()
+        for category, terms in self.table.items():
+            for term in terms:
+                term = term.lower()
+                if term and (term, category) not in seen:
+                    seen.add((term, category))
+                    self._terms.append((term, category))
+
+        # Identifies this exact table, the same in every process (used to key caches built on top of the matcher)
+        self.fingerprint = hashlib.sha256(json.dumps(self._terms).encode()).hexdigest()[:16]
+        self.mode = mode or ("scan" if len(self._terms) <= self.SCAN_MAX_TERMS else "automaton")
+        if self.mode not in ("scan", "automaton"):
+            raise ValueError(f"Unknown matcher mode: {self.mode!r} (expected 'scan' or 'automaton')")
+        self._scan_terms = [term for term, _ in self._terms]
+        if self.mode == "automaton":
+            self._build()
+
+    def _build(self) -> None:
+        # Trie: one transition dict per state; outputs[state] = ids of terms ending there
+        goto: List[Dict[str, int]] = [{}]
+        outputs: List[List[int]] = [[]]
+        for term_id, (term, _) in enumerate(self._terms):
+            state = 0
+            for char in term:
+                nxt = goto[state].get(char)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][char] = nxt
+                    goto.append({})
+                    outputs.append([])
+                state = nxt
+            outputs[state].append(term_id)
+
+        # Failure links (BFS): on a mismatch, fall back to the longest proper suffix that is a prefix.
+        # Outputs are merged along the links so each state knows every term ending at it
+        # (children of the root keep their default link to the root)
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in goto[state].items():
+                queue.append(nxt)
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[nxt] = goto[fallback].get(char, 0)
+                outputs[nxt] = outputs[nxt] + outputs[fail[nxt]]
+
+        self._goto = goto
+        self._fail = fail
+        self._outputs = outputs
+
+    # Number of terms compiled into the automaton
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    # Return every term found in the message with its category
+    def match(self, text: str) -> MatchResult:
+        text = text.lower()
+        if self.mode == "scan":
+            found = [term_id for term_id, term in enumerate(self._scan_terms) if term in text]
+        else:
+            found = sorted(self._scan(text))
+
+        terms: List[str] = []
+        categories: Dict[str, List[str]] = {}
+        for term_id in found:
+            term, category = self._terms[term_id]
+            terms.append(term)
+            categories.setdefault(category, []).append(term)
+        return MatchResult(terms, categories)
+
+    # Helper: ids of the terms found by one pass of the automaton over a lowercased message
+    def _scan(self, text: str) -> set:
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if outputs[state]:
+                found.update(outputs[state])
+        return found
+
+    # Match a whole batch of messages (no per-call setup)
+    def match_many(self, texts: Sequence[str]) -> List[MatchResult]:
+        match = self.match
+        return [match(text) for text in texts]
+
+    # Map a match to (intent, evaluation metadata) using the routing rules
+    def classify(self, match: MatchResult) -> Tuple[str, Dict[str, List[str]]]:
+        for category, intent, metadata_key in INTENT_RULES:
+            if match.has(category):
+                return intent, {metadata_key: match.category_terms(category)}
+        # Default intent if no keywords matched
+        return "general", {}
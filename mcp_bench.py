@@ -0,0 +1,370 @@
+# Import argparse to pick which benchmark to run from the command line
+import argparse
+# Import asyncio to drive many concurrent clients from a single process
+import asyncio
+# Used to point the server at a throwaway database before it is imported
+import os
+# Scratch directory for the benchmark's SQLite files (keeps chat_history.db clean)
+import tempfile
+# High resolution timer for latency measurements
+import time
+
+# Messages sent by the simulated clients (same cases as mcp_eval.py)
+BENCH_MESSAGES = [
+    "I have fever and headache",
+    "Can I take ibuprofen?",
+    "What about paracetamol?",
+]
+
+# Helper: nearest-rank percentile over a list of latency samples
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+# Helper: import the FastAPI app against a temporary chat database
+def load_app():
+    """
+    Points MCP_CHAT_DB at a scratch SQLite file, then imports the server so the benchmark never
+    writes into the real chat_history.db.
+    """
+    scratch = tempfile.mkdtemp(prefix="mcp-bench-")
+    os.environ.setdefault("MCP_CHAT_DB", f"sqlite:///{os.path.join(scratch, 'bench_chat.db')}")
+    from mcp_server import app
+    return app
+
+# One simulated client: sends its requests back to back on its own session.
+# A run tag makes every message of the run distinct (same keywords), so no turn is answered from the memo cache
+async def _client_loop(client, client_id, requests_per_client, latencies, tag=None):
+    for i in range(requests_per_client):
+        message = BENCH_MESSAGES[i % len(BENCH_MESSAGES)]
+        if tag:
+            message += f" ({tag}: client {client_id}, message {i})"
+        payload = {"message": message, "session_id": f"bench-{client_id}"}
+        start = time.perf_counter()
+        response = await client.post("/process", json=payload)
+        latencies.append(time.perf_counter() - start)
+        response.raise_for_status()
+
+# Run one concurrency level and return (throughput, p50, p99)
+async def _run_level(app, concurrency, requests_per_client, tag=None):
+    import httpx
+
+    latencies = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            _client_loop(client, c, requests_per_client, latencies, tag) for c in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, percentile(latencies, 50), percentile(latencies, 99)
+
+def run_load_test(concurrency_levels, requests_per_client):
+    """
+    Load test for /process: N concurrent clients hammer the in-process app and we report how
+    throughput and tail latency change as concurrency grows.
+    """
+    app = load_app()
+    print(f"{'clients':>8} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10}")
+    for concurrency in concurrency_levels:
+        rps, p50, p99 = asyncio.run(_run_level(app, concurrency, requests_per_client))
+        print(f"{concurrency:>8} {rps:>10.1f} {p50 * 1000:>10.2f} {p99 * 1000:>10.2f}")
+
+def run_history_benchmark(concurrency, requests_per_client):
+    """
+    Compares /process requests/sec with the old per-request SQLChatMessageHistory (a new engine
+    and table check on every call) against the shared pooled history store.
+    """
+    from langchain_community.chat_message_histories import SQLChatMessageHistory
+
+    app = load_app()
+    import mcp_server
+    pooled = mcp_server.get_history
+
+    # "Before": build a fresh SQLChatMessageHistory for every request, like the original handlers
+    def legacy(session_id, database):
+        return SQLChatMessageHistory(session_id=session_id, connection=database)
+
+    print(f"{'store':>8} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10}")
+    for label, factory in (("legacy", legacy), ("pooled", pooled)):
+        mcp_server.get_history = factory
+        try:
+            rps, p50, p99 = asyncio.run(_run_level(app, concurrency, requests_per_client))
+        finally:
+            mcp_server.get_history = pooled
+        print(f"{label:>8} {rps:>10.1f} {p50 * 1000:>10.2f} {p99 * 1000:>10.2f}")
+
+def run_durability_benchmark(concurrency, requests_per_client):
+    """
+    Compares /process latency with synchronous history commits against the batched write-behind
+    writer, then checks that every message written during the batched run was persisted.
+    """
+    app = load_app()
+    import history_store
+
+    print(f"{'mode':>8} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10}")
+    for mode in ("sync", "batched"):
+        history_store.store.set_durability(mode)
+        rps, p50, p99 = asyncio.run(_run_level(app, concurrency, requests_per_client))
+        print(f"{mode:>8} {rps:>10.1f} {p50 * 1000:>10.2f} {p99 * 1000:>10.2f}")
+
+    # Drain the writer and count what landed on disk: one stored user message per request per mode
+    history_store.store.set_durability("sync")
+    engine = history_store.store.engine(os.environ["MCP_CHAT_DB"])
+    with engine.connect() as conn:
+        stored = conn.execute(history_store.text(
+            "SELECT COUNT(*) FROM message_store WHERE message LIKE '{\"type\": \"human\"%'"
+        )).scalar()
+    print(f"persisted {stored} / {2 * concurrency * requests_per_client} user messages")
+
+def run_memo_benchmark(iterations):
+    """
+    Cost of answering a repeated FAQ: a full graph run vs. a memo-cache hit (match scan + lookup).
+    """
+    from langchain_core.messages import HumanMessage
+    import multi_agent_graph as mag
+
+    print(f"{'message':>28} {'graph us':>10} {'memo us':>10}")
+    for message in BENCH_MESSAGES:
+        state = {"messages": [HumanMessage(content=message)], "memory": None, "response": ""}
+        mag.remember_response(message, mag.graph.invoke(state))
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            mag.graph.invoke(state)
+        graph_us = (time.perf_counter() - start) / iterations * 1e6
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            mag.lookup_response(message, mag.matcher.match(message), 1)
+        memo_us = (time.perf_counter() - start) / iterations * 1e6
+        print(f"{message:>28} {graph_us:>10.1f} {memo_us:>10.1f}")
+    print(mag.response_cache.stats())
+
+# Send `total` messages to /process_batch in chunks of `batch_size`, spread over `sessions` sessions
+async def _run_batches(app, batch_size, total, sessions):
+    import httpx
+
+    items = [{"message": BENCH_MESSAGES[i % len(BENCH_MESSAGES)], "session_id": f"batch-{batch_size}-{i % sessions}"}
+             for i in range(total)]
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        start = time.perf_counter()
+        for offset in range(0, total, batch_size):
+            response = await client.post("/process_batch", json=items[offset:offset + batch_size])
+            response.raise_for_status()
+        return total / (time.perf_counter() - start)
+
+def run_batch_benchmark(sizes, total, sessions):
+    """
+    Messages/sec through /process_batch for different batch sizes (batch size 1 ≈ one call per message).
+    """
+    app = load_app()
+    print(f"{'batch':>8} {'msg/s':>10}")
+    for size in sizes:
+        print(f"{size:>8} {asyncio.run(_run_batches(app, size, total, sessions)):>10.1f}")
+
+# One spike request: returns (session kind, status, latency); 503s are expected and counted, not raised
+async def _spike_request(client, session_id, kind, message):
+    start = time.perf_counter()
+    response = await client.post("/process", json={"message": message, "session_id": session_id})
+    return kind, response.status_code, time.perf_counter() - start
+
+async def _run_spike(app, clients, chatty):
+    import httpx
+
+    # `chatty` requests from one session arrive first, then one request from each of `clients` sessions
+    calls = [("chatty", "spike-chatty") for _ in range(chatty)] + [("other", f"spike-{c}") for c in range(clients)]
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        start = time.perf_counter()
+        results = await asyncio.gather(*(
+            _spike_request(client, session_id, kind, BENCH_MESSAGES[i % len(BENCH_MESSAGES)])
+            for i, (kind, session_id) in enumerate(calls)
+        ))
+        return results, time.perf_counter() - start
+
+def run_spike_benchmark(clients, chatty, limits):
+    """
+    A burst of concurrent /process requests (one chatty session plus many single-request sessions),
+    served without admission control and with each concurrency limit. Reports served and shed
+    requests, and latency of the served requests for the other sessions.
+    """
+    app = load_app()
+    import mcp_server
+    from admission import AdmissionController
+
+    print(f"{'limit':>8} {'served':>8} {'shed':>8} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'chatty':>8}")
+    for limit in limits:
+        mcp_server.admission = AdmissionController(max_concurrent=limit)
+        results, elapsed = asyncio.run(_run_spike(app, clients, chatty))
+        served = [r for r in results if r[1] == 200]
+        others = [latency for kind, status, latency in served if kind == "other"]
+        chatty_served = sum(1 for kind, _, _ in served if kind == "chatty")
+        print(f"{limit or 'off':>8} {len(served):>8} {len(results) - len(served):>8} {len(served) / elapsed:>10.1f} "
+              f"{percentile(others, 50) * 1000:>10.2f} {percentile(others, 99) * 1000:>10.2f} {chatty_served:>8}")
+
+# Helper: write `days` of simulated traffic into a fresh history database, backdated so that day d's rows
+# are d days old at the end; with maintain=True a maintenance pass runs at the end of every simulated day
+def _simulate_history(database, days, sessions_per_day, turns, maintain, retention_days, max_messages):
+    import json
+    import random
+    import history_store
+    import history_maintenance
+    from langchain_core.messages import AIMessage, HumanMessage, message_to_dict
+
+    store = history_store.HistoryStore()
+    engine = store.engine(database)
+    rng = random.Random(0)
+    human = [json.dumps(message_to_dict(HumanMessage(content=text))) for text in BENCH_MESSAGES]
+    answer = json.dumps(message_to_dict(AIMessage(content="Paracetamol: 500mg every 6 hours (max 4000mg/day)")))
+    # A few regulars come back every day and keep growing; everyone else is a one-day session
+    regulars = [f"regular-{i}" for i in range(max(1, sessions_per_day // 20))]
+    end = time.time()
+    insert = history_store.text(
+        "INSERT INTO message_store (session_id, message, created_at) VALUES (:sid, :message, :at)")
+
+    for day in range(days):
+        at = end - (days - day) * 86400
+        rows = []
+        for session_id in [f"day{day}-{i}" for i in range(sessions_per_day)] + regulars:
+            for turn in range(rng.randint(1, turns)):
+                rows.append({"sid": session_id, "message": human[turn % len(human)], "at": at})
+                rows.append({"sid": session_id, "message": answer, "at": at})
+        with engine.begin() as conn:
+            conn.execute(insert, rows)
+        if maintain:
+            history_maintenance.maintain(database, retention_days, max_messages, now=at + 86399, store=store)
+
+    # Latency of loading a regular's context (the sessions that grow without compaction)
+    samples = []
+    for _ in range(200):
+        history = store.get_history(rng.choice(regulars), database)
+        start = time.perf_counter()
+        history.load_context(history_store.HISTORY_WINDOW)
+        samples.append(time.perf_counter() - start)
+    with engine.connect() as conn:
+        rows = conn.execute(history_store.text("SELECT COUNT(*) FROM message_store")).scalar()
+    size = history_maintenance.database_size(engine)
+    store.dispose()
+    return size, rows, samples
+
+def run_maintenance_benchmark(days, sessions_per_day, turns, retention_days, max_messages):
+    """
+    Simulates months of chat traffic (one-day sessions plus regulars that return every day) with and
+    without a daily history maintenance pass. Reports database size, stored rows and load_context
+    latency for the long-running sessions at the end of the period.
+    """
+    directory = tempfile.mkdtemp(prefix="mcp-maintenance-")
+    print(f"{'maintenance':>12} {'size MB':>10} {'rows':>10} {'p50 ms':>10} {'p99 ms':>10}")
+    for maintain in (False, True):
+        database = os.path.join(directory, f"history-{'on' if maintain else 'off'}.db")
+        size, rows, samples = _simulate_history(database, days, sessions_per_day, turns, maintain,
+                                                retention_days, max_messages)
+        print(f"{'on' if maintain else 'off':>12} {size / 2 ** 20:>10.2f} {rows:>10} "
+              f"{percentile(samples, 50) * 1000:>10.3f} {percentile(samples, 99) * 1000:>10.3f}")
+
+def run_profile_benchmark(concurrency, requests_per_client, intervals):
+    """
+    Cost of the profiling hook on /process: no profiling middleware (MCP_PROFILE_TOKEN unset), the
+    middleware installed with no session running, and a session sampling the whole run at each
+    interval. Every message is distinct, so each turn runs the graph instead of hitting the memo cache.
+    Also prints the exact per-node times and the sampled per-node and SQLite/FAISS breakdown of the last
+    sampled run.
+    """
+    app = load_app()
+    import profiling
+
+    # Warm-up run so the first mode doesn't pay for cold caches
+    asyncio.run(_run_level(app, concurrency, requests_per_client, tag="warmup"))
+
+    profiler = profiling.Profiler()
+    hooked = profiling.ProfilingMiddleware(app, profiler)
+    print(f"{'mode':>12} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'samples':>8}")
+    for label, target in (("off", app), ("idle", hooked)):
+        rps, p50, p99 = asyncio.run(_run_level(target, concurrency, requests_per_client, tag=label))
+        print(f"{label:>12} {rps:>10.1f} {p50 * 1000:>10.2f} {p99 * 1000:>10.2f} {'-':>8}")
+
+    summary = None
+    for interval in intervals:
+        profiler.interval = interval / 1000
+        profiler.start(requests=0, seconds=profiling.MAX_SECONDS)
+        rps, p50, p99 = asyncio.run(_run_level(hooked, concurrency, requests_per_client, tag=f"{interval:g}ms"))
+        summary = profiler.stop().summary()
+        print(f"{f'{interval:g}ms':>12} {rps:>10.1f} {p50 * 1000:>10.2f} {p99 * 1000:>10.2f} {summary['samples']:>8}")
+
+    if summary:
+        print("node times: " + ", ".join(f"{name} {value['runs']}x {value['mean_ms']:.3f}ms"
+                                         for name, value in summary["node_times"].items()))
+        for group in ("nodes", "io"):
+            print(group + ": " + ", ".join(f"{name} {value['share']:.1%}" for name, value in summary[group].items()))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Performance benchmarks for the MCP server")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    # `python mcp_bench.py load` → throughput vs. number of concurrent clients
+    load = subparsers.add_parser("load", help="Concurrent-client load test for /process")
+    load.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    load.add_argument("--requests", type=int, default=50, help="Requests sent by each client")
+
+    # `python mcp_bench.py history` → per-request SQLChatMessageHistory vs. pooled history store
+    history = subparsers.add_parser("history", help="Compare legacy and pooled chat-history stores on /process")
+    history.add_argument("--concurrency", type=int, default=16)
+    history.add_argument("--requests", type=int, default=50, help="Requests sent by each client")
+
+    # `python mcp_bench.py durability` → synchronous commits vs. write-behind batching
+    durability = subparsers.add_parser("durability", help="Compare sync and batched history writes on /process")
+    durability.add_argument("--concurrency", type=int, default=16)
+    durability.add_argument("--requests", type=int, default=50, help="Requests sent by each client")
+
+    # `python mcp_bench.py memo` → full graph run vs. memoized answer for repeated questions
+    memo = subparsers.add_parser("memo", help="Graph run vs. response memo cache hit")
+    memo.add_argument("--iterations", type=int, default=500)
+
+    # `python mcp_bench.py batch` → /process_batch throughput by batch size
+    batch = subparsers.add_parser("batch", help="Throughput of /process_batch for several batch sizes")
+    batch.add_argument("--sizes", type=int, nargs="+", default=[1, 32, 512])
+    batch.add_argument("--total", type=int, default=2048, help="Messages sent per batch size")
+    batch.add_argument("--sessions", type=int, default=64, help="Distinct session ids in the workload")
+
+    # `python mcp_bench.py spike` → burst of requests with and without admission control (0 = off)
+    spike = subparsers.add_parser("spike", help="Request burst with and without admission control")
+    spike.add_argument("--clients", type=int, default=256, help="Sessions sending one request each")
+    spike.add_argument("--chatty", type=int, default=64, help="Concurrent requests from one session")
+    spike.add_argument("--limits", type=int, nargs="+", default=[0, 8, 32])
+
+    # `python mcp_bench.py maintenance` → database growth over simulated months, with and without maintenance
+    maintenance = subparsers.add_parser("maintenance", help="History size and read latency with and without maintenance")
+    maintenance.add_argument("--days", type=int, default=120, help="Simulated days of traffic")
+    maintenance.add_argument("--sessions", type=int, default=200, help="New sessions per day")
+    maintenance.add_argument("--turns", type=int, default=10, help="Most turns per session per day")
+    maintenance.add_argument("--retention-days", type=float, default=30)
+    maintenance.add_argument("--max-messages", type=int, default=200)
+
+    # `python mcp_bench.py profile` → overhead of the profiling hook, off / idle / sampling
+    profile = subparsers.add_parser("profile", help="Overhead of the on-demand profiler on /process")
+    profile.add_argument("--concurrency", type=int, default=16)
+    profile.add_argument("--requests", type=int, default=50, help="Requests sent by each client")
+    profile.add_argument("--intervals", type=float, nargs="+", default=[5, 1], help="Sampling intervals in ms")
+
+    args = parser.parse_args()
+    if args.command == "load":
+        run_load_test(args.concurrency, args.requests)
+    elif args.command == "history":
+        run_history_benchmark(args.concurrency, args.requests)
+    elif args.command == "durability":
+        run_durability_benchmark(args.concurrency, args.requests)
+    elif args.command == "memo":
+        run_memo_benchmark(args.iterations)
+    elif args.command == "batch":
+        run_batch_benchmark(args.sizes, args.total, args.sessions)
+    elif args.command == "spike":
+        run_spike_benchmark(args.clients, args.chatty, args.limits)
+    elif args.command == "maintenance":
+        run_maintenance_benchmark(args.days, args.sessions, args.turns, args.retention_days, args.max_messages)
+    elif args.command == "profile":
+        run_profile_benchmark(args.concurrency, args.requests, args.intervals)
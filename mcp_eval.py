@@ -1,18 +1,22 @@
-from langsmith import Client
-from langchain.smith import RunEvalConfig
-from mcp_server import app
-from fastapi.testclient import TestClient
 import os
 import time
 
-# Set environment variables
-# These environment variables are required to enable tracing and API calls to LangChain's API
-os.environ["LANGCHAIN_API_KEY"] = "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"  # Setting the API key for LangChain
-os.environ["LANGCHAIN_TRACING_V2"] = "true"  # Enabling tracing to collect detailed information about API calls
+# Test cases (also run offline, with latency, by eval_bench.py)
+MCP_TEST_CASES = [
+    {"message": "I have fever and headache", "expected": "flu"},  # Simulating a user asking about flu symptoms
+    {"message": "Can I take ibuprofen?", "expected": "200-400mg"},  # User asking for the dosage of ibuprofen
+    {"message": "What about paracetamol?", "expected": "500mg"}  # User asking for the dosage of paracetamol
+]
 
-# Initialize clients
-client = Client()  # Initializing LangChain's client to interact with LangChain API
-test_client = TestClient(app)  # Initializing FastAPI's TestClient to simulate HTTP requests to the FastAPI app
+# Helper: LangSmith client, created on first use so the evaluators and test cases import without LangSmith
+def langsmith_client():
+    from langsmith import Client
+
+    # Set environment variables
+    # These environment variables are required to enable tracing and API calls to LangChain's API
+    os.environ["LANGCHAIN_API_KEY"] = "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"  # Setting the API key for LangChain
+    os.environ["LANGCHAIN_TRACING_V2"] = "true"  # Enabling tracing to collect detailed information about API calls
+    return Client()  # Initializing LangChain's client to interact with LangChain API
 
 # Custom evaluators
 def medical_accuracy(run, example):
@@ -35,6 +39,14 @@ def run_mcp_evaluation():
     Function that sets up and runs the evaluation of the MCP (Medical Conversation Processor).
     It creates the dataset, adds examples, and evaluates the model using custom evaluators.
     """
+    from langchain.smith import RunEvalConfig
+    from fastapi.testclient import TestClient
+    from mcp_server import app
+
+    # Initialize clients
+    client = langsmith_client()
+    test_client = TestClient(app)  # Initializing FastAPI's TestClient to simulate HTTP requests to the FastAPI app
+
     timestamp = str(int(time.time()))[-6:]  # Generating a unique timestamp (last 6 digits of current time)
     dataset_name = f"MCP-Medical-Eval-{timestamp}"  # Generating a unique dataset name with the timestamp
     project_name = f"mcp-eval-{timestamp}"  # Generating a unique project name
@@ -46,16 +58,9 @@ def run_mcp_evaluation():
         # If dataset creation fails (because it might already exist), fetch the existing dataset
         dataset = list(client.list_datasets(dataset_name=dataset_name))[0]
 
-    # Test cases
-    test_cases = [
-        {"message": "I have fever and headache", "expected": "flu"},  # Simulating a user asking about flu symptoms
-        {"message": "Can I take ibuprofen?", "expected": "200-400mg"},  # User asking for the dosage of ibuprofen
-        {"message": "What about paracetamol?", "expected": "500mg"}  # User asking for the dosage of paracetamol
-    ]
-
     # Add examples
     # Loop through each test case, creating examples in the dataset for evaluation
-    for case in test_cases:
+    for case in MCP_TEST_CASES:
         client.create_example(
             inputs={"message": case["message"]},  # Using the message as input
             outputs={"expected": case["expected"]},  # Using the expected output (e.g., diagnosis or dosage) as expected output
@@ -1,32 +1,191 @@
+# Startup phase timings and readiness (imported first so the import phase is timed from here)
+import startup
+
 # Import FastAPI framework to create the server and define API endpoints
 from fastapi import FastAPI, Request, Form, HTTPException
 
-# Import HTMLResponse to be able to return raw HTML pages
-from fastapi.responses import HTMLResponse
+# Import HTMLResponse to be able to return raw HTML pages, StreamingResponse for server-sent events,
+# PlainTextResponse for the Prometheus /metrics page, JSONResponse for the not-ready /health answer,
+# Response for profile downloads
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
+
+# BackgroundTask runs after the response has been fully sent (used to persist streamed turns)
+from starlette.background import BackgroundTask
 
 # Import BaseModel from Pydantic to define request data models for validation
 from pydantic import BaseModel
 
-# Import HumanMessage class to wrap user input as a message for the agent
-from langchain_core.messages import HumanMessage
+# Import message classes to wrap user input (and memoized answers) as messages for the agent
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+# Type hints for the request/response models and helpers
+from typing import Any, AsyncIterator, List, Optional, Tuple
+
+# Run the sessions of a batch concurrently; json encodes server-sent events; argparse for the serve modes;
+# time measures how long each request holds its admission slot
+import argparse
+import asyncio
+import json
+import time
 
-# Import SQLChatMessageHistory to store conversation history in a local database (SQLite)
-from langchain_community.chat_message_histories import SQLChatMessageHistory
+# Import the shared, pooled chat-history store (one SQLite engine per database for the whole process)
+import history_store
+from history_store import HISTORY_WINDOW, BufferedHistory, get_history
 
 # Import uvicorn server to run FastAPI application locally
 import uvicorn
 
+# Read configuration (database location) from environment variables
+import os
+
 # Import the graph object (likely your agent graph) from a local file called multi_agent_graph.py
-from multi_agent_graph import graph
+# run_blocking/persist_message keep the SQLite reads and writes off the event loop
+# lookup_response/remember_response memoize deterministic answers for repeated questions
+from multi_agent_graph import graph, matcher, run_blocking, persist_message, lookup_response, remember_response
+from multi_agent_graph import IO_EXECUTOR, response_cache
+
+# Built-in instrumentation: latency histograms, counters and gauges rendered on /metrics
+from metrics import REGISTRY, REQUESTS, INTENTS, TURN_LATENCY
+
+# Concurrency limit + bounded, session-fair wait queue; shed requests get 503 with Retry-After
+from admission import AdmissionController, Overloaded
+# Retention, compaction and vacuum of the chat-history database in a background thread
+from history_maintenance import MaintenanceWorker
+# On-demand stack-sampling profiler (only wired in when MCP_PROFILE_TOKEN is set)
+import profiling
+
+# SQLite database that stores the server's chat history (override with MCP_CHAT_DB)
+CHAT_DB_URL = os.getenv("MCP_CHAT_DB", "sqlite:///chat_history.db")
+# Sessions of one /process_batch call that run at once (they share the batch's single turn slot)
+BATCH_CONCURRENCY = int(os.getenv("MCP_BATCH_CONCURRENCY", "4"))
 
 # Initialize a FastAPI app instance with a title
 app = FastAPI(title="Medical Agent MCP Server")
 
+# Admission control for every endpoint that runs a turn (per worker process, see admission.py)
+admission = AdmissionController()
+
+# History maintenance (started per worker process; a lease in the database lets one of them run each pass)
+maintenance = MaintenanceWorker([CHAT_DB_URL])
+
+# Request profiling: no middleware at all unless a token is configured (zero cost when off)
+profiler = profiling.Profiler() if profiling.TOKEN else None
+if profiler is not None:
+    app.add_middleware(profiling.ProfilingMiddleware, profiler=profiler)
+
+# 📊 Gauges read at scrape time: caches, the write-behind queue and the I/O pool backlog
+def _session_cache_stat(name: str):
+    return lambda: history_store.store.cache.stats()[name] if history_store.store.cache else 0
+
+# Current sizes are gauges; cumulative counts are counters (so rate() works on them)
+for _stat in ("sessions", "bytes"):
+    REGISTRY.gauge(f"mcp_session_cache_{_stat}", f"Session cache {_stat}", _session_cache_stat(_stat))
+for _stat in ("hits", "misses", "evictions", "expirations"):
+    REGISTRY.callback_counter(f"mcp_session_cache_{_stat}_total", f"Session cache {_stat}", _session_cache_stat(_stat))
+REGISTRY.gauge("mcp_response_cache_entries", "Response memo cache entries", lambda: response_cache.stats()["entries"])
+for _stat in ("hits", "misses", "evictions"):
+    REGISTRY.callback_counter(f"mcp_response_cache_{_stat}_total", f"Response memo cache {_stat}",
+                              lambda name=_stat: response_cache.stats()[name])
+REGISTRY.gauge("mcp_history_writer_pending", "Chat-history rows waiting for the write-behind writer",
+               lambda: history_store.store.writer.pending if history_store.store.writer else 0)
+REGISTRY.callback_counter("mcp_history_writer_dropped_total", "Chat-history rows dropped after failed write retries",
+                          lambda: history_store.store.writer.dropped if history_store.store.writer else 0)
+REGISTRY.gauge("mcp_io_executor_queue", "Blocking I/O calls waiting for a thread in the I/O pool",
+               lambda: IO_EXECUTOR._work_queue.qsize())
+REGISTRY.gauge("mcp_admission_in_flight", "Turns currently running", lambda: admission.in_flight)
+REGISTRY.gauge("mcp_admission_queued", "Requests waiting for a turn slot", lambda: admission.queued)
+REGISTRY.gauge("mcp_worker_pid", "Process id of the worker that rendered this scrape", os.getpid)
+REGISTRY.callback_counter("mcp_admission_shed_total", "Requests shed with 503, by reason",
+                          lambda: {(reason,): count for reason, count in admission.shed.items()}, labels=("reason",))
+
+# 🚦 Shed requests: 503 with a Retry-After estimated from the current backlog
+@app.exception_handler(Overloaded)
+async def overloaded(request: Request, exc: Overloaded):
+    return JSONResponse({"status": "overloaded", "reason": exc.reason, "detail": str(exc)},
+                        status_code=503, headers={"Retry-After": str(exc.retry_after)})
+
 # 📦 Define a request model for the JSON API endpoint
 class QueryRequest(BaseModel):
     message: str                   # Field: the message that user wants to send
     session_id: str = "default"     # Optional Field: session_id, default value is "default"
 
+# Response model for one entry of a /process_batch call
+class BatchResultItem(BaseModel):
+    session_id: str
+    status: str                     # "success" or "error"
+    response: Optional[str] = None  # Agent output (success only)
+    detail: Optional[str] = None    # Error message (error only)
+
+# ⚙️ Resume a session: latest summary checkpoint + bounded window of the messages after it.
+# Hot sessions are served from the in-memory cache; only misses go to SQLite.
+# Plain LangChain histories (e.g. SQLChatMessageHistory) have no checkpoints: use their last messages
+async def load_context(memory) -> Tuple[Optional[BaseMessage], List[BaseMessage]]:
+    if not hasattr(memory, "load_context"):
+        messages = await run_blocking(lambda: memory.messages)
+        return None, messages[-HISTORY_WINDOW:]
+    context = memory.cached_context(HISTORY_WINDOW)
+    if context is None:
+        context = await run_blocking(memory.load_context, HISTORY_WINDOW, check_cache=False)
+    return context
+
+# ⚙️ One conversation turn on top of an already loaded context, as a stream of node-level events:
+# ("intent", ...) when the intent is detected, ("response", ...) when the answer is ready,
+# ("summary", ...) if the conversation was summarized, and finally ("result", (result, new_context))
+# where new_context is the session context as it looks after this turn
+async def stream_turn(message: str, matches, memory, context) -> AsyncIterator[Tuple[str, Any]]:
+    summary, history = context
+
+    # Store the user's message too, so the next request can see it
+    human = HumanMessage(content=message)
+    await persist_message(memory, human)
+    messages = ([summary] if summary else []) + history + [human]
+
+    # Repeated question: answer from the memo cache, but still record the answer in memory
+    result = lookup_response(message, matches, len(messages))
+    if result is not None:
+        with TURN_LATENCY.time("memo"):
+            yield "intent", {"intent": result["intent"], "metadata": result["evaluation_metadata"]}
+            await persist_message(memory, AIMessage(content=result["response"]))
+            yield "response", {"response": result["response"]}
+    else:
+        # Stream the async graph: node updates become events, the last full state is the result
+        with TURN_LATENCY.time("graph"):
+            state = {"messages": messages, "matches": matches, "memory": memory, "response": ""}
+            async for mode, chunk in graph.astream(state, stream_mode=["updates", "values"]):
+                if mode == "values":
+                    result = chunk
+                    continue
+                for node, update in chunk.items():
+                    if node == "intent_classifier":
+                        yield "intent", {"intent": update["intent"], "metadata": update["evaluation_metadata"]}
+                    elif node == "tool_agent":
+                        yield "response", {"response": update["response"]}
+                    elif node == "summary_agent":
+                        yield "summary", {"summary": update["summary"]}
+            remember_response(message, result)
+    INTENTS.inc(result["intent"])
+
+    # A summary turn starts a fresh window after the new checkpoint
+    if "summary_length" in result.get("evaluation_metadata", {}):
+        yield "result", (result, (AIMessage(content=result["summary"]), []))
+    else:
+        yield "result", (result, (summary, (history + [human, AIMessage(content=result["response"])])[-HISTORY_WINDOW:]))
+
+# ⚙️ Same turn without the intermediate events: returns (result, new_context)
+async def run_turn(message: str, matches, memory, context) -> Tuple[dict, Tuple[Optional[BaseMessage], List[BaseMessage]]]:
+    async for kind, payload in stream_turn(message, matches, memory, context):
+        if kind == "result":
+            return payload
+
+# ⚙️ Shared async pipeline used by both the form and the JSON endpoints
+async def run_graph(message: str, session_id: str) -> dict:
+    # Cheap per-session handle on the pooled engine (no engine/table setup per request)
+    memory = get_history(session_id, CHAT_DB_URL)
+
+    # Scan the message once; the result keys the memo cache and is handed to the graph
+    result, _ = await run_turn(message, matcher.match(message), memory, await load_context(memory))
+    return result
+
 # 🏠 Define the home route (/) that returns an HTML page
 @app.get("/", response_class=HTMLResponse)
 async def home():
@@ -93,13 +252,16 @@ async def home():
 
 # 📩 Handle the form submission and display the agent's response
 @app.post("/process_form", response_class=HTMLResponse)
-async def handle_form(message: str = Form(...)):
+async def handle_form(request: Request, message: str = Form(...)):
+    REQUESTS.inc("/process_form")
+    # Wait for a turn slot (outside the try: a shed request becomes a 503, not an error page).
+    # The form shares one chat session, so fairness is per client address instead
+    admission_key = f"form:{request.client.host if request.client else ''}"
+    await admission.acquire(admission_key)
+    started = time.perf_counter()
     try:
-        # Create a memory object to track the chat history, using SQLite database
-        memory = SQLChatMessageHistory(session_id="form_session", connection="sqlite:///chat_history.db")
-        
-        # Invoke the graph (agent) passing the message as a HumanMessage, memory object, and an empty response
-        result = graph.invoke({"messages": [HumanMessage(content=message)], "memory": memory, "response": ""})
+        # Run the agent graph for the shared form session (memory lives in the SQLite database)
+        result = await run_graph(message, "form_session")
         
         # Return a new HTML page showing the original message and agent's response
         return f"""
@@ -144,30 +306,228 @@ async def handle_form(message: str = Form(...)):
     except Exception as e:
         # In case of any error, return an error message with a 500 status code
         return HTMLResponse(f"<p>Error: {str(e)}</p><a href='/'>⬅️ Back</a>", status_code=500)
+    finally:
+        admission.release(admission_key, time.perf_counter() - started)
 
 # 🔥 Define an endpoint to process JSON POST requests (API calls)
 @app.post("/process")
 async def handle_json(request: QueryRequest):
+    REQUESTS.inc("/process")
+    # Wait for a turn slot (outside the try: a shed request becomes a 503, not a 500)
+    await admission.acquire(request.session_id)
+    started = time.perf_counter()
     try:
-        # Create a memory object for the session based on session_id provided in request
-        memory = SQLChatMessageHistory(session_id=request.session_id, connection="sqlite:///chat_history.db")
-        
-        # Invoke the agent (graph) with the message
-        result = graph.invoke({"messages": [HumanMessage(content=request.message)], "memory": memory, "response": ""})
+        # Run the agent graph with the message, using the session's SQLite-backed memory
+        result = await run_graph(request.message, request.session_id)
         
         # Return a JSON response containing the agent's output, session_id, and a success status
         return {"response": result["response"], "session_id": request.session_id, "status": "success"}
     except Exception as e:
         # If there's an error, raise an HTTPException with 500 Internal Server Error
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        admission.release(request.session_id, time.perf_counter() - started)
+
+# 🔥 Single-process serving (uvicorn mcp_server:app / --reload): warm up in the background while requests are
+# already accepted. The preforked server (python mcp_server.py --workers N) warms up before forking instead
+@app.on_event("startup")
+async def warm_up():
+    if not startup.is_ready():
+        startup.warmup_in_background()
+    maintenance.start()
+
+# 🧹 Stop history maintenance and close pooled SQLite connections when the server stops
+@app.on_event("shutdown")
+async def shutdown():
+    maintenance.stop()
+    if profiler is not None:
+        profiler.stop()
+    history_store.store.dispose()
 
-# ❤️ Define a simple health check route to see if the server is alive
+# 📚 Process many messages in one call: one classification pass over the whole list, turns grouped
+# by session (in input order within each session) and one history transaction for the batch
+@app.post("/process_batch")
+async def handle_batch(requests: List[QueryRequest], http_request: Request):
+    REQUESTS.inc("/process_batch")
+    # A batch takes one turn slot (outside the try: a shed batch becomes a 503, not a 500), queued per client
+    # address like the form; its sessions then share that slot under a batch-local semaphore, so a batch
+    # can neither exceed its share of MCP_MAX_CONCURRENCY nor be shed part-way by its own sessions
+    admission_key = f"batch:{http_request.client.host if http_request.client else ''}"
+    await admission.acquire(admission_key)
+    started = time.perf_counter()
+    try:
+        # Classify every message in one pass
+        all_matches = matcher.match_many([item.message for item in requests])
+
+        # Group item positions by session, keeping input order inside each session
+        sessions = {}
+        for index, item in enumerate(requests):
+            sessions.setdefault(item.session_id, []).append(index)
+
+        results: List[Optional[BatchResultItem]] = [None] * len(requests)
+        buffers = []
+        running = asyncio.Semaphore(max(1, BATCH_CONCURRENCY))
+
+        # Run one session's turns back to back; its writes are only collected in memory
+        async def run_session(session_id: str, indices: List[int]):
+            async with running:
+                memory = BufferedHistory(get_history(session_id, CHAT_DB_URL))
+                buffers.append(memory)
+                try:
+                    context = await load_context(memory)
+                except Exception as e:
+                    # A session whose history can't be loaded fails its own items, not the batch
+                    for index in indices:
+                        results[index] = BatchResultItem(session_id=session_id, status="error", detail=str(e))
+                    return
+                for index in indices:
+                    try:
+                        result, context = await run_turn(requests[index].message, all_matches[index], memory, context)
+                        results[index] = BatchResultItem(session_id=session_id, status="success", response=result["response"])
+                    except Exception as e:
+                        # A failing item doesn't fail the rest of the batch
+                        results[index] = BatchResultItem(session_id=session_id, status="error", detail=str(e))
+
+        await asyncio.gather(*(run_session(session_id, indices) for session_id, indices in sessions.items()))
+
+        # Persist the whole batch's history in one transaction
+        await run_blocking(history_store.store.commit, buffers)
+
+        # Results come back in input order
+        return {"results": results, "status": "success"}
+    except Exception as e:
+        # If there's an error, raise an HTTPException with 500 Internal Server Error
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        admission.release(admission_key, time.perf_counter() - started)
+
+# Helper: format one server-sent event
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# 📡 Streaming variant of /process: emits node-level events (intent, response, summary, done) as
+# server-sent events while the graph runs. The turn's history writes are buffered and committed
+# after the stream has been sent, so persistence never holds the response open
+@app.post("/process/stream")
+async def handle_stream(request: QueryRequest):
+    REQUESTS.inc("/process/stream")
+    memory = BufferedHistory(get_history(request.session_id, CHAT_DB_URL))
+
+    # Admit before the response starts (a shed request still gets a proper 503); the slot is held
+    # until the stream ends, and released exactly once whichever way it ends
+    await admission.acquire(request.session_id)
+    started, released = time.perf_counter(), False
+
+    def release() -> None:
+        nonlocal released
+        if not released:
+            released = True
+            admission.release(request.session_id, time.perf_counter() - started)
+
+    # After the stream: commit the turn's history on the I/O pool, then free the slot (on the event loop,
+    # which owns the admission queue) if the stream never started
+    async def finish() -> None:
+        try:
+            await asyncio.get_running_loop().run_in_executor(IO_EXECUTOR, history_store.store.commit, [memory])
+        finally:
+            release()
+
+    async def events():
+        try:
+            context = await load_context(memory)
+            async for kind, payload in stream_turn(request.message, matcher.match(request.message), memory, context):
+                if kind != "result":
+                    yield sse_event(kind, payload)
+            yield sse_event("done", {"session_id": request.session_id, "status": "success"})
+        except Exception as e:
+            # Headers are already sent, so errors are reported in-band
+            yield sse_event("error", {"detail": str(e)})
+        finally:
+            release()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},  # Don't let proxies buffer events
+        background=BackgroundTask(finish)
+    )
+
+# ❤️ Health/readiness check: 503 "starting" until the warmup has loaded the model and index,
+# then "healthy"; both include the startup time of each phase in seconds
 @app.get("/health")
 async def health():
-    # Return a simple JSON saying the app is healthy
-    return {"status": "healthy"}
+    if not startup.is_ready():
+        return JSONResponse({"status": "starting", "startup": startup.PHASES}, status_code=503)
+    return {"status": "healthy", "startup": startup.PHASES, "admission": admission.stats()}
+
+# 📊 Prometheus scrape endpoint: per-node/per-I/O latency histograms, counters and gauges.
+# Every series is per worker process: with --workers N a scrape reaches whichever worker accepts it,
+# so aggregate across workers by mcp_worker_pid rather than reading one scrape as the whole server
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+# 🔬 Profiling admin endpoints (404 unless MCP_PROFILE_TOKEN is set; the token goes in the X-MCP-Profile header)
+def _profiler_for(request: Request) -> profiling.Profiler:
+    if profiler is None:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    if not profiling.authorized(request.headers.get(profiling.HEADER)):
+        raise HTTPException(status_code=403, detail="Missing or wrong profiling token")
+    return profiler
 
-# 🚀 Run the server locally when the script is executed directly
+# Profile the next `requests` turn requests (0 = any number) or the next `seconds` (capped by MCP_PROFILE_MAX_SECONDS)
+@app.post("/admin/profile")
+async def start_profile(request: Request, requests: int = 10, seconds: float = 0.0):
+    session = _profiler_for(request).start(requests=requests, seconds=seconds)
+    if session is None:
+        raise HTTPException(status_code=409, detail="A profiling session is already running")
+    return session.summary()
+
+# Recent profiles (newest first)
+@app.get("/admin/profile")
+async def list_profiles(request: Request):
+    return {"profiles": _profiler_for(request).list()}
+
+# Stop the running session early
+@app.delete("/admin/profile")
+async def stop_profile(request: Request):
+    session = _profiler_for(request).stop()
+    if session is None:
+        raise HTTPException(status_code=404, detail="No profiling session is running")
+    return session.summary()
+
+# One profile: summary (per-node / SQLite / FAISS breakdown), speedscope JSON or pstats download
+@app.get("/admin/profile/{profile_id}")
+async def get_profile(request: Request, profile_id: str, format: str = "summary"):
+    session = _profiler_for(request).get(profile_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Unknown profile {profile_id}")
+    if format == "summary":
+        return session.summary()
+    if format == "speedscope":
+        return JSONResponse(session.speedscope(), headers={
+            "Content-Disposition": f'attachment; filename="mcp-{profile_id}.speedscope.json"'})
+    if format == "pstats":
+        return Response(session.pstats(), media_type="application/octet-stream", headers={
+            "Content-Disposition": f'attachment; filename="mcp-{profile_id}.pstats"'})
+    raise HTTPException(status_code=400, detail="format must be summary, speedscope or pstats")
+
+# Everything above ran at import time
+startup.mark("app_import")
+
+# 🚀 Run the server when the script is executed directly
 if __name__ == "__main__":
-    # Start uvicorn server, hosting on 0.0.0.0 to be accessible from any device on the network, reload=True for development
-    uvicorn.run("mcp_server:app", host="0.0.0.0", port=8000, reload=True)
+    parser = argparse.ArgumentParser(description="Medical Agent MCP server")
+    parser.add_argument("--host", default="0.0.0.0")  # Accessible from any device on the network
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("MCP_WORKERS", "1")),
+                        help="Worker processes forked from one warm parent (disables the session cache; "
+                             "metrics and profiles are per worker)")
+    parser.add_argument("--reload", action="store_true", help="Development mode: one process, reload on code changes")
+    args = parser.parse_args()
+
+    if args.reload:
+        uvicorn.run("mcp_server:app", host=args.host, port=args.port, reload=True)
+    else:
+        # Pass the app object (an import string would import this module a second time)
+        startup.serve(app, host=args.host, port=args.port, workers=args.workers)
@@ -0,0 +1,74 @@
+# Sorted id arrays make AND/OR of postings cheap (numpy set operations)
+import numpy as np
+# Type hints for better readability
+from typing import Any, Dict, Hashable, Iterable, List, Mapping, Optional, Tuple
+# Configuration from the environment
+import os
+
+# Metadata fields to index, comma separated (empty = every field with scalar or list values)
+METADATA_FIELDS = [f for f in os.getenv("MCP_METADATA_FIELDS", "").split(",") if f]
+
+_EMPTY = np.empty(0, dtype="int64")
+
+# Inverted index from metadata (field, value) to FAISS positions of the chunks carrying it.
+# Scalar values (str/int/float/bool) are indexed as-is; list/tuple/set values (e.g. tags) index each element
+class MetadataIndex:
+    def __init__(self, fields: Optional[List[str]] = None):
+        self.fields = fields if fields is not None else METADATA_FIELDS
+        self.size = 0
+        self._postings: Dict[str, Dict[Hashable, np.ndarray]] = {}
+
+    # Build from a LangChain FAISS store (positions follow its index_to_docstore_id map)
+    @classmethod
+    def from_vectorstore(cls, store, fields: Optional[List[str]] = None) -> "MetadataIndex":
+        docstore, id_map = store.docstore, store.index_to_docstore_id
+        # Unmodified SQLite-backed store: one sequential scan instead of a lookup per chunk
+        if getattr(docstore, "pristine", False) and getattr(id_map, "pristine", False):
+            return cls.from_rows(docstore.chunks.metadata_rows(), len(id_map), fields)
+        rows = ((position, getattr(docstore.search(doc_id), "metadata", None) or {})
+                for position, doc_id in id_map.items())
+        return cls.from_rows(rows, len(id_map), fields)
+
+    # Build from (position, metadata) pairs
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[int, Mapping[str, Any]]], size: int,
+                  fields: Optional[List[str]] = None) -> "MetadataIndex":
+        index = cls(fields)
+        lists: Dict[str, Dict[Hashable, List[int]]] = {}
+        for position, metadata in rows:
+            for field, value in metadata.items():
+                if index.fields and field not in index.fields:
+                    continue
+                values = value if isinstance(value, (list, tuple, set, frozenset)) else (value,)
+                for item in values:
+                    if isinstance(item, (str, int, float, bool)):
+                        lists.setdefault(field, {}).setdefault(item, []).append(position)
+        index._postings = {
+            field: {value: np.asarray(sorted(ids), dtype="int64") for value, ids in by_value.items()}
+            for field, by_value in lists.items()
+        }
+        index.size = size
+        return index
+
+    # Positions matching a filter, or None for "no filter".
+    # {"source": "a.pdf", "tags": ["dosage", "pediatric"]} = source is a.pdf AND tag is dosage OR pediatric
+    def select(self, filter: Optional[Mapping[str, Any]]) -> Optional[np.ndarray]:
+        if not filter:
+            return None
+        selected: Optional[np.ndarray] = None
+        for field, wanted in filter.items():
+            by_value = self._postings.get(field, {})
+            options = wanted if isinstance(wanted, (list, tuple, set, frozenset)) else (wanted,)
+            matches = [by_value[value] for value in options if value in by_value]
+            ids = np.unique(np.concatenate(matches)) if len(matches) > 1 else (matches[0] if matches else _EMPTY)
+            selected = ids if selected is None else np.intersect1d(selected, ids, assume_unique=True)
+            if not len(selected):
+                return _EMPTY
+        return selected
+
+    # Distinct values per field with their chunk counts (for inspection/debugging)
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "chunks": self.size,
+            "fields": {field: len(by_value) for field, by_value in self._postings.items()},
+        }
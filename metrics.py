@@ -0,0 +1,208 @@
+# bisect finds a histogram bucket in O(log buckets)
+from bisect import bisect_left
+# Type hints for better readability
+from typing import Callable, Dict, List, Sequence, Tuple
+# Sampling decision, thread safety, timing, configuration
+import os
+import random
+import threading
+import time
+
+# Fraction of timed blocks that are measured: 1.0 = all, 0 = timing off (counters stay exact).
+# With timing off a timed block costs one global check and a no-op context manager
+SAMPLE_RATE = float(os.getenv("MCP_METRICS_SAMPLE_RATE", "1.0"))
+
+# Latency buckets in seconds (50µs … 10s)
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Change the sampling rate at runtime (e.g. from an admin hook or a benchmark)
+def set_sample_rate(rate: float) -> None:
+    global SAMPLE_RATE
+    SAMPLE_RATE = rate
+
+# Helper: render a label set as {a="x",b="y"}
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+# Monotonic counter, optionally split by labels
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, values)} {value}")
+        return lines
+
+# Context manager returned by Histogram.time() when the block is sampled
+class _Timer:
+    __slots__ = ("histogram", "label_values", "start")
+
+    def __init__(self, histogram: "Histogram", label_values: Tuple[str, ...]):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.label_values)
+        return False
+
+# Shared no-op context manager for blocks that are not sampled
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+# Latency histogram (Prometheus style cumulative buckets + sum + count), optionally split by labels
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values → [per-bucket counts (+1 overflow slot), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    # `with histogram.time("label"):` measures the block (subject to SAMPLE_RATE)
+    def time(self, *label_values: str):
+        rate = SAMPLE_RATE
+        if rate <= 0 or (rate < 1 and random.random() >= rate):
+            return _NULL_TIMER
+        return _Timer(self, label_values)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for values, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    le = 'le="%s"' % bound
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labels, values, le)} {cumulative}")
+                le = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, values, le)} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, values)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, values)} {count}")
+        return lines
+
+# Gauge whose value is read from a callback at scrape time (cache sizes, queue depths, …)
+class Gauge:
+    def __init__(self, name: str, help_text: str, callback: Callable[[], float]):
+        self.name = name
+        self.help = help_text
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        try:
+            value = self.callback()
+        except Exception:
+            # A broken gauge must never break the whole /metrics page
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+# Counter whose value is read from a callback at scrape time (cumulative hits, misses, evictions, … kept by
+# the component itself). With labels, the callback returns {label values: value}
+class CallbackCounter:
+    def __init__(self, name: str, help_text: str, callback: Callable[[], object], labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.callback = callback
+        self.labels = tuple(labels)
+
+    def render(self) -> List[str]:
+        try:
+            value = self.callback()
+        except Exception:
+            # A broken callback must never break the whole /metrics page
+            return []
+        series = sorted(value.items()) if self.labels else [((), value)]
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for values, count in series:
+            lines.append(f"{self.name}{_format_labels(self.labels, values)} {count}")
+        return lines
+
+# Collection of metrics rendered together on /metrics
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def gauge(self, name: str, help_text: str, callback: Callable[[], float]) -> Gauge:
+        return self.register(Gauge(name, help_text, callback))
+
+    def callback_counter(self, name: str, help_text: str, callback: Callable[[], object],
+                         labels: Sequence[str] = ()) -> CallbackCounter:
+        return self.register(CallbackCounter(name, help_text, callback, labels))
+
+    # Prometheus text exposition format (version 0.0.4)
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+# Process-wide registry and the metrics shared across modules
+REGISTRY = Registry()
+
+NODE_LATENCY = REGISTRY.histogram(
+    "mcp_node_latency_seconds", "Time spent inside each graph node", labels=("node",)
+)
+IO_LATENCY = REGISTRY.histogram(
+    "mcp_io_latency_seconds", "Time spent in SQLite and FAISS calls", labels=("operation",)
+)
+TURN_LATENCY = REGISTRY.histogram(
+    "mcp_turn_latency_seconds", "End-to-end time of one conversation turn", labels=("path",)
+)
+REQUESTS = REGISTRY.counter(
+    "mcp_requests_total", "Requests handled, by endpoint", labels=("endpoint",)
+)
+INTENTS = REGISTRY.counter(
+    "mcp_turns_total", "Conversation turns answered, by detected intent", labels=("intent",)
+)
@@ -1,129 +1,416 @@
 # Import Runnable from langchain_core to define custom nodes that can be executed
 from langchain_core.runnables import Runnable
 # Import message classes to represent human and AI messages
-from langchain_core.messages import AIMessage, HumanMessage
-# Import StateGraph and END marker to build a state-based conversational graph
-from langgraph.graph import StateGraph, END
-# SQL-based chat memory to persist conversations into a SQLite database
-from langchain_community.chat_message_histories import SQLChatMessageHistory
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+# Import StateGraph and the START/END markers to build a state-based conversational graph
+from langgraph.graph import StateGraph, START, END
+# Shared, pooled SQLite chat memory to persist conversations (+ the rolling-summary format)
+from history_store import get_history, summarize_messages
+# Single-pass keyword matcher compiled from the intent/keyword knowledge table
+from intent_matcher import KeywordMatcher, MatchResult
+# Bounded memo of deterministic ToolAgent answers
+from response_cache import ResponseCache
+# Per-node latency histogram (sampled, see metrics.SAMPLE_RATE)
+from metrics import NODE_LATENCY
+# Startup phase timings (model/index load) reported on /health
+from startup import phase
+# Node tags and exact node timings for the on-demand profiler (no-ops unless a profile is running)
+import profiling
 # Type hints: used for better type safety and IDE autocompletion
-from typing import TypedDict, List, Dict, Any
+from typing import Annotated, TypedDict, List, Dict, Any, Optional
 # For generating unique session IDs based on timestamps
 import time
+# asyncio + a thread pool let the async graph path push blocking I/O off the event loop
+import asyncio
+import functools
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextlib import contextmanager
 
-# Define the shape of the state passed between graph nodes
+logger = logging.getLogger(__name__)
+
+# Bounded pool for blocking I/O (SQLite writes) issued from the async graph path.
+# Capped so a traffic spike queues work here instead of spawning unbounded threads.
+IO_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("MCP_IO_WORKERS", "8")),  # Tune with the MCP_IO_WORKERS env var
+    thread_name_prefix="mcp-io"
+)
+
+# Helper: run a blocking callable on the bounded I/O pool and await its result
+# (tagged with the calling node, so a running profile charges the pool thread's time to it)
+async def run_blocking(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(IO_EXECUTOR, profiling.tagged(functools.partial(func, *args, **kwargs)))
+
+# Run a node's body: latency histogram, plus its name and exact wall time for a running profile
+@contextmanager
+def node_scope(name: str):
+    token = profiling.CURRENT_NODE.set(name)
+    start = time.perf_counter()
+    try:
+        with NODE_LATENCY.time(name):
+            yield
+    finally:
+        profiling.CURRENT_NODE.reset(token)
+        profiling.record_node(name, time.perf_counter() - start)
+
+# Helper: persist a message from the async path
+async def persist_message(memory, message) -> None:
+    # Write-behind memories only queue the message, so skip the thread hop
+    if getattr(memory, "buffered", False):
+        memory.add_message(message)
+    else:
+        await run_blocking(memory.add_message, message)
+
+# Helper: store a rolling summary, as a checkpoint when the memory supports it
+def save_summary(memory, message) -> None:
+    if hasattr(memory, "add_summary"):
+        memory.add_summary(message)
+    else:
+        memory.add_message(message)
+
+# Conversations longer than this are folded into a summary by SummaryAgent
+SUMMARY_THRESHOLD = 25
+
+# Retrieval: index to search, chunks quoted per answer, and the latency budget (past it, answer without retrieval)
+RAG_INDEX_PATH = os.getenv("MCP_RAG_INDEX", "faiss_index")
+RETRIEVAL_K = int(os.getenv("MCP_RETRIEVAL_K", "2"))
+RETRIEVAL_BUDGET_MS = float(os.getenv("MCP_RETRIEVAL_BUDGET_MS", "250"))
+# Intents answered without retrieval, comma separated (vague/general messages have nothing to ground)
+RETRIEVAL_SKIP_INTENTS = {i for i in os.getenv("MCP_RETRIEVAL_SKIP_INTENTS", "general").split(",") if i}
+# Seconds between two checks for an index version published by ingest.py (0 = never: restart to serve it)
+RAG_RELOAD_SECONDS = float(os.getenv("MCP_RAG_RELOAD_SECONDS", "10"))
+
+# Searches run on their own pool so a slow index can't starve the SQLite writes on IO_EXECUTOR.
+# A search that misses its deadline keeps running here and warms RAGManager's result cache
+RETRIEVAL_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("MCP_RETRIEVAL_WORKERS", "4")),
+    thread_name_prefix="mcp-retrieval"
+)
+
+# Node update that restarts the conversation at a summary: {"messages": Reset(summary)}
+class Reset:
+    __slots__ = ("message",)
+
+    def __init__(self, message: BaseMessage):
+        self.message = message
+
+# Reducer for GraphState.messages: nodes return only what they add (a message, a list of messages or a Reset).
+# Callers pass a bounded window (HISTORY_WINDOW messages + the checkpoint), so a new list per step is cheap
+def append_messages(current: List[BaseMessage], update: Any) -> List[BaseMessage]:
+    if isinstance(update, Reset):
+        return [update.message]
+    if isinstance(update, BaseMessage):
+        return [*current, update]
+    return [*current, *update]
+
+# Reducer for GraphState.evaluation_metadata: nodes return only the keys they add
+def merge_metadata(current: Dict[str, Any], update: Dict[str, Any]) -> Dict[str, Any]:
+    return {**current, **update}
+
+# Define the shape of the state passed between graph nodes.
+# Nodes return deltas: LangGraph applies the reducers below, every other key is replaced
 class GraphState(TypedDict):
-    messages: List[HumanMessage | AIMessage]  # List of conversation messages
+    messages: Annotated[List[BaseMessage], append_messages]  # Conversation (nodes return only new messages)
     memory: Any                               # Memory object to store/retrieve past messages
     intent: str                               # Detected intent from user's latest message
+    matches: MatchResult                      # Keywords found in the latest message (one scan, shared by all nodes)
     response: str                             # Response generated by the system
-    evaluation_metadata: Dict[str, Any]       # Metadata useful for evaluating system behavior
+    summary: str                              # Rolling summary written this turn (only set on summary turns)
+    evaluation_metadata: Annotated[Dict[str, Any], merge_metadata]  # Metadata useful for evaluating system behavior
+    context: List[Dict[str, Any]]             # Chunks retrieved for the latest message (empty if skipped/late)
+    retrieval: Dict[str, Any]                 # Retrieval outcome: status (ok/timeout/unavailable) and latency
 
 # Node 1: Intent classification based on keywords
 class IntentClassifier(Runnable):
+    def __init__(self, matcher: KeywordMatcher = None):
+        # Compiled once; build_graph shares the same matcher with ToolAgent
+        self.matcher = matcher or KeywordMatcher()
+
     def invoke(self, state: GraphState, config=None) -> GraphState:
-        # Get the latest message content and lowercase it for easy keyword matching
-        msg = state["messages"][-1].content.lower()
-
-        # Define keywords for medication and symptom intents
-        medication_terms = ["take", "dose", "mg", "ibuprofen", "paracetamol"]
-        symptom_terms = ["fever", "headache", "pain", "hurt"]
-
-        # Check which category the message matches
-        if any(term in msg for term in medication_terms):
-            intent = "medication_inquiry"
-            metadata = {"detected_terms": [t for t in medication_terms if t in msg]}
-        elif any(term in msg for term in symptom_terms):
-            intent = "symptom_report"
-            metadata = {"detected_symptoms": [t for t in symptom_terms if t in msg]}
-        else:
-            # Default intent if no keywords matched
-            intent = "general"
-            metadata = {}
+        with node_scope("intent_classifier"):
+            return self._classify(state)
+
+    # Async variant: classification is pure CPU work, so it runs inline on the event loop
+    async def ainvoke(self, state: GraphState, config=None, **kwargs) -> GraphState:
+        with node_scope("intent_classifier"):
+            return self._classify(state)
+
+    def _classify(self, state: GraphState) -> GraphState:
+        # Scan the latest message once: every matched keyword and its category
+        # (callers that already scanned the message can pass the result in as state["matches"])
+        matches = state.get("matches") or self.matcher.match(state["messages"][-1].content)
+
+        # Route on the matched categories (medication first, then symptoms, else "general")
+        intent, metadata = self.matcher.classify(matches)
+
+        # Return only the keys this node sets: it runs in the same step as the retriever,
+        # and LangGraph merges both updates into the state
+        return {"intent": intent, "matches": matches, "response": "", "evaluation_metadata": metadata}
+
+# Node 1b: Retrieves reference chunks for the latest message, in parallel with intent classification.
+# Waits at most budget_ms; a late or failed search leaves the context empty and the answer ungrounded
+class Retriever(Runnable):
+    def __init__(self, rag=None, index_path: str = RAG_INDEX_PATH,
+                 budget_ms: float = RETRIEVAL_BUDGET_MS, k: int = RETRIEVAL_K):
+        self.index_path = index_path
+        self.budget = budget_ms / 1000
+        self.k = k
+        self._rag = rag
+        self._load_lock = threading.Lock()
+        self._unavailable = False
+        self._reload_lock = threading.Lock()
+        self._next_check = time.monotonic() + RAG_RELOAD_SECONDS
+
+    def invoke(self, state: GraphState, config=None) -> GraphState:
+        with node_scope("retriever"):
+            start = time.perf_counter()
+            future = RETRIEVAL_EXECUTOR.submit(self._search, state["messages"][-1].content)
+            try:
+                context = future.result(timeout=self.budget)
+            except FutureTimeout:
+                context = "timeout"
+            return self._update(context, start)
+
+    # Async variant: the search runs on the retrieval pool; shield() keeps it running past the deadline
+    async def ainvoke(self, state: GraphState, config=None, **kwargs) -> GraphState:
+        with node_scope("retriever"):
+            start = time.perf_counter()
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(RETRIEVAL_EXECUTOR, self._search, state["messages"][-1].content)
+            try:
+                context = await asyncio.wait_for(asyncio.shield(future), self.budget)
+            except asyncio.TimeoutError:
+                context = "timeout"
+            return self._update(context, start)
+
+    # Version of the loaded index (0 until it is loaded); part of the memo key, so an answer built from
+    # retrieved chunks stops being served once the index is reloaded or extended
+    @property
+    def index_version(self) -> int:
+        return self._rag.index_version if self._rag is not None else 0
 
-        # Return an updated state with the detected intent and metadata
-        return {**state, "intent": intent, "response": "", "evaluation_metadata": metadata}
+    # Helper: the state update for a search outcome (a list of chunks, "timeout" or None if there's no index)
+    def _update(self, context, start: float) -> GraphState:
+        status = "ok" if isinstance(context, list) else (context or "unavailable")
+        return {
+            "context": context if status == "ok" else [],
+            "retrieval": {"status": status, "ms": round((time.perf_counter() - start) * 1000, 1)}
+        }
+
+    # Runs on the retrieval pool: top-k chunks for the question, or None when no index can be loaded
+    def _search(self, question: str) -> Optional[List[Dict[str, Any]]]:
+        rag = self._load()
+        if rag is None:
+            return None
+        self._reload_if_due(rag)
+        try:
+            return rag.query(question)[:self.k]
+        except Exception:
+            logger.exception("Retrieval failed")
+            return None
+
+    # Follow CURRENT when ingest.py publishes a new version: one small file read every RAG_RELOAD_SECONDS,
+    # done by whichever search comes due (the others don't wait for it). Searches already running finish
+    # on the old index, and the index_version bump invalidates cached results and memoized answers
+    def _reload_if_due(self, rag) -> None:
+        if RAG_RELOAD_SECONDS <= 0 or time.monotonic() < self._next_check:
+            return
+        if not self._reload_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_check = time.monotonic() + RAG_RELOAD_SECONDS
+            if rag.reload_if_changed():
+                logger.info("Reloaded index %s (version %s)", self.index_path, rag.loaded_version)
+        except Exception:
+            logger.exception("Index reload failed, serving the loaded version")
+        finally:
+            self._reload_lock.release()
+
+    # Load the model and index now and run `questions` through them, in the calling thread
+    # (used by startup.warmup before the server reports ready). Returns False if there is no usable index
+    def warm(self, questions: List[str]) -> bool:
+        rag = self._load()
+        if rag is None:
+            return False
+        with phase("retrieval_warmup"):
+            for question in questions:
+                rag.query(question)
+            # Unfiltered queries never touch the metadata index: build it here so a first filtered query doesn't
+            rag.metadata_index()
+        return True
+
+    # Helper: load the index on first use (the first requests answer without it while the model loads).
+    # rag_manager pulls in torch/sentence-transformers and FAISS, so it is only imported here
+    def _load(self):
+        with self._load_lock:
+            if self._rag is None and not self._unavailable:
+                try:
+                    with phase("embedding_model"):
+                        from rag_manager import RAGManager
+                        rag = RAGManager(self.index_path)
+                    with phase("index"):
+                        rag.load_vectorstore(self.index_path)
+                    self._rag = rag
+                except Exception as e:
+                    logger.warning("Retrieval disabled: no usable index at %s (%s)", self.index_path, e)
+                    self._unavailable = True
+            return self._rag
 
 # Node 2: Generates a tool-based response depending on the detected intent
 class ToolAgent(Runnable):
+    def __init__(self, matcher: KeywordMatcher = None):
+        self.matcher = matcher or KeywordMatcher()
+
     def invoke(self, state: GraphState, config=None) -> GraphState:
+        with node_scope("tool_agent"):
+            new_state = self._respond(state)
+
+            # Save the AI response to memory if memory is provided
+            if state["memory"]:
+                state["memory"].add_message(new_state["messages"][0])
+            return new_state
+
+    # Async variant: same response, but the memory write is offloaded to the I/O pool
+    async def ainvoke(self, state: GraphState, config=None, **kwargs) -> GraphState:
+        with node_scope("tool_agent"):
+            new_state = self._respond(state)
+            if state["memory"]:
+                await persist_message(state["memory"], new_state["messages"][0])
+            return new_state
+
+    def _respond(self, state: GraphState) -> GraphState:
         intent = state["intent"]  # Get the detected intent
-        msg = state["messages"][-1].content.lower()  # Get latest user message
+        # Reuse the classifier's scan of the latest message (rescan only if the node runs standalone)
+        matches = state.get("matches") or self.matcher.match(state["messages"][-1].content)
 
         # Generate different responses depending on the intent
         if intent == "medication_inquiry":
-            response = self._medication_response(msg)
+            response = self._medication_response(matches)
         elif intent == "symptom_report":
-            response = self._symptom_response(msg)
+            response = self._symptom_response(matches)
         else:
             response = "Could you please provide more details about your concern?"
 
-        # Save the AI response to memory if memory is provided
-        if state["memory"]:
-            state["memory"].add_message(AIMessage(content=response))
+        # Ground the answer in the retrieved reference chunks (if retrieval ran and made its deadline)
+        if state.get("context"):
+            response += "\n\n📚 From the reference documents:\n" + "\n".join(
+                self._excerpt(chunk) for chunk in state["context"])
 
-        # Return an updated state, appending AI's response message
+        # Return only what changed: the AI's response message (appended to the log by the reducer)
         return {
-            **state,
-            "messages": state["messages"] + [AIMessage(content=response)],  # Add response to history
+            "messages": [AIMessage(content=response)],  # Add response to history
             "response": response,  # Current node's generated response
-            "evaluation_metadata": {**state.get("evaluation_metadata", {}), "response_type": f"{intent}_response"}
+            "evaluation_metadata": {
+                "response_type": f"{intent}_response",
+                "retrieval": state.get("retrieval") or {"status": "skipped"}
+            }
         }
 
+    # Helper function: one retrieved chunk as a short quoted line with its source
+    def _excerpt(self, chunk: Dict[str, Any], length: int = 200) -> str:
+        text = " ".join(chunk["content"].split())
+        text = text if len(text) <= length else text[:length].rsplit(" ", 1)[0] + "…"
+        metadata = chunk.get("metadata", {})
+        # File name only (sources may be Windows paths)
+        source = str(metadata.get("source", "")).replace("\\", "/").rsplit("/", 1)[-1] or "reference"
+        page = f", p. {metadata['page']}" if "page" in metadata else ""
+        return f"- {text} ({source}{page})"
+
     # Helper function: builds response for medication inquiries
-    def _medication_response(self, msg: str) -> str:
-        if "together" in msg:
+    def _medication_response(self, matches: MatchResult) -> str:
+        if "together" in matches:
             return ("⚠️ Important: Consult a doctor before combining medications.\n\n"
                     "- Ibuprofen: 200-400mg every 6-8 hours\n"
                     "- Paracetamol: 500mg every 6 hours\n"
                     "⏱️ Space doses by 4+ hours")
-        if "ibuprofen" in msg:
+        if "ibuprofen" in matches:
             return "Ibuprofen: 200-400mg every 6-8 hours (max 1200mg/day)"
-        if "paracetamol" in msg:
+        if "paracetamol" in matches:
             return "Paracetamol: 500mg every 6 hours (max 4000mg/day)"
         return "Please specify which medication you're asking about."
 
     # Helper function: builds response for symptom reports
-    def _symptom_response(self, msg: str) -> str:
-        if "fever" in msg and "headache" in msg:
+    def _symptom_response(self, matches: MatchResult) -> str:
+        if "fever" in matches and "headache" in matches:
             return ("Possible flu symptoms. Recommended:\n"
                     "1. Rest\n2. Hydrate\n3. Paracetamol for fever/pain")
         return "I recommend consulting a doctor about these symptoms."
 
 # Node 3: Summarizes conversation when too many messages accumulate
 class SummaryAgent(Runnable):
+    def __init__(self, threshold: int = SUMMARY_THRESHOLD):
+        self.threshold = threshold
+
     def invoke(self, state: GraphState, config=None) -> GraphState:
-        if len(state["messages"]) <= 25:
-            # Only summarize if there are more than 25 messages
-            return state
+        with node_scope("summary_agent"):
+            new_state = self._summarize(state)
 
-        # Otherwise, create a simple summary from the last 5 messages
-        recent = state["messages"][-5:]
-        summary = "Conversation summary:\n" + "\n".join(f"{msg.type}: {msg.content[:50]}..." for msg in recent)
+            # Save the summary into memory (only when a summary was actually produced)
+            if new_state and state["memory"]:
+                save_summary(state["memory"], new_state["messages"].message)
+            return new_state
+
+    # Async variant: the summary write goes through the bounded I/O pool
+    async def ainvoke(self, state: GraphState, config=None, **kwargs) -> GraphState:
+        with node_scope("summary_agent"):
+            new_state = self._summarize(state)
+            if new_state and state["memory"]:
+                memory = state["memory"]
+                if getattr(memory, "buffered", False):
+                    save_summary(memory, new_state["messages"].message)
+                else:
+                    await run_blocking(save_summary, memory, new_state["messages"].message)
+            return new_state
+
+    def _summarize(self, state: GraphState) -> GraphState:
+        if len(state["messages"]) <= self.threshold:
+            # Only summarize if there are more than `threshold` messages (no update)
+            return {}
 
-        # Save the summary into memory
-        if state["memory"]:
-            state["memory"].add_message(AIMessage(content=summary))
+        # Otherwise, create a simple summary from the last 5 messages
+        summary = summarize_messages(state["messages"][-5:])
 
-        # Return a compressed state with the summary instead of full messages
+        # Restart the conversation at the summary.
+        # The turn's answer stays ToolAgent's response; the summary only becomes the new checkpoint
         return {
-            **state,
-            "messages": [AIMessage(content=summary)],  # Replace conversation with the summary
-            "response": summary,
-            "evaluation_metadata": {**state.get("evaluation_metadata", {}), "summary_length": len(summary)}
+            "messages": Reset(AIMessage(content=summary)),  # Replace conversation with the summary
+            "summary": summary,
+            "evaluation_metadata": {"summary_length": len(summary)}
         }
 
-# Function to build the conversational flow (graph)
-def build_graph():
+# Function to build the conversational flow (graph).
+# retriever=None uses a Retriever over RAG_INDEX_PATH; retriever=False builds the graph without retrieval.
+# Conversations longer than summary_threshold messages are folded into a summary
+def build_graph(matcher: KeywordMatcher = None, retriever: Retriever = None, summary_threshold: int = SUMMARY_THRESHOLD):
     builder = StateGraph(GraphState)  # Create a graph with the GraphState structure
 
+    # Compile the keyword knowledge table once; all nodes share the same matcher
+    matcher = matcher or KeywordMatcher()
+
     # Add nodes: Each node is a step in conversation flow
-    builder.add_node("intent_classifier", IntentClassifier())
-    builder.add_node("tool_agent", ToolAgent())
-    builder.add_node("summary_agent", SummaryAgent())
-    
-    # Set starting point: Conversation starts with classifying intent
-    builder.set_entry_point("intent_classifier")
+    builder.add_node("intent_classifier", IntentClassifier(matcher))
+    builder.add_node("tool_agent", ToolAgent(matcher))
+    builder.add_node("summary_agent", SummaryAgent(summary_threshold))
+
+    if retriever is False:
+        # Set starting point: Conversation starts with classifying intent
+        builder.set_entry_point("intent_classifier")
+    else:
+        builder.add_node("retriever", retriever or Retriever())
+
+        # Fan-out: classify and retrieve in parallel, unless the message's intent never uses retrieved context
+        # (decided from the same keyword scan, which callers usually pass in as state["matches"])
+        def fan_out(state: GraphState) -> List[str]:
+            matches = state.get("matches") or matcher.match(state["messages"][-1].content)
+            intent, _ = matcher.classify(matches)
+            return ["intent_classifier"] if intent in RETRIEVAL_SKIP_INTENTS else ["intent_classifier", "retriever"]
+
+        builder.add_conditional_edges(START, fan_out, ["intent_classifier", "retriever"])
+        # Fan-in: both branches finish in the same step, so tool_agent runs once, after both
+        builder.add_edge("retriever", "tool_agent")
 
     # After intent classification → run tool_agent
     builder.add_edge("intent_classifier", "tool_agent")
@@ -131,7 +418,7 @@ def build_graph():
     # After tool_agent → either summarize or end based on number of messages
     builder.add_conditional_edges(
         "tool_agent",
-        lambda state: "summary_agent" if len(state["messages"]) > 25 else END
+        lambda state: "summary_agent" if len(state["messages"]) > summary_threshold else END
     )
 
     # After summarization → end conversation
@@ -140,15 +427,44 @@ def build_graph():
     # Compile the graph into an executable object
     return builder.compile()
 
-# Compile the graph and store it in `graph`
-graph = build_graph()
+# Compile the keyword table and the graph once and store them in `matcher` and `graph`
+# (the retriever loads its model and index on first use or during startup.warmup)
+with phase("graph"):
+    matcher = KeywordMatcher()
+    retriever = Retriever()
+    graph = build_graph(matcher, retriever)
+
+# Memoized answers for repeated questions (ToolAgent's answer only depends on intent + matched terms)
+response_cache = ResponseCache()
+
+# Look up a memoized answer for the latest message of a conversation of `history_len` messages.
+# Returns None when the graph has to run (cache miss, or this turn would trigger summarization)
+def lookup_response(message: str, matches: MatchResult, history_len: int) -> Optional[Dict[str, Any]]:
+    if history_len + 1 > SUMMARY_THRESHOLD:
+        return None
+    return response_cache.get(response_cache.key(message, matches.signature(), matcher.fingerprint, retriever.index_version))
+
+# Memoize the answer of a finished graph run (summary turns are not memoized)
+def remember_response(message: str, result: Dict[str, Any]) -> None:
+    metadata = result.get("evaluation_metadata", {})
+    if "summary_length" in metadata or "matches" not in result:
+        return
+    # Answers that missed their retrieval deadline are not memoized (the next run may make it)
+    if metadata.get("retrieval", {}).get("status") == "timeout":
+        return
+    key = response_cache.key(message, result["matches"].signature(), matcher.fingerprint, retriever.index_version)
+    response_cache.put(key, {
+        "intent": result["intent"],
+        "response": result["response"],
+        "evaluation_metadata": metadata
+    })
 
 # Function to simulate user input and run through the conversation graph
 def run_test(input_message: str) -> Dict[str, Any]:
     # Create a new chat memory using SQLite, each test run gets a unique session ID
-    memory = SQLChatMessageHistory(
+    memory = get_history(
         session_id=f"test_{int(time.time())}",
-        connection="sqlite:///medical_chat.db"  # Database file to store chat logs
+        database="medical_chat.db"  # Database file to store chat logs
     )
 
     # Start the graph execution with initial state
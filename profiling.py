@@ -0,0 +1,404 @@
+# On-demand profiling of the server's turns. Off unless MCP_PROFILE_TOKEN is set; with a token:
+#   - a request to a turn endpoint carrying `X-MCP-Profile: <token>` is profiled (starting a session if none runs)
+#   - POST /admin/profile?requests=N&seconds=T profiles the next N turn requests or the next T seconds
+#   - GET /admin/profile/<id>?format=summary|speedscope|pstats downloads the result
+# Profiling is a wall-clock stack sampler: a thread that snapshots every thread's Python stack every
+# MCP_PROFILE_INTERVAL_MS while a session runs. A turn is spread over the event loop and the I/O and
+# retrieval pools, which a per-thread tracer like cProfile can't follow; the sampler sees all of them,
+# costs nothing between samples and nothing at all when no session runs. Samples are broken down by
+# graph node and by SQLite / FAISS time, and exported as speedscope (sampled) or pstats (loadable with
+# pstats.Stats / snakeviz, where call counts are sample counts).
+# Graph nodes also report their exact wall time to the running session (node_times in the summary), since
+# most of them finish between two samples, and work a node hands to a pool thread is tagged with its name
+# so the sampler charges those samples to that node.
+# Profiles are per process: with --workers N, each worker profiles (and serves) its own requests.
+# Only stdlib imports: importing this module must not cost the server anything when profiling is off
+from collections import OrderedDict
+# Type hints for better readability
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import contextvars
+import hmac
+import marshal
+import os
+import sys
+import threading
+import time
+import uuid
+
+# Shared secret that enables profiling (unset = no middleware, admin endpoints answer 404)
+TOKEN = os.getenv("MCP_PROFILE_TOKEN", "")
+# Time between two stack samples
+INTERVAL = float(os.getenv("MCP_PROFILE_INTERVAL_MS", "5")) / 1000
+# Longest a session may run, whatever its request count (a forgotten session must stop by itself)
+MAX_SECONDS = float(os.getenv("MCP_PROFILE_MAX_SECONDS", "60"))
+# Finished profiles kept in memory for download
+KEEP = int(os.getenv("MCP_PROFILE_KEEP", "8"))
+
+# Request header that profiles a request (and authorizes the admin endpoints)
+HEADER = "x-mcp-profile"
+_HEADER_KEY = HEADER.encode()
+# Response header telling a profiled request which profile it went into
+ID_HEADER = b"x-mcp-profile-id"
+# Endpoints whose requests are counted and profiled
+PROFILED_PATHS = ("/process", "/process_form", "/process_batch", "/process/stream")
+
+# Graph node classes (multi_agent_graph.py) → node name in the graph
+NODES = {
+    "IntentClassifier": "intent_classifier",
+    "Retriever": "retriever",
+    "ToolAgent": "tool_agent",
+    "SummaryAgent": "summary_agent",
+}
+# Leaf frames of threads that are waiting, not working (event loop select, idle pool workers, waits)
+IDLE_LEAVES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("thread.py", "_worker"),
+    ("queue.py", "get"),
+    ("socket.py", "accept"),
+}
+
+# Graph node the current code runs for (set by the nodes, see multi_agent_graph.node_scope)
+CURRENT_NODE: contextvars.ContextVar = contextvars.ContextVar("mcp_profile_node", default=None)
+# thread id → node whose work that pool thread is running right now (read by the sampler)
+_THREAD_NODES: Dict[int, str] = {}
+# Session running in this process (None when not profiling)
+_active: Optional["ProfileSession"] = None
+
+# Node timing hook: a node run's exact wall time, kept only while a session is running
+def record_node(node: str, seconds: float) -> None:
+    session = _active
+    if session is not None:
+        session.record_node(node, seconds)
+
+# Wrap a callable handed to a thread pool so samples of that thread are charged to the node that
+# scheduled it (pool threads don't have the node's frames on their stack). Returned as-is when not profiling
+def tagged(func: Callable) -> Callable:
+    node = CURRENT_NODE.get()
+    if node is None or _active is None:
+        return func
+
+    def run(*args, **kwargs):
+        ident = threading.get_ident()
+        _THREAD_NODES[ident] = node
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _THREAD_NODES.pop(ident, None)
+    return run
+
+# Check a header value against the token (constant time)
+def authorized(value: Optional[str]) -> bool:
+    return bool(TOKEN) and value is not None and hmac.compare_digest(value.encode(), TOKEN.encode())
+
+# Helper: where a code object belongs: (node or None, "sqlite" / "faiss" / None, idle leaf?)
+def _classify(code) -> Tuple[Optional[str], Optional[str], bool]:
+    path = code.co_filename.replace("\\", "/")
+    base = path.rsplit("/", 1)[-1]
+    node = None
+    if base == "multi_agent_graph.py":
+        node = NODES.get(code.co_qualname.split(".", 1)[0])
+    io = None
+    if "/sqlalchemy/" in path or "/sqlite3/" in path:
+        io = "sqlite"
+    elif "/faiss/" in path or base == "faiss_indexes.py" or path.endswith("vectorstores/faiss.py"):
+        io = "faiss"
+    return node, io, (base, code.co_name) in IDLE_LEAVES
+
+# One profiling session: the samples taken while it ran and the requests it covered
+class ProfileSession:
+    def __init__(self, requests: int, seconds: float):
+        self.id = uuid.uuid4().hex[:12]
+        self.requests = requests       # Stop after this many profiled requests (0 = time window only)
+        self.seconds = seconds
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.deadline = self.started + seconds
+        self.finished: Optional[float] = None
+        self.admitted = 0              # Requests that joined the session
+        self.done: List[Dict[str, Any]] = []
+        # Frame table (name, file, line) shared by every stack; stacks are tuples of indices root → leaf
+        self.frames: List[Tuple[str, str, int]] = []
+        self._frame_index: Dict[Any, int] = {}
+        # thread name → [(stack, seconds)]
+        self.samples: Dict[str, List[Tuple[Tuple[int, ...], float]]] = {}
+        self.idle_samples = 0
+        # Breakdown accumulated while sampling: category → seconds
+        self.nodes: Dict[str, float] = {}
+        # Exact node wall times reported by the nodes: node → [runs, seconds]
+        self.node_times: Dict[str, List[float]] = {}
+        self.io: Dict[str, float] = {}
+        self.busy = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self.finished is None
+
+    # Count a request into the session; False once it has all the requests it asked for
+    def admit(self, forced: bool = False) -> bool:
+        with self._lock:
+            if not self.running or (not forced and self.requests and self.admitted >= self.requests):
+                return False
+            self.admitted += 1
+            return True
+
+    # A profiled request completed; True when that was the session's last one
+    def request_done(self, path: str, seconds: float) -> bool:
+        with self._lock:
+            self.done.append({"path": path, "ms": round(seconds * 1000, 3)})
+            return bool(self.requests) and len(self.done) >= max(self.requests, self.admitted)
+
+    # One node run of `seconds` (wall time, including what it awaited)
+    def record_node(self, node: str, seconds: float) -> None:
+        with self._lock:
+            entry = self.node_times.setdefault(node, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    # Record one stack (frames root → leaf) of `thread` weighing `seconds`; `tag` is the node a pool
+    # thread is working for (used when no node frame is on the stack)
+    def add(self, thread: str, codes: List[Any], seconds: float, classes: Dict[Any, Tuple],
+            tag: Optional[str] = None) -> None:
+        stack = []
+        node = None
+        io = set()
+        for code in codes:
+            index = self._frame_index.get(code)
+            if index is None:
+                index = self._frame_index[code] = len(self.frames)
+                self.frames.append((code.co_qualname, code.co_filename, code.co_firstlineno))
+            stack.append(index)
+            code_node, code_io, _ = classes[code]
+            # Innermost node wins (a node called from another node's frame is still itself)
+            node = code_node or node
+            if code_io:
+                io.add(code_io)
+        node = node or tag
+        self.samples.setdefault(thread, []).append((tuple(stack), seconds))
+        self.busy += seconds
+        if node:
+            self.nodes[node] = self.nodes.get(node, 0.0) + seconds
+        for name in io:
+            self.io[name] = self.io.get(name, 0.0) + seconds
+
+    # Helper: the samples taken so far (a running session keeps adding to them)
+    def _snapshot(self) -> Dict[str, List[Tuple[Tuple[int, ...], float]]]:
+        return {thread: list(stacks) for thread, stacks in list(self.samples.items())}
+
+    # Helper: {category: {seconds, share}} over busy time
+    def _shares(self, seconds: Dict[str, float]) -> Dict[str, Dict[str, float]]:
+        return {name: {"seconds": round(value, 4), "share": round(value / self.busy, 4) if self.busy else 0.0}
+                for name, value in sorted(seconds.items(), key=lambda item: -item[1])}
+
+    # JSON-friendly overview: requests, per-node and per-I/O breakdown, hottest functions
+    def summary(self, top: int = 15) -> Dict[str, Any]:
+        samples = self._snapshot()
+        self_time: Dict[int, float] = {}
+        for stacks in samples.values():
+            for stack, seconds in stacks:
+                self_time[stack[-1]] = self_time.get(stack[-1], 0.0) + seconds
+        hottest = sorted(self_time.items(), key=lambda item: -item[1])[:top]
+        end = self.finished or time.perf_counter()
+        return {
+            "id": self.id,
+            # Worker process that recorded it (profiles and their ids are per worker)
+            "pid": os.getpid(),
+            "status": "running" if self.running else "done",
+            "started_at": self.started_at,
+            "duration_s": round(end - self.started, 3),
+            "interval_ms": INTERVAL * 1000,
+            "requests": list(self.done),
+            "samples": sum(len(stacks) for stacks in samples.values()),
+            "idle_samples": self.idle_samples,
+            # Busy thread-seconds (several threads can be busy at once, so this can exceed the duration)
+            "busy_s": round(self.busy, 4),
+            "threads": {name: len(stacks) for name, stacks in samples.items()},
+            "nodes": self._shares(self.nodes),
+            "node_times": {node: {"runs": runs, "total_ms": round(seconds * 1000, 3),
+                                  "mean_ms": round(seconds / runs * 1000, 4)}
+                           for node, (runs, seconds) in sorted(dict(self.node_times).items(), key=lambda item: -item[1][1])},
+            "io": self._shares(self.io),
+            "top_self": [{"function": self.frames[index][0], "file": self.frames[index][1],
+                          "line": self.frames[index][2], "seconds": round(seconds, 4)}
+                         for index, seconds in hottest],
+        }
+
+    # speedscope file (https://www.speedscope.app/): one sampled profile per thread
+    def speedscope(self) -> Dict[str, Any]:
+        profiles = []
+        for thread, stacks in self._snapshot().items():
+            total = sum(seconds for _, seconds in stacks)
+            profiles.append({
+                "type": "sampled", "name": thread, "unit": "seconds",
+                "startValue": 0, "endValue": total,
+                "samples": [list(stack) for stack, _ in stacks],
+                "weights": [seconds for _, seconds in stacks],
+            })
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"mcp profile {self.id}",
+            "exporter": "mcp profiling",
+            "activeProfileIndex": 0,
+            "shared": {"frames": [{"name": name, "file": path, "line": line} for name, path, line in self.frames]},
+            "profiles": profiles,
+        }
+
+    # marshal'd pstats table (what cProfile's dump_stats writes): self and cumulative time per function,
+    # caller → callee edges; call counts are sample counts
+    def pstats(self) -> bytes:
+        stats: Dict[Tuple, list] = {}
+        callers: Dict[Tuple, Dict[Tuple, list]] = {}
+        samples = self._snapshot()
+        keys = [(path, line, name) for name, path, line in self.frames]
+        for stacks in samples.values():
+            for stack, seconds in stacks:
+                # Recursive functions count once per sample in cumulative time
+                seen = set()
+                for depth, index in enumerate(stack):
+                    key = keys[index]
+                    entry = stats.setdefault(key, [0, 0, 0.0, 0.0])
+                    if key not in seen:
+                        seen.add(key)
+                        entry[0] += 1
+                        entry[1] += 1
+                        entry[3] += seconds
+                    if depth:
+                        edge = callers.setdefault(key, {}).setdefault(keys[stack[depth - 1]], [0, 0, 0.0, 0.0])
+                        edge[0] += 1
+                        edge[1] += 1
+                        edge[3] += seconds
+                        if depth == len(stack) - 1:
+                            edge[2] += seconds
+                stats[keys[stack[-1]]][2] += seconds
+        return marshal.dumps({key: (cc, nc, tt, ct, {caller: tuple(edge) for caller, edge in callers.get(key, {}).items()})
+                              for key, (cc, nc, tt, ct) in stats.items()})
+
+# Owns the running session, the sampler thread and the finished profiles
+class Profiler:
+    def __init__(self, interval: float = INTERVAL, keep: int = KEEP):
+        self.interval = interval
+        self.current: Optional[ProfileSession] = None
+        self.profiles: "OrderedDict[str, ProfileSession]" = OrderedDict()
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        # code object → (node, io, idle), so each code object is classified once
+        self._classes: Dict[Any, Tuple] = {}
+
+    # Start a session for the next `requests` profiled requests and/or `seconds` (capped at MAX_SECONDS).
+    # Returns None if one is already running
+    def start(self, requests: int = 0, seconds: float = 0.0) -> Optional[ProfileSession]:
+        seconds = min(seconds or MAX_SECONDS, MAX_SECONDS)
+        with self._lock:
+            if self.current is not None:
+                return None
+            global _active
+            session = self.current = _active = ProfileSession(requests, seconds)
+            self.profiles[session.id] = session
+            while len(self.profiles) > self.keep:
+                self.profiles.popitem(last=False)
+            self._thread = threading.Thread(target=self._sample, args=(session,), name="mcp-profiler", daemon=True)
+            self._thread.start()
+        return session
+
+    # Stop the running session (if any) and wait for the sampler to finish its last sample
+    def stop(self) -> Optional[ProfileSession]:
+        global _active
+        with self._lock:
+            session, self.current = self.current, None
+            if _active is session:
+                _active = None
+            thread = self._thread
+        if session is not None and session.running:
+            session.finished = time.perf_counter()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=1)
+        return session
+
+    # Session an incoming turn request belongs to (None = not profiled). A request carrying the token
+    # starts a one-request session if none runs
+    def join(self, header: Optional[str]) -> Optional[ProfileSession]:
+        forced = header is not None and authorized(header)
+        session = self.current
+        if session is None and forced:
+            session = self.start(requests=1) or self.current
+        if session is not None and session.admit(forced):
+            return session
+        return None
+
+    def finish_request(self, session: ProfileSession, path: str, seconds: float) -> None:
+        if session.request_done(path, seconds) and self.current is session:
+            self.stop()
+
+    def get(self, profile_id: str) -> Optional[ProfileSession]:
+        return self.profiles.get(profile_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        return [{"id": s.id, "status": "running" if s.running else "done", "requests": len(s.done),
+                 "started_at": s.started_at} for s in reversed(self.profiles.values())]
+
+    # Sampler thread: snapshot every other thread's stack each interval until the session ends. Each
+    # sample weighs the time since the previous one (so a late wake-up doesn't under-count)
+    def _sample(self, session: ProfileSession) -> None:
+        me = threading.get_ident()
+        classes = self._classes
+        last = time.perf_counter()
+        while session.running:
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                codes = []
+                while frame is not None:
+                    code = frame.f_code
+                    if code not in classes:
+                        classes[code] = _classify(code)
+                    codes.append(code)
+                    frame = frame.f_back
+                if not codes or classes[codes[0]][2]:
+                    session.idle_samples += 1
+                    continue
+                codes.reverse()
+                session.add(names.get(ident, str(ident)), codes, elapsed, classes, _THREAD_NODES.get(ident))
+            if now >= session.deadline:
+                # Time window over (the stop() below joins nothing: this is the sampler thread)
+                if self.current is session:
+                    self.stop()
+                session.finished = session.finished or now
+
+# ASGI middleware counting turn requests into the running session. Only installed when a token is set;
+# without a running session a request costs one attribute check (two with the profiling header)
+class ProfilingMiddleware:
+    def __init__(self, app, profiler: Profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in PROFILED_PATHS:
+            return await self.app(scope, receive, send)
+        header = None
+        for name, value in scope["headers"]:
+            if name == _HEADER_KEY:
+                header = value.decode("latin-1")
+                break
+        if header is None and self.profiler.current is None:
+            return await self.app(scope, receive, send)
+        session = self.profiler.join(header)
+        if session is None:
+            return await self.app(scope, receive, send)
+
+        # Tell the client which profile to download
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(ID_HEADER, session.id.encode())]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            self.profiler.finish_request(session, scope["path"], time.perf_counter() - started)
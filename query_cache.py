@@ -0,0 +1,101 @@
+# OrderedDict gives O(1) LRU bookkeeping
+from collections import OrderedDict
+# Futures let concurrent callers wait on one shared computation
+from concurrent.futures import Future
+# Type hints for better readability
+from typing import Any, Callable, Dict, Hashable, Optional
+# Thread safety + configuration from the environment
+import os
+import threading
+
+# Cached query embeddings (set to 0 to disable)
+QUERY_VECTOR_CACHE_SIZE = int(os.getenv("MCP_QUERY_VECTOR_CACHE_SIZE", "4096"))
+# Cached top-k results, keyed by index version (set to 0 to disable)
+QUERY_RESULT_CACHE_SIZE = int(os.getenv("MCP_QUERY_RESULT_CACHE_SIZE", "1024"))
+
+# Bounded, thread-safe LRU map with hit/miss counters
+class LRUCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Counters reported by stats()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Return the cached value, or None
+    def get(self, key: Hashable) -> Optional[Any]:
+        if not self.max_entries:
+            return None
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return value
+
+    # Store a value, evicting the least recently used ones beyond max_entries
+    def put(self, key: Hashable, value: Any) -> None:
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    # Counters and gauges for monitoring
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+# Request coalescing: while a call for a key is running, other callers with the same key wait
+# for its result instead of starting their own (N identical concurrent queries → 1 computation)
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        # Callers that were served by another caller's computation
+        self.coalesced = 0
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                future = self._calls[key] = Future()
+                leader = True
+
+        # Followers block on the leader's future (exceptions propagate to every waiter)
+        if not leader:
+            return future.result()
+
+        try:
+            result = func()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
@@ -0,0 +1,335 @@
+# Import argparse to pick which benchmark to run from the command line
+import argparse
+# Scratch directory for caches and indexes (keeps faiss_index and embedding_cache.db clean)
+import os
+import tempfile
+# Deterministic synthetic query logs
+import random
+# High resolution timer for latency measurements
+import time
+# Thread pool that issues concurrent queries (RAGManager.query is synchronous)
+from concurrent.futures import ThreadPoolExecutor
+
+# Sentences the synthetic medical corpus is built from
+CORPUS_SENTENCES = [
+    "Ibuprofen is a nonsteroidal anti-inflammatory drug used to reduce fever and treat pain.",
+    "The usual adult dose of paracetamol is 500 mg to 1 g every four to six hours.",
+    "Headache with fever and a stiff neck needs urgent medical evaluation.",
+    "Do not combine ibuprofen with other NSAIDs without medical advice.",
+    "Dehydration can cause headache, dizziness and fatigue.",
+    "Children should receive weight-based dosing of antipyretics.",
+]
+
+# Helper: `count` distinct chunk texts of roughly chunk_size characters
+def synthetic_chunks(count, chunk_size=600):
+    chunks = []
+    for i in range(count):
+        text = f"Section {i}. "
+        j = i
+        while len(text) < chunk_size:
+            text += CORPUS_SENTENCES[j % len(CORPUS_SENTENCES)] + " "
+            j += 7
+        chunks.append(text[:chunk_size])
+    return chunks
+
+# Questions the synthetic query log is drawn from (rank 0 is the most popular)
+QUESTION_TEMPLATES = [
+    "What is the dose of {} for adults?",
+    "Can I take {} with a fever?",
+    "Is {} safe for children?",
+    "What are the side effects of {}?",
+]
+DRUGS = ["ibuprofen", "paracetamol", "aspirin", "naproxen", "amoxicillin", "cetirizine", "loratadine",
+         "omeprazole", "metformin", "lisinopril", "atorvastatin", "salbutamol"]
+
+# Helper: nearest-rank percentile over a list of latency samples
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+# Helper: point the embedding cache at a scratch file before rag_manager is imported
+def _scratch_env():
+    scratch = tempfile.mkdtemp(prefix="rag-bench-")
+    os.environ.setdefault("MCP_EMBED_CACHE", os.path.join(scratch, "embeddings.db"))
+    return scratch
+
+# Helper: the embedding model the RAG manager uses
+def load_embeddings():
+    _scratch_env()
+    from rag_manager import RAGManager
+    return RAGManager().embeddings
+
+# Helper: a RAGManager over `chunks` synthetic chunks (spread over `sources` documents), indexed in a scratch directory
+def load_rag(chunks, sources=1000):
+    """
+    Builds a throwaway index so the benchmark never touches faiss_index/.
+    """
+    scratch = _scratch_env()
+    from langchain_core.documents import Document
+    from rag_manager import RAGManager
+
+    rag = RAGManager(index_path=os.path.join(scratch, "index"))
+    rag.create_vectorstore([
+        Document(page_content=text, metadata={"source": f"doc-{i % sources}.pdf", "chunk": i})
+        for i, text in enumerate(synthetic_chunks(chunks))
+    ])
+    return rag
+
+# Helper: a Zipf-distributed query log over `distinct` questions (weight of rank r ∝ 1 / r^s)
+def zipf_log(distinct, length, s=1.1, seed=0):
+    questions = [QUESTION_TEMPLATES[i % len(QUESTION_TEMPLATES)].format(f"{DRUGS[i % len(DRUGS)]} {i // len(DRUGS)}")
+                 for i in range(distinct)]
+    weights = [1 / (rank + 1) ** s for rank in range(distinct)]
+    return random.Random(seed).choices(questions, weights=weights, k=length)
+
+def run_embed_benchmark(chunks, batch_size, workers):
+    """
+    Embedding pipeline throughput: cold cache, warm cache (re-ingesting the same corpus) and a
+    re-chunked corpus where only part of the chunks changed, for each worker count.
+    """
+    from embedding_pipeline import EmbeddingCache, EmbeddingPipeline
+
+    embeddings = load_embeddings()
+    corpus = synthetic_chunks(chunks)
+    # A "chunk_size tweak": a quarter of the chunks come out different, the rest are identical
+    rechunked = corpus[: chunks * 3 // 4] + synthetic_chunks(chunks - chunks * 3 // 4, chunk_size=550)
+    print(f"{'workers':>7} {'run':>10} {'chunks/s':>12} {'hit rate':>9} {'encoded':>8}")
+    for worker_count in workers:
+        scratch = tempfile.mkdtemp(prefix="rag-bench-")
+        cache = EmbeddingCache(os.path.join(scratch, "embeddings.db"))
+        pipeline = EmbeddingPipeline(embeddings, batch_size=batch_size, workers=worker_count, cache=cache)
+        for label, texts in (("cold", corpus), ("warm", corpus), ("rechunked", rechunked)):
+            pipeline.embed(texts)
+            run = pipeline.last_run
+            print(f"{worker_count:>7} {label:>10} {run['chunks_per_sec']:>12.0f} {run['hit_rate']:>9.2f} {run['encoded']:>8}")
+        pipeline.close()
+        cache.close()
+
+# Replay a query log with `concurrency` threads; return (qps, p50, p99)
+def _replay(rag, log, concurrency):
+    latencies = []
+
+    def one(question):
+        start = time.perf_counter()
+        rag.query(question)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    if concurrency == 1:
+        for question in log:
+            one(question)
+    else:
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(one, log))
+    elapsed = time.perf_counter() - start
+    return len(log) / elapsed, percentile(latencies, 50), percentile(latencies, 99)
+
+def run_query_benchmark(chunks, distinct, length, concurrency):
+    """
+    RAGManager.query on a Zipf-distributed query log: no caching vs. the query-vector cache vs.
+    vector + result caches (with request coalescing), sequentially and with concurrent callers.
+    """
+    from query_cache import LRUCache, SingleFlight
+
+    rag = load_rag(chunks)
+    log = zipf_log(distinct, length)
+    print(f"{len(log)} queries, {len(set(log))} distinct, index of {chunks} chunks")
+    print(f"{'mode':>16} {'threads':>7} {'qps':>9} {'p50 ms':>8} {'p99 ms':>8} {'vec hit':>8} {'res hit':>8} {'coalesced':>9}")
+    for label, vector_size, result_size in (("uncached", 0, 0), ("vector cache", 4096, 0), ("vector+results", 4096, 1024)):
+        for threads in (1, concurrency):
+            rag.query_vectors = LRUCache(vector_size)
+            rag.query_results = LRUCache(result_size)
+            rag._inflight = SingleFlight()
+            qps, p50, p99 = _replay(rag, log, threads)
+            stats = rag.cache_stats()
+            print(f"{label:>16} {threads:>7} {qps:>9.0f} {p50 * 1000:>8.2f} {p99 * 1000:>8.2f} "
+                  f"{stats['query_vectors']['hit_rate']:>8.2f} {stats['query_results']['hit_rate']:>8.2f} {stats['coalesced']:>9}")
+
+def run_filter_benchmark(chunks, queries):
+    """
+    Filtered retrieval: the old Python-callable filter (over-fetch fetch_k candidates, then call back
+    per document) vs. the metadata pre-filter, for filters selecting 100%, 10%, 1% and 0.1% of chunks.
+    Also reports how many of the k=4 results each approach actually returns.
+    """
+    sources = 1000
+    rag = load_rag(chunks, sources)
+    store = rag.vectorstore
+    vectors = [rag._query_vector(q) for q in zipf_log(queries, queries)]
+    print(f"{'selected':>9} {'callable us':>12} {'results':>8} {'prefilter us':>13} {'results':>8}")
+    for fraction in (1.0, 0.1, 0.01, 0.001):
+        wanted = [f"doc-{i}.pdf" for i in range(int(sources * fraction))]
+        wanted_set = set(wanted)
+        rag.query_results.clear()
+
+        start = time.perf_counter()
+        legacy = [store.similarity_search_by_vector(v, k=4, filter=lambda md: md.get("source") in wanted_set) for v in vectors]
+        legacy_us = (time.perf_counter() - start) / len(vectors) * 1e6
+
+        metadata_filter = None if fraction == 1.0 else {"source": wanted}
+        rag.metadata_index()  # Built once per index version, not per query
+        start = time.perf_counter()
+        found = [rag._search_by_vector(v, metadata_filter) for v in vectors]
+        prefilter_us = (time.perf_counter() - start) / len(vectors) * 1e6
+
+        print(f"{fraction:>9.1%} {legacy_us:>12.0f} {sum(map(len, legacy)) / len(vectors):>8.2f} "
+              f"{prefilter_us:>13.0f} {sum(map(len, found)) / len(vectors):>8.2f}")
+
+# Helper: n unit-length vectors with low intrinsic dimension (a stand-in for sentence embeddings)
+def synthetic_vectors(n, dim=384, latent=48, seed=0):
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    projection = rng.normal(size=(latent, dim)).astype("float32")
+    vectors = rng.normal(size=(n, latent)).astype("float32") @ projection
+    vectors += 0.1 * rng.normal(size=(n, dim)).astype("float32")
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+# Helper: queries near (but not equal to) random corpus vectors
+def synthetic_queries(vectors, count, seed=1):
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.integers(0, len(vectors), count)] + 0.05 * rng.normal(size=(count, vectors.shape[1])).astype("float32")
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+def run_index_benchmark(sizes, queries, types):
+    """
+    Each FAISS index type against the exact flat baseline: build time, serialized memory, recall@4
+    and single-query QPS, for several nprobe/efSearch settings and corpus sizes.
+    """
+    import faiss
+    import numpy as np
+    from faiss_indexes import build_index, index_memory_bytes, set_search_params
+
+    settings = {"flat": [None], "ivf_flat": [1, 8, 32], "ivf_sq8": [1, 8, 32], "ivf_pq": [1, 8, 32], "hnsw": [16, 64, 256]}
+    print(f"{'chunks':>8} {'index':>9} {'param':>6} {'build s':>8} {'MB':>8} {'recall@4':>9} {'qps':>8}")
+    for size in sizes:
+        vectors = synthetic_vectors(size)
+        query_vectors = synthetic_queries(vectors, queries)
+        truth = faiss.IndexFlatL2(vectors.shape[1])
+        truth.add(vectors)
+        _, expected = truth.search(query_vectors, 4)
+
+        for kind in types:
+            start = time.perf_counter()
+            index = build_index(vectors, kind)
+            index.add(vectors)
+            build = time.perf_counter() - start
+            megabytes = index_memory_bytes(index) / 1e6
+            for param in settings[kind]:
+                if kind == "hnsw":
+                    set_search_params(index, ef_search=param)
+                elif param:
+                    set_search_params(index, nprobe=param)
+                # One query at a time, like RAGManager.query
+                start = time.perf_counter()
+                found = np.vstack([index.search(query_vectors[i:i + 1], 4)[1] for i in range(queries)])
+                qps = queries / (time.perf_counter() - start)
+                recall = np.mean([len(set(f) & set(e)) / 4 for f, e in zip(found, expected)])
+                print(f"{size:>8} {kind:>9} {param or '-':>6} {build:>8.2f} {megabytes:>8.1f} {recall:>9.3f} {qps:>8.0f}")
+
+# Run in a fresh interpreter: load the index at argv[2] in format argv[1] (pickle = FAISS.load_local, mmap =
+# RAGManager.load_vectorstore), run one filtered search and print "load_s first_search_s peak_rss_mb mapped"
+# (mapped = 1 when the index file shows up in /proc/self/maps, i.e. its pages are shared, not copied)
+_COLDSTART_PROBE = """
+import sys, time
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from rag_manager import RAGManager
+rag = RAGManager()
+start = time.perf_counter()
+if sys.argv[1] == "pickle":
+    rag.vectorstore = FAISS.load_local(sys.argv[2], rag.embeddings, allow_dangerous_deserialization=True)
+else:
+    rag.load_vectorstore(sys.argv[2])
+loaded = time.perf_counter() - start
+vector = np.random.default_rng(0).normal(size=rag.vectorstore.index.d).astype("float32")
+rag._search_by_vector(vector, {"source": "doc-7.pdf"}, 4)
+first = time.perf_counter() - start - loaded
+# Peak RSS of this interpreter (ru_maxrss would include the parent's peak, it survives exec)
+peak = next(line for line in open("/proc/self/status") if line.startswith("VmHWM")).split()[1]
+mapped = any(line.rstrip().endswith("index.faiss") for line in open("/proc/self/maps"))
+print(loaded, first, int(peak) / 1024, int(mapped))
+"""
+
+def run_coldstart_benchmark(sizes):
+    """
+    Cold start of a fresh process: FAISS.load_local (index + pickled docstore, the format save_local
+    writes) vs. the memory-mapped index + SQLite chunk file written by save_vectorstore.
+    Load time covers opening the index only; first search includes building the metadata index.
+    """
+    import shutil
+    import subprocess
+    import sys
+    from langchain_core.documents import Document
+
+    scratch = _scratch_env()
+    from rag_manager import RAGManager
+
+    print(f"{'chunks':>8} {'format':>7} {'disk MB':>8} {'load s':>8} {'1st query s':>12} {'RSS MB':>8} {'mapped':>7}")
+    for size in sizes:
+        rag = RAGManager(index_path=os.path.join(scratch, f"index-{size}"))
+        texts = synthetic_chunks(size)
+        vectors = synthetic_vectors(size, dim=len(rag.embeddings.embed_query("probe")))
+        rag.vectorstore = rag._new_store(list(zip(texts, vectors.tolist())),
+                                         [{"source": f"doc-{i % 1000}.pdf", "chunk": i} for i in range(size)])
+        pickled = os.path.join(scratch, f"pickled-{size}")
+        rag.vectorstore.save_local(pickled)
+        rag.save_vectorstore()
+        current = os.path.join(rag.index_path, rag.loaded_version)
+
+        for label, path, folder in (("pickle", pickled, pickled), ("mmap", rag.index_path, current)):
+            megabytes = sum(os.path.getsize(os.path.join(folder, f)) for f in os.listdir(folder)) / 1e6
+            output = subprocess.run([sys.executable, "-c", _COLDSTART_PROBE, label, path], capture_output=True,
+                                    text=True, check=True).stdout.split()
+            loaded, first, rss, mapped = (float(value) for value in output[-4:])
+            print(f"{size:>8} {label:>7} {megabytes:>8.1f} {loaded:>8.3f} {first:>12.3f} {rss:>8.0f} "
+                  f"{'yes' if mapped else 'no':>7}")
+        shutil.rmtree(pickled)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Performance benchmarks for retrieval (RAGManager)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    # `python rag_bench.py embed` → chunk embedding throughput and cache hit rate
+    embed = subparsers.add_parser("embed", help="Embedding pipeline throughput with and without the chunk cache")
+    embed.add_argument("--chunks", type=int, default=2000)
+    embed.add_argument("--batch-size", type=int, default=64)
+    embed.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+
+    # `python rag_bench.py query` → query caches and coalescing on a Zipf query log
+    query = subparsers.add_parser("query", help="RAGManager.query with and without query caches")
+    query.add_argument("--chunks", type=int, default=20000, help="Chunks in the synthetic index")
+    query.add_argument("--distinct", type=int, default=2000, help="Distinct questions in the log")
+    query.add_argument("--length", type=int, default=5000, help="Queries replayed")
+    query.add_argument("--concurrency", type=int, default=16)
+
+    # `python rag_bench.py index` → recall/QPS/memory of each FAISS index type
+    index = subparsers.add_parser("index", help="Recall@4, QPS and memory of flat, IVF, HNSW and quantized indexes")
+    index.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    index.add_argument("--queries", type=int, default=1000)
+    index.add_argument("--types", nargs="+", default=["flat", "ivf_flat", "ivf_sq8", "ivf_pq", "hnsw"])
+
+    # `python rag_bench.py filter` → callable metadata filter vs. indexed pre-filter
+    filtering = subparsers.add_parser("filter", help="Python-callable filter vs. metadata pre-filter")
+    filtering.add_argument("--chunks", type=int, default=20000)
+    filtering.add_argument("--queries", type=int, default=200)
+
+    # `python rag_bench.py coldstart` → process start-up with the pickled vs. memory-mapped index format
+    coldstart = subparsers.add_parser("coldstart", help="Index load time and RSS: pickled docstore vs. mmap + SQLite")
+    coldstart.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+
+    args = parser.parse_args()
+    if args.command == "embed":
+        run_embed_benchmark(args.chunks, args.batch_size, args.workers)
+    elif args.command == "query":
+        run_query_benchmark(args.chunks, args.distinct, args.length, args.concurrency)
+    elif args.command == "filter":
+        run_filter_benchmark(args.chunks, args.queries)
+    elif args.command == "index":
+        run_index_benchmark(args.sizes, args.queries, args.types)
+    elif args.command == "coldstart":
+        run_coldstart_benchmark(args.sizes)
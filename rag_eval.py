@@ -1,15 +1,21 @@
-from langsmith import Client
-from langchain.smith import RunEvalConfig
-from rag_manager import RAGManager
 import os
 import time
 
-# Set environment variables
-# These environment variables enable access to the LangChain API and enable tracing for debugging
-os.environ["LANGCHAIN_API_KEY"] = "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"  # Set the LangChain API key
-os.environ["LANGCHAIN_TRACING_V2"] = "true"  # Enable tracing for tracking API interactions
+# Define test cases with questions, expected answers, and relevant keywords (also run offline by eval_bench.py)
+RAG_TEST_CASES = [
+    {"question": "What are flu symptoms?", "expected": "fever", "keywords": ["fever", "cough", "throat"]},  # Flu symptoms query
+    {"question": "How to treat flu?", "expected": "rest", "keywords": ["rest", "fluids"]}  # Flu treatment query
+]
 
-client = Client()  # Initialize the LangChain client to interact with the LangChain API
+# Helper: LangSmith client, created on first use so the evaluators and test cases import without LangSmith
+def langsmith_client():
+    from langsmith import Client
+
+    # Set environment variables
+    # These environment variables enable access to the LangChain API and enable tracing for debugging
+    os.environ["LANGCHAIN_API_KEY"] = "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"  # Set the LangChain API key
+    os.environ["LANGCHAIN_TRACING_V2"] = "true"  # Enable tracing for tracking API interactions
+    return Client()  # Initialize the LangChain client to interact with the LangChain API
 
 # Custom evaluators
 def retrieval_accuracy(run, example):
@@ -32,6 +38,11 @@ def run_rag_evaluation():
     """
     Function to evaluate the Retrieval-Augmented Generation (RAG) system using custom evaluators.
     """
+    from langchain.smith import RunEvalConfig
+    from rag_manager import RAGManager
+
+    client = langsmith_client()
+
     # Initialize the RAG system (RAGManager is assumed to manage RAG-related functionalities)
     rag = RAGManager()  # Create an instance of the RAG manager
     if not hasattr(rag, "query"):  # Ensure that the RAGManager has a 'query' method
@@ -51,14 +62,8 @@ def run_rag_evaluation():
         existing = list(client.list_datasets(dataset_name=dataset_name))
         dataset = existing[0] if existing else client.create_dataset(dataset_name)  # Use the first found dataset or create a new one
 
-    # Define test cases with questions, expected answers, and relevant keywords
-    test_cases = [
-        {"question": "What are flu symptoms?", "expected": "fever", "keywords": ["fever", "cough", "throat"]},  # Flu symptoms query
-        {"question": "How to treat flu?", "expected": "rest", "keywords": ["rest", "fluids"]}  # Flu treatment query
-    ]
-
     # Add examples to the dataset
-    for case in test_cases:
+    for case in RAG_TEST_CASES:
         client.create_example(
             inputs={"question": case["question"]},  # Use the question as input
             outputs={"expected": case["expected"], "keywords": case["keywords"]},  # Use expected output and keywords
@@ -1,78 +1,429 @@
-# Import HuggingFaceEmbeddings to generate vector representations (embeddings) of text
-from langchain_huggingface import HuggingFaceEmbeddings
 # Import FAISS to create and manage an efficient vector store (similarity search engine)
 from langchain_community.vectorstores import FAISS
-# Import a PDF loader to extract text content from PDFs
-from langchain_community.document_loaders import PDFMinerLoader
+from langchain_community.docstore.in_memory import InMemoryDocstore
+# Pickle-free persistence: chunk texts/metadata in SQLite, read lazily by id
+from chunk_store import CHUNKS_FILE, ChunkFile, LazyIdMap, SQLiteDocstore, write_chunks
+# Index types beyond exact flat search (IVF, HNSW, PQ/SQ8) and their query-time knobs
+from faiss_indexes import FAISS_INDEX_TYPE, build_index, enable_reconstruct, read_index_mmap, search_subset, set_search_params, supports_positional_delete
+# Inverted index over chunk metadata, used to pre-filter searches
+from metadata_index import MetadataIndex
+import faiss
+import numpy as np
 # Import a text splitter to divide documents into manageable chunks
 from langchain_text_splitters import CharacterTextSplitter
+# FAISS search timing histogram (sampled, see metrics.SAMPLE_RATE)
+from metrics import IO_LATENCY
+# Batched, cached chunk embedding used by ingestion
+from embedding_pipeline import EmbeddingPipeline
+# Query-vector/result caches and request coalescing for query()
+from query_cache import QUERY_RESULT_CACHE_SIZE, QUERY_VECTOR_CACHE_SIZE, LRUCache, SingleFlight
+# Same normalization as the ToolAgent memo ("Fever?" and " fever? " share cache entries)
+from response_cache import normalize_message
+# Type hints for better readability
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence
+# Hashing, manifest files and the versioned on-disk layout used by incremental ingestion
+import hashlib
+import json
+import os
+import shutil
+import time
+
+# File that names the index version currently being served (inside the index directory)
+CURRENT_FILE = "CURRENT"
+# Per-version record of every ingested source, its content hash and the ids of its chunks
+MANIFEST_FILE = "manifest.json"
+# How many older versions to keep around for readers that are still loading them
+KEEP_VERSIONS = 2
+# FAISS index file inside a version directory (written with faiss.write_index, loaded with mmap)
+INDEX_FILE = "index.faiss"
+
+# Helper: chunks of a PDF, extracted page by page and split as each page arrives
+# (pdfminer parses one page at a time, so memory doesn't grow with the size of the document)
+def iter_pdf_chunks(pdf_path: str, text_splitter) -> Iterator:
+    # Import a PDF loader to extract text content from PDFs (pdfminer is only needed by ingestion)
+    from langchain_community.document_loaders import PDFMinerLoader
+    for page in PDFMinerLoader(pdf_path, mode="page").lazy_load():
+        yield from text_splitter.split_documents([page])
+
+# Helper: tag the i-th chunk of a source with its metadata and return its id
+# (ids derive from the source key and the file hash: they only change when the file content does, and
+# byte-identical files at different paths still get distinct ids)
+def tag_chunk(doc, key: str, digest: str, i: int) -> str:
+    doc.metadata = {**doc.metadata, "source": key, "chunk": i, "medical_content": True}
+    return f"{hashlib.sha256((key + digest).encode()).hexdigest()[:16]}-{i}"
+
+# Helper: SHA-256 of a file's bytes (read in 1MB blocks so large PDFs don't sit in memory)
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
 
 # Define a class to manage the RAG (Retrieval Augmented Generation) process
 class RAGManager:
-    def __init__(self):
+    def __init__(self, index_path: str = "faiss_index", index_type: str = FAISS_INDEX_TYPE):
+        # Import HuggingFaceEmbeddings here, not at module level: it pulls in torch + sentence-transformers,
+        # which helpers like iter_pdf_chunks (used by ingestion workers) don't need
+        from langchain_huggingface import HuggingFaceEmbeddings
+
         # Initialize HuggingFaceEmbeddings to convert text to embeddings (vectors)
         self.embeddings = HuggingFaceEmbeddings(
             model_name="all-MiniLM-L6-v2",              # Choose a lightweight model that's fast and good for semantic search
             model_kwargs={"device": "cpu"},             # Run on CPU (can switch to GPU if needed)
             encode_kwargs={"normalize_embeddings": True} # Normalize output embeddings for better cosine similarity search
         )
-        
+
         # Initialize a text splitter to split documents into smaller, overlapping chunks
         self.text_splitter = CharacterTextSplitter(
             chunk_size=600,        # Each chunk is about 600 characters
             chunk_overlap=150,     # 150 characters overlap between chunks (helps preserve context across chunks)
             separator="\n\n"       # Split text on double newlines (natural paragraph breaks)
         )
-        
+
         # Initialize the vectorstore object (will be assigned later)
         self.vectorstore = None
 
+        # Where the versioned index lives, which version is loaded, and what it contains
+        self.index_path = index_path
+        self.index_type = index_type  # Used when a new index is built (flat, ivf_flat, hnsw, ivf_pq, ivf_sq8)
+        self.loaded_version = None
+        self.mmapped = False  # True while the index is a read-only memory map of INDEX_FILE
+        self.manifest: Dict[str, dict] = {"sources": {}, "tombstones": {}}
+        # Bumped on every change to the loaded index (lets caches know their results are stale)
+        self.index_version = 0
+
+        # Ingestion-side embedding pipeline (created on first ingestion; query-only use never opens its cache)
+        self._pipeline = None
+
+        # Query side: cached query vectors, cached top-k results (keyed by index_version) and
+        # coalescing of identical in-flight queries
+        self.query_vectors = LRUCache(QUERY_VECTOR_CACHE_SIZE)
+        self.query_results = LRUCache(QUERY_RESULT_CACHE_SIZE)
+        self._inflight = SingleFlight()
+
+        # Metadata → positions index for filtered queries (rebuilt lazily when index_version changes)
+        self._metadata = None
+        self._metadata_version = None
+
+    # Batched, cached embedding pipeline sharing this manager's model
+    @property
+    def pipeline(self) -> EmbeddingPipeline:
+        if self._pipeline is None:
+            self._pipeline = EmbeddingPipeline(self.embeddings)
+        return self._pipeline
+
+    # Helper: (text, vector) pairs for a list of chunks, through the embedding pipeline
+    def _embed_documents(self, documents):
+        texts = [doc.page_content for doc in documents]
+        return list(zip(texts, self.pipeline.embed(texts)))
+
+    # Helper: new vectorstore of the configured index type from (text, vector) pairs
+    def _new_store(self, text_embeddings, metadatas, ids=None):
+        if self.index_type == "flat":
+            return FAISS.from_embeddings(text_embeddings, self.embeddings, metadatas=metadatas, ids=ids)
+        # Approximate indexes are trained on the corpus first, then filled through the wrapper
+        index = build_index(np.asarray([vector for _, vector in text_embeddings], dtype="float32"), self.index_type)
+        store = FAISS(self.embeddings, index, InMemoryDocstore(), {})
+        store.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+        return store
+
+    # Set query-time accuracy/speed trade-offs (IVF nprobe, HNSW efSearch) on the loaded index
+    def tune(self, nprobe: int = None, ef_search: int = None):
+        set_search_params(self.vectorstore.index, nprobe=nprobe, ef_search=ef_search)
+        self.index_version += 1
+
     # Method to load documents from a PDF file
     def load_documents(self, pdf_path: str):
-        # Use PDFMinerLoader to extract text from the given PDF path
-        docs = PDFMinerLoader(pdf_path).load()
-        # Split extracted text into smaller chunks for better embedding and retrieval
-        return self.text_splitter.split_documents(docs)
+        # Extract text with PDFMinerLoader and split it into smaller chunks for better embedding and retrieval
+        return list(iter_pdf_chunks(pdf_path, self.text_splitter))
 
-    # Method to create a vectorstore (FAISS index) from a list of documents
+    # Method to create a vectorstore (FAISS index) from a list of documents (full rebuild)
     def create_vectorstore(self, documents):
         # Add metadata to each document (optional: here tagging documents as medical)
         for doc in documents:
-            doc.metadata = {"medical_content": True}
+            doc.metadata = {**doc.metadata, "medical_content": True}
+
+        # Build the FAISS vector store from the documents and their (cached) embeddings
+        self.vectorstore = self._new_store(
+            self._embed_documents(documents),
+            metadatas=[doc.metadata for doc in documents],
+        )
+        self.manifest = {"sources": {}, "tombstones": {}}
+        self.index_version += 1
 
-        # Build the FAISS vector store from the documents and their embeddings
-        self.vectorstore = FAISS.from_documents(documents, self.embeddings)
-        
         # Save the FAISS index locally (to avoid recomputation later)
-        self.vectorstore.save_local("faiss_index")
+        self.save_vectorstore()
+
+    # Incrementally bring the index in line with a set of PDF files:
+    # unchanged files are skipped, new/changed files are embedded and appended, and files that
+    # changed (or, with prune=True, disappeared from the list) have their old chunks tombstoned.
+    # The result is published as a new index version with an atomic pointer swap
+    def ingest(self, pdf_paths: Sequence[str], prune: bool = False) -> Dict[str, int]:
+        # Ingestion modifies the index, so it needs a private in-memory copy rather than the shared mmap
+        if (self.vectorstore is None or self.mmapped) and self._current_version():
+            self.load_vectorstore(self.index_path, writable=True)
+
+        sources = self.manifest["sources"]
+        stats = {"unchanged": 0, "added": 0, "updated": 0, "removed": 0, "chunks_added": 0, "chunks_removed": 0}
+        stale_ids: List[str] = []
+        new_docs, new_ids = [], []
+        requested = set()
+
+        for path in pdf_paths:
+            key, entry = self._check_source(path)
+            requested.add(key)
+            if entry is None:
+                stats["unchanged"] += 1
+                continue
+
+            # New or changed content: embed its chunks, tombstone the previous version's chunks
+            if key in sources:
+                stale_ids.extend(sources[key]["ids"])
+                stats["updated"] += 1
+            else:
+                stats["added"] += 1
+            chunks = self.load_documents(path)
+            entry["ids"] = [tag_chunk(doc, key, entry["hash"], i) for i, doc in enumerate(chunks)]
+            new_docs.extend(chunks)
+            new_ids.extend(entry["ids"])
+            sources[key] = entry
+
+        # Sources that are no longer part of the corpus
+        if prune:
+            for key in [k for k in sources if k not in requested]:
+                stale_ids.extend(sources.pop(key)["ids"])
+                self.manifest["tombstones"][key] = time.time()
+                stats["removed"] += 1
+
+        if not stale_ids and not new_docs:
+            return stats
+
+        # Apply the changes to the in-memory index: delete stale chunks, append new ones (embedded through the pipeline)
+        if stale_ids and self.vectorstore is not None:
+            stats["chunks_removed"] = len(stale_ids)
+            if not supports_positional_delete(self.vectorstore.index):
+                # IVF/HNSW ids don't shift on removal: rebuild from the surviving chunks (cache hits, no re-encoding)
+                self._rebuild_without(stale_ids, new_docs, new_ids)
+                stats["chunks_added"] = len(new_docs)
+                new_docs = []
+            else:
+                self.vectorstore.delete(stale_ids)
+        if new_docs:
+            self._add_chunks(self._embed_documents(new_docs), [doc.metadata for doc in new_docs], new_ids)
+            stats["chunks_added"] = len(new_docs)
+
+        self.index_version += 1
+        self.save_vectorstore()
+        return stats
 
-    # Method to load an already saved vectorstore (instead of recreating)
-    def load_vectorstore(self, path="faiss_index"):
+    # Helper: (absolute path, new manifest entry) for a source; the entry is None when the source is unchanged.
+    # Sources left partially ingested by an interrupted streaming run (see ingest.py) never count as unchanged
+    def _check_source(self, path: str):
+        key = os.path.abspath(path)
+        stat = os.stat(path)
+        entry = self.manifest["sources"].get(key)
+        complete = entry is not None and entry.get("complete", True)
+
+        # Cheap check first: same size and mtime → unchanged without reading the file
+        if complete and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            return key, None
+        digest = file_hash(path)
+        if complete and entry["hash"] == digest:
+            entry.update(size=stat.st_size, mtime=stat.st_mtime)
+            return key, None
+        return key, {"hash": digest, "size": stat.st_size, "mtime": stat.st_mtime, "ids": []}
+
+    # Helper: append embedded chunks to the in-memory index (creating it on first use)
+    def _add_chunks(self, text_embeddings, metadatas, ids):
+        if self.vectorstore is None:
+            self.vectorstore = self._new_store(text_embeddings, metadatas, ids=ids)
+        else:
+            self.vectorstore.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+
+    # Helper: remove chunks from the in-memory index
+    def _drop_chunks(self, stale_ids):
+        if supports_positional_delete(self.vectorstore.index):
+            self.vectorstore.delete(stale_ids)
+        else:
+            # IVF/HNSW ids don't shift on removal: rebuild from the surviving chunks (cache hits, no re-encoding)
+            self._rebuild_without(stale_ids, [], [])
+
+    # Helper: rebuild the index without `stale_ids`, plus new documents (vectors come from the embedding cache)
+    def _rebuild_without(self, stale_ids, new_docs, new_ids):
+        stale = set(stale_ids)
+        store = self.vectorstore
+        keep_ids = [doc_id for doc_id in store.index_to_docstore_id.values() if doc_id not in stale]
+        docs = [store.docstore.search(doc_id) for doc_id in keep_ids] + list(new_docs)
+        self.vectorstore = self._new_store(
+            self._embed_documents(docs), [doc.metadata for doc in docs], ids=keep_ids + list(new_ids)
+        )
+
+    # Publish the in-memory index as a new version: write it to a fresh directory, then atomically
+    # repoint CURRENT at it. Readers see either the old or the new version, never a partial one
+    def save_vectorstore(self, path: str = None):
+        path = path or self.index_path
+        version = f"v-{time.time_ns()}"
+        target = os.path.join(path, version)
+        os.makedirs(target)
+
+        # Save the FAISS index, the chunks and the manifest locally (to avoid recomputation later)
+        faiss.write_index(self.vectorstore.index, os.path.join(target, INDEX_FILE))
+        write_chunks(os.path.join(target, CHUNKS_FILE), self.vectorstore.index_to_docstore_id, self.vectorstore.docstore)
+        with open(os.path.join(target, MANIFEST_FILE), "w") as f:
+            json.dump(self.manifest, f)
+
+        # Atomic swap of the pointer file (os.replace is atomic on POSIX and Windows)
+        pointer_tmp = os.path.join(path, CURRENT_FILE + ".tmp")
+        with open(pointer_tmp, "w") as f:
+            f.write(version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(pointer_tmp, os.path.join(path, CURRENT_FILE))
+        self.loaded_version = version
+        self._prune_versions(path)
+
+    # Method to load an already saved vectorstore (instead of recreating).
+    # The index is memory-mapped read-only (pages shared by every process serving it) and chunks are read
+    # from SQLite on demand, so start-up cost doesn't grow with the corpus. writable=True loads a private copy
+    def load_vectorstore(self, path="faiss_index", writable: bool = False):
+        # Versioned layout: follow CURRENT; older flat layout: the directory itself is the index
+        self.index_path = path
+        version = self._current_version(path)
+        folder = os.path.join(path, version) if version else path
+
+        if not os.path.exists(os.path.join(folder, CHUNKS_FILE)):
+            return self._migrate_pickled(path, folder)
+
+        index_file = os.path.join(folder, INDEX_FILE)
+        index = faiss.read_index(index_file) if writable else read_index_mmap(index_file)
+        chunks = ChunkFile(os.path.join(folder, CHUNKS_FILE))
+        self.vectorstore = FAISS(self.embeddings, index, SQLiteDocstore(chunks), LazyIdMap(chunks))
+        self.mmapped = not writable
+
+        # Apply the configured nprobe/efSearch (no-op for flat indexes). Only a private copy gets an IVF direct
+        # map (8 bytes per vector, built in every process that asks for it): read-only workers score small
+        # filtered selections through the index with an ID selector instead of reconstructing them exactly
+        set_search_params(self.vectorstore.index)
+        if writable:
+            enable_reconstruct(self.vectorstore.index)
+
+        # Manifest of ingested sources (absent for indexes built before incremental ingestion)
+        manifest_path = os.path.join(folder, MANIFEST_FILE)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {"sources": {}, "tombstones": {}}
+        self.loaded_version = version
+        self.index_version += 1
+
+    # One-time migration of an index saved by FAISS.save_local (index.faiss + pickled docstore):
+    # unpickle it once, publish it in the new format, then serve the new format from then on
+    def _migrate_pickled(self, path: str, folder: str):
         # Load FAISS index from the given path using the same embeddings model
         self.vectorstore = FAISS.load_local(
-            path,
+            folder,
             self.embeddings,
             allow_dangerous_deserialization=True # Allow full deserialization (needed for FAISS internal data)
         )
+        self.manifest = {"sources": {}, "tombstones": {}}
+        self.mmapped = False
+        try:
+            self.save_vectorstore(path)
+        except OSError:
+            # Read-only location: keep serving the unpickled copy
+            self.loaded_version = None
+        set_search_params(self.vectorstore.index)
+        enable_reconstruct(self.vectorstore.index)
+        self.index_version += 1
+
+    # Reload if another process published a newer version (cheap: reads one small file)
+    def reload_if_changed(self) -> bool:
+        version = self._current_version()
+        if version and version != self.loaded_version:
+            self.load_vectorstore(self.index_path)
+            return True
+        return False
+
+    def _current_version(self, path: str = None):
+        pointer = os.path.join(path or self.index_path, CURRENT_FILE)
+        if not os.path.exists(pointer):
+            return None
+        with open(pointer) as f:
+            return f.read().strip() or None
+
+    # Delete old versions, keeping the current one and the most recent predecessors
+    def _prune_versions(self, path: str):
+        versions = sorted(d for d in os.listdir(path) if d.startswith("v-") and os.path.isdir(os.path.join(path, d)))
+        for old in versions[:-KEEP_VERSIONS]:
+            shutil.rmtree(os.path.join(path, old), ignore_errors=True)
 
     # Method to perform a search query against the vectorstore
-    def query(self, question: str):
+    # `filter` restricts the search to chunks whose metadata matches, e.g. {"source": "/docs/a.pdf"} or
+    # {"medical_content": True, "tags": ["dosage", "pediatric"]} (fields ANDed, list values ORed)
+    def query(self, question: str, filter: Optional[Mapping[str, Any]] = None):
         # Raise an error if vectorstore is not loaded yet
         if not self.vectorstore:
             raise ValueError("Vectorstore not loaded yet.")
-        
+
+        # Results are only reusable for the index version (and filter) they were computed on
+        filter_key = tuple(sorted((field, tuple(v) if isinstance(v, (list, tuple, set)) else v)
+                                  for field, v in (filter or {}).items()))
+        key = (normalize_message(question), filter_key, self.index_version)
+        results = self.query_results.get(key)
+        if results is None:
+            # N concurrent identical questions share one encode and one FAISS search
+            results = self._inflight.do(key, lambda: self._search(key[0], filter))
+            self.query_results.put(key, results)
+
+        # Return the results in a clean dictionary format (content + metadata), copied so callers can't edit the cache
+        return [{"content": r["content"], "metadata": dict(r["metadata"])} for r in results]
+
+    # Embedding of the enriched query (cached: popular questions are encoded once)
+    def _query_vector(self, question: str):
         # Enrich the user query by adding keywords (boosts retrieval quality for medical context)
         query = f"{question} symptoms treatment dosage"
-        
-        # Perform a similarity search on the vectorstore
-        results = self.vectorstore.similarity_search(
-            query,
-            k=4, # Retrieve top 4 similar documents
-            filter=lambda d: hasattr(d, "metadata") # Optional: Only consider documents with metadata
-        )
-        
-        # Return the results in a clean dictionary format (content + metadata)
+        vector = self.query_vectors.get(query)
+        if vector is None:
+            vector = self.embeddings.embed_query(query)
+            self.query_vectors.put(query, vector)
+        return vector
+
+    # Metadata index of the current store (built on first filtered query after each change)
+    def metadata_index(self) -> MetadataIndex:
+        if self._metadata is None or self._metadata_version != self.index_version:
+            self._metadata = MetadataIndex.from_vectorstore(self.vectorstore)
+            self._metadata_version = self.index_version
+        return self._metadata
+
+    # One uncached search: embedding lookup/encode + FAISS search
+    def _search(self, question: str, filter: Optional[Mapping[str, Any]] = None, k: int = 4):
+        # Perform a similarity search on the vectorstore (embedding + FAISS search are timed together)
+        with IO_LATENCY.time("faiss_search"):
+            return self._search_by_vector(self._query_vector(question), filter, k)
+
+    # Top-k chunks for a query vector, optionally restricted by a metadata filter
+    def _search_by_vector(self, vector, filter: Optional[Mapping[str, Any]] = None, k: int = 4):
+        store = self.vectorstore
+        if not filter:
+            # Unfiltered: plain top-k, no over-fetching or per-document callbacks (and no metadata index)
+            docs = store.similarity_search_by_vector(vector, k=k)
+        else:
+            # Filtered: FAISS only ever scores the selected chunks
+            selected = self.metadata_index().select(filter)
+            _, positions = search_subset(store.index, np.asarray(vector, dtype="float32"), k, selected)
+            docs = [store.docstore.search(store.index_to_docstore_id[int(p)]) for p in positions]
         return [{
             "content": doc.page_content,
             "metadata": doc.metadata
-        } for doc in results]
+        } for doc in docs]
+
+    # Hit rates of the query caches and how many queries were coalesced
+    def cache_stats(self):
+        return {
+            "query_vectors": self.query_vectors.stats(),
+            "query_results": self.query_results.stats(),
+            "coalesced": self._inflight.coalesced,
+            "index_version": self.index_version,
+        }
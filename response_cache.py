@@ -0,0 +1,81 @@
+# OrderedDict gives O(1) LRU bookkeeping
+from collections import OrderedDict
+# Type hints for better readability
+from typing import Any, Dict, Hashable, Optional, Tuple
+# Thread safety + configuration from the environment
+import os
+import re
+import threading
+
+# Maximum number of memoized answers (set MCP_RESPONSE_CACHE_SIZE=0 to disable memoization)
+RESPONSE_CACHE_SIZE = int(os.getenv("MCP_RESPONSE_CACHE_SIZE", "4096"))
+
+_WHITESPACE = re.compile(r"\s+")
+
+# Helper: case/whitespace-insensitive form of a message ("Can I  take Ibuprofen?" == "can i take ibuprofen?")
+def normalize_message(message: str) -> str:
+    return _WHITESPACE.sub(" ", message).strip().lower()
+
+# Bounded LRU memo of deterministic ToolAgent answers.
+# Keys combine the normalized message, its keyword-match signature, the knowledge-table fingerprint and
+# the retrieval index version, so editing the keyword table or reloading/extending the index can never
+# serve an answer computed from the old table or the old chunks
+class ResponseCache:
+    def __init__(self, max_entries: int = RESPONSE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.version = 0  # Bumped by invalidate(); part of every key
+        # Counters reported by stats()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Build the cache key for a message
+    def key(self, message: str, signature: Tuple[str, ...], fingerprint: Hashable, index_version: int = 0) -> Tuple:
+        return (normalize_message(message), signature, fingerprint, index_version, self.version)
+
+    # Return a copy of the memoized answer, or None
+    def get(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        if not self.max_entries:
+            return None
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+        # Callers may add to the metadata, so never hand out the cached dicts themselves
+        return {**value, "evaluation_metadata": dict(value["evaluation_metadata"])}
+
+    # Memoize an answer, evicting the least recently used ones beyond max_entries
+    def put(self, key: Hashable, value: Dict[str, Any]) -> None:
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._entries[key] = {**value, "evaluation_metadata": dict(value["evaluation_metadata"])}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    # Forget every memoized answer (call after changing ToolAgent's answers or the knowledge table)
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.version += 1
+
+    # Counters and gauges for monitoring
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "version": self.version,
+            }
@@ -0,0 +1,162 @@
+# OrderedDict gives O(1) LRU bookkeeping (move_to_end / popitem(last=False))
+from collections import OrderedDict, deque
+# Type hints for better readability
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+# Thread safety (handles are used from the event loop and the I/O pool) + TTL clock
+import os
+import threading
+import time
+
+# Defaults, overridable through environment variables
+CACHE_MAX_SESSIONS = int(os.getenv("MCP_SESSION_CACHE_SESSIONS", "10000"))
+CACHE_MAX_BYTES = int(os.getenv("MCP_SESSION_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))  # 64MB
+CACHE_TTL = float(os.getenv("MCP_SESSION_CACHE_TTL", "900"))  # Seconds a session may stay idle
+
+# Rough per-message overhead (object headers, dict, metadata) on top of the content length
+MESSAGE_OVERHEAD_BYTES = 256
+
+# Helper: approximate the memory held by one cached message
+def _message_size(message) -> int:
+    content = message.content
+    return MESSAGE_OVERHEAD_BYTES + (len(content) if isinstance(content, str) else len(str(content)))
+
+# One cached session: latest summary checkpoint + the recent messages stored after it
+class CachedSession:
+    __slots__ = ("summary", "messages", "nbytes", "expires_at")
+
+    def __init__(self, summary, messages, window: int, expires_at: float):
+        self.summary = summary
+        self.messages = deque(messages, maxlen=window)
+        self.nbytes = 0
+        self.expires_at = expires_at
+        self.recount()
+
+    # Recompute the memory estimate (after trimming or replacing messages)
+    def recount(self) -> None:
+        total = _message_size(self.summary) if self.summary is not None else 0
+        self.nbytes = total + sum(_message_size(m) for m in self.messages)
+
+# In-process LRU cache of session windows with a TTL, a session cap and a memory ceiling
+class SessionCache:
+    def __init__(self, window: int, max_sessions: int = CACHE_MAX_SESSIONS,
+                 max_bytes: int = CACHE_MAX_BYTES, ttl: float = CACHE_TTL):
+        self.window = window
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, CachedSession]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # Sessions currently being loaded from SQLite → True once a write raced with the load
+        self._loading: Dict[Hashable, bool] = {}
+        # Counters reported by stats()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    # Return (summary, messages) for a cached session, or None on a miss/expired entry
+    def get(self, key: Hashable, window: int) -> Optional[Tuple[Any, List[Any]]]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= now:
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            # A request for a larger window than we keep can't be served from memory
+            if entry is None or window > self.window:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry.expires_at = now + self.ttl
+            self._entries.move_to_end(key)
+            messages = list(entry.messages)
+            return entry.summary, messages[-window:] if window else []
+
+    # Call before reading a missed session from the backing store (pairs with put)
+    def begin_load(self, key: Hashable) -> None:
+        with self._lock:
+            self._loading[key] = False
+
+    # Cache the context just loaded from the backing store
+    def put(self, key: Hashable, summary, messages: List[Any]) -> None:
+        with self._lock:
+            # A write landed while we were reading: the loaded window may be stale, don't cache it
+            if self._loading.pop(key, False):
+                return
+            self._remove(key)
+            entry = CachedSession(summary, messages, self.window, time.monotonic() + self.ttl)
+            self._entries[key] = entry
+            self._bytes += entry.nbytes
+            self._evict()
+
+    # Write-through: append newly persisted messages to a cached session (ignored if not cached)
+    def append(self, key: Hashable, messages: List[Any]) -> None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._mark_dirty(key)
+                return
+            self._bytes -= entry.nbytes
+            entry.messages.extend(messages)
+            entry.recount()
+            self._bytes += entry.nbytes
+            self._entries.move_to_end(key)
+            self._evict()
+
+    # Write-through: a new summary checkpoint starts an empty window after it
+    def checkpoint(self, key: Hashable, summary) -> None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._mark_dirty(key)
+                return
+            self._bytes -= entry.nbytes
+            entry.summary = summary
+            entry.messages.clear()
+            entry.recount()
+            self._bytes += entry.nbytes
+
+    # Drop one session (e.g. after it was cleared in the database)
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._mark_dirty(key)
+            self._remove(key)
+
+    # Drop everything
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    # Counters and gauges for monitoring
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "sessions": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def _mark_dirty(self, key: Hashable) -> None:
+        if key in self._loading:
+            self._loading[key] = True
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.nbytes
+
+    # Evict least recently used sessions until both the session cap and the memory ceiling hold
+    def _evict(self) -> None:
+        while self._entries and (len(self._entries) > self.max_sessions or self._bytes > self.max_bytes):
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.nbytes
+            self.evictions += 1
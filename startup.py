@@ -0,0 +1,162 @@
+# Startup bookkeeping (phase timings, readiness), warmup, and the preforked production server.
+# Only stdlib imports at module level: every other module may import this one cheaply
+from contextlib import contextmanager
+from typing import Any, Dict, List
+import gc
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+
+# uvicorn configures this logger, so startup messages show up next to the server's own
+logger = logging.getLogger("uvicorn.error")
+
+# Set MCP_WARMUP=0 to report ready immediately (e.g. tests and local development without an index)
+WARMUP_ENABLED = os.getenv("MCP_WARMUP", "1") != "0"
+# Questions run through retrieval during warmup (loads the model, faults in the index, fills the caches)
+WARMUP_QUESTIONS = ["I have fever and headache", "Can I take ibuprofen?", "What about paracetamol?"]
+
+# Seconds spent in each startup phase, in the order they ran (served on /health)
+PHASES: Dict[str, float] = {}
+_IMPORTED_AT = time.perf_counter()
+_ready = threading.Event()
+
+# Time a startup phase (a phase that runs twice keeps its total)
+@contextmanager
+def phase(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        PHASES[name] = round(PHASES.get(name, 0.0) + time.perf_counter() - start, 4)
+
+# Record the time elapsed since this module was imported (the first import of the server process)
+def mark(name: str) -> None:
+    PHASES[name] = round(time.perf_counter() - _IMPORTED_AT, 4)
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+def mark_ready() -> None:
+    if not _ready.is_set():
+        mark("ready")
+        _ready.set()
+
+# Load everything a first request would otherwise pay for: embedding model, FAISS index (+ metadata index),
+# and one graph run. Runs in the calling thread and never touches the I/O or retrieval pools, so a
+# preforking parent has no pool threads (which don't survive fork) when it forks
+def warmup() -> None:
+    if WARMUP_ENABLED:
+        import multi_agent_graph
+        from langchain_core.messages import HumanMessage
+
+        with phase("warmup"):
+            multi_agent_graph.retriever.warm(WARMUP_QUESTIONS)
+            # "general" messages skip retrieval, so this run stays on the calling thread
+            multi_agent_graph.graph.invoke({"messages": [HumanMessage(content="hello")], "memory": None, "response": ""})
+    mark_ready()
+
+# Warm up in a background thread (single-process serving: the server accepts requests, /health says
+# "starting" until the warmup is done)
+def warmup_in_background() -> threading.Thread:
+    thread = threading.Thread(target=_warmup_logged, name="mcp-warmup", daemon=True)
+    thread.start()
+    return thread
+
+def _warmup_logged() -> None:
+    try:
+        warmup()
+        logger.info("Warmup done: %s", PHASES)
+    except Exception:
+        logger.exception("Warmup failed, serving cold")
+        mark_ready()
+
+# Helper: a listening socket the workers share (the kernel spreads connections across them)
+def _listen(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+# Production serving: warm up once in this process, then fork `workers` uvicorn servers that share the
+# loaded model, index and graph copy-on-write and accept on one shared socket. Crashed workers are
+# re-forked from the warm parent; SIGINT/SIGTERM are forwarded to the workers for a graceful shutdown
+def serve(app: Any, host: str = "0.0.0.0", port: int = 8000, workers: int = 2, log_level: str = "info") -> None:
+    import uvicorn
+    import history_store
+
+    # Worker processes × intra-op threads would oversubscribe the CPUs (and OpenMP pools don't survive
+    # fork): one math thread per worker unless configured otherwise. Must happen before torch/faiss load
+    if workers > 1:
+        os.environ.setdefault("OMP_NUM_THREADS", "1")
+        os.environ.setdefault("MKL_NUM_THREADS", "1")
+
+    config = uvicorn.Config(app, host=host, port=port, log_level=log_level)
+    config.load()
+    warmup()
+    sock = _listen(host, port)
+
+    if workers <= 1:
+        uvicorn.Server(config).run(sockets=[sock])
+        return
+
+    # Each worker would get its own copy of the session cache, and a window cached in one worker misses
+    # the turns another worker stored for the same session: with several workers every context is read
+    # from SQLite (the shared source of truth)
+    if history_store.store.cache is not None:
+        history_store.store.cache = None
+        logger.info("Session cache disabled: %d workers share the chat history", workers)
+
+    # Move everything loaded so far out of the collector's reach, so GC passes in the workers
+    # don't write to (and thereby copy) the shared pages
+    gc.collect()
+    gc.freeze()
+
+    def spawn() -> int:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            # Threads and pooled connections don't survive fork
+            history_store.store.after_fork()
+            try:
+                uvicorn.Server(config).run(sockets=[sock])
+            finally:
+                os._exit(0)
+        return pid
+
+    with phase("fork"):
+        children: List[int] = [spawn() for _ in range(workers)]
+    logger.info("Serving on %s:%d with %d workers (startup %s)", host, port, workers, PHASES)
+
+    stopping = False
+
+    def stop(signum, _frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        if pid in children:
+            children.remove(pid)
+            if not stopping:
+                logger.warning("Worker %d exited (status %d), starting a new one", pid, status)
+                children.append(spawn())
+    sock.close()